@@ -4,19 +4,13 @@ import asyncio
 from dotenv import load_dotenv
 
 from data import Database
+from migrations import bootstrap
 from chatbot import ChatBot
+from log_setup import setup_logging
 
-# Thiết lập logging
+# Thiết lập logging: ghi file ở luồng nền như chatbot_api (xem log_setup.py)
 logger = logging.getLogger('chatbot')
-logger.setLevel(logging.INFO)
-
-file_handler = logging.FileHandler('chatbot.log', encoding='utf-8')
-file_handler.setLevel(logging.INFO)
-
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
+setup_logging('chatbot.log')
 load_dotenv()
 
 async def main():
@@ -31,9 +25,11 @@ async def main():
         
         # Khởi tạo kết nối database
         db = Database(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME)
+        bootstrap(db, apply=os.getenv("DB_AUTO_MIGRATE", "0") == "1")
         
         # Khởi tạo chatbot
         chatbot = ChatBot(db)
+        chatbot.load_models()
         
         print("Chatbot đã sẵn sàng.")
         logger.info("Chatbot đã khởi động và sẵn sàng phục vụ")
@@ -0,0 +1,82 @@
+"""
+Đo thời gian import các module của ứng dụng bằng python -X importtime, mỗi lần trong một tiến trình mới.
+
+In tổng thời gian import của từng module gốc, các module của ứng dụng và các gói nặng nhất
+(theo thời gian cộng dồn), để kiểm tra import không kéo theo google.generativeai, mysql.connector
+hay kết nối database.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --modules chatbot_api --top 15 --runs 5
+"""
+import os
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+# Các gói chỉ được nạp khi dùng tới; xuất hiện khi import nghĩa là còn import sớm
+LAZY_PACKAGES = ("google.generativeai", "mysql.connector")
+
+
+def app_modules():
+    return sorted(name[:-3] for name in os.listdir(ROOT) if name.endswith(".py"))
+
+
+def import_times(module: str):
+    """
+    Chạy python -X importtime -c "import module", trả về {tên module: (self µs, cộng dồn µs, cấp)}
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            depth = len(match.group(3)) // 2
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="*", default=["chatbot_api", "chatbot", "data"])
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=3, help="số lần đo, lấy trung vị")
+    args = parser.parse_args()
+    own = set(app_modules())
+
+    for module in args.modules:
+        try:
+            runs = [import_times(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"\nimport {module}: lỗi ({e})")
+            continue
+        total = statistics.median(run[module][1] for run in runs) / 1000
+        times = runs[-1]
+        print(f"\nimport {module}: {total:.1f} ms (trung vị {args.runs} lần)")
+
+        print(f"  {'module của ứng dụng':<32}{'riêng (ms)':>12}{'cộng dồn (ms)':>15}")
+        for name, (self_us, cumulative_us, _) in sorted(times.items(), key=lambda item: -item[1][1]):
+            if name in own:
+                print(f"  {name:<32}{self_us / 1000:>12.1f}{cumulative_us / 1000:>15.1f}")
+
+        print(f"  {'gói ngoài nặng nhất':<32}{'riêng (ms)':>12}{'cộng dồn (ms)':>15}")
+        top_level = [(name, t) for name, t in times.items() if name not in own and "." not in name]
+        for name, (self_us, cumulative_us, _) in sorted(top_level, key=lambda item: -item[1][1])[:args.top]:
+            print(f"  {name:<32}{self_us / 1000:>12.1f}{cumulative_us / 1000:>15.1f}")
+
+        eager = [name for name in LAZY_PACKAGES if name in times]
+        print(f"  nạp sớm: {', '.join(eager)}" if eager else "  không nạp sớm google.generativeai, mysql.connector")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+So sánh chi phí ghi log trên event loop: FileHandler đồng bộ (như logging.basicConfig trước đây)
+với hàng đợi + luồng nền của log_setup (kèm cắt bớt thông điệp dài).
+
+Mỗi "request" giả lập ghi vài dòng log ngắn và một dòng chứa toàn bộ câu trả lời
+(danh sách sản phẩm dài vài chục KB), đo thời gian các lệnh log chiếm trên event loop.
+
+    python benchmarks/bench_logging.py --requests 2000 --response-kb 30
+"""
+import os
+import sys
+import time
+import queue
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+import logging.handlers
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_setup import TEXT_FORMAT, DroppingQueueHandler, RequestIdFilter, TruncateFilter, request_id_var  # noqa: E402
+
+
+def sync_logger(path: str) -> logging.Logger:
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger = logging.getLogger("bench.sync")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def queued_logger(path: str, max_message: int):
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    queue_handler = DroppingQueueHandler(queue.Queue(100000))
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(TruncateFilter(max_message))
+    listener = logging.handlers.QueueListener(queue_handler.queue, handler)
+    listener.start()
+    logger = logging.getLogger(f"bench.queued.{max_message}")
+    logger.propagate = False
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    return logger, listener
+
+
+async def simulate(logger: logging.Logger, requests: int, response: str, concurrency: int, io_ms: float):
+    samples = []
+
+    async def one(i: int):
+        request_id_var.set(f"req-{i}")
+        start = time.perf_counter()
+        logger.info(f"Nhận được tin nhắn: giày nike dưới 2 triệu #{i}")
+        logger.info("Router cục bộ: price_filter (0.812), chênh lệch: 0.301")
+        logger.info(f"Trả lời: {response}")
+        samples.append((time.perf_counter() - start) * 1000)
+        # Thời gian request chờ database/Gemini, event loop rảnh để luồng ghi log chạy
+        await asyncio.sleep(io_ms / 1000)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int):
+        async with semaphore:
+            await one(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(requests)))
+    return samples, time.perf_counter() - start
+
+
+def report(name: str, samples, elapsed: float):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<28}{statistics.median(samples):>10.3f}{p99:>10.3f}{elapsed * 1000:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--response-kb", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--max-message", type=int, default=2000)
+    parser.add_argument("--io-ms", type=float, default=5.0, help="thời gian chờ I/O giả lập của mỗi request")
+    args = parser.parse_args()
+
+    card = "Tên: Giày chạy bộ Nike Air Zoom Pegasus\nGiá: 2,890,000 VND\nMô tả: Êm ái, nhẹ, thoáng khí.\n\n"
+    response = card * (args.response_kb * 1024 // len(card.encode("utf-8")) + 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.requests} request, câu trả lời ~{len(response.encode('utf-8')) // 1024} KB")
+        print(f"{'cách ghi log':<28}{'p50 (ms)':>10}{'p99 (ms)':>10}{'tổng (ms)':>12}")
+
+        logger = sync_logger(os.path.join(tmp, "sync.log"))
+        report("FileHandler đồng bộ", *asyncio.run(simulate(logger, args.requests, response, args.concurrency, args.io_ms)))
+
+        logger, listener = queued_logger(os.path.join(tmp, "queued.log"), 0)
+        report("hàng đợi, không cắt", *asyncio.run(simulate(logger, args.requests, response, args.concurrency, args.io_ms)))
+        listener.stop()
+
+        logger, listener = queued_logger(os.path.join(tmp, "queued_truncated.log"), args.max_message)
+        report(f"hàng đợi, cắt {args.max_message} ký tự",
+               *asyncio.run(simulate(logger, args.requests, response, args.concurrency, args.io_ms)))
+        listener.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+So sánh tìm kiếm bằng chỉ mục đảo ngược (search_index) với đường SQL LIKE hiện tại.
+
+Đường SQL chạy đúng các truy vấn AND rồi OR của Database.search_products trên SQLite trong bộ nhớ
+(thay cho MySQL để chạy được không cần máy chủ).
+
+    python benchmarks/bench_search.py --sizes 10000 100000
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex  # noqa: E402
+from benchmarks.synthetic import generate_catalog  # noqa: E402
+
+QUERIES = [
+    "nike air max",
+    "chạy bộ",
+    "vans old skool",
+    "giày da lộn",
+    "converse chuck taylor trắng",
+    "ultraboost",
+    "bóng rổ cổ cao",
+    "xyz không tồn tại",
+]
+
+
+def sql_search(connection: sqlite3.Connection, keyword: str):
+    # Giống Database.search_products: AND trên name, nếu rỗng thì OR trên name/description
+    words = keyword.split()
+    conditions = " AND ".join("name LIKE ?" for _ in words)
+    rows = connection.execute(f"SELECT * FROM products WHERE {conditions}", [f"%{w}%" for w in words]).fetchall()
+    if not rows:
+        or_conditions = " OR ".join("name LIKE ? OR description LIKE ?" for _ in words)
+        params = [p for w in words for p in (f"%{w}%", f"%{w}%")]
+        rows = connection.execute(f"SELECT * FROM products WHERE {or_conditions}", params).fetchall()
+    return rows
+
+
+def timed(func, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def run(size: int, repeat: int):
+    products = generate_catalog(size)
+
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price INTEGER, sale TEXT, brand_id INTEGER,"
+        " brand TEXT, description TEXT, specification TEXT, image TEXT)"
+    )
+    connection.executemany(
+        "INSERT INTO products VALUES (:id, :name, :price, :sale, :brand_id, :brand, :description, :specification, :image)",
+        products,
+    )
+
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.sync(products)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    changed = [dict(p, name=p["name"] + " v2") if p["id"] % 100 == 0 else p for p in products]
+    start = time.perf_counter()
+    index.sync(changed)
+    resync_ms = (time.perf_counter() - start) * 1000
+
+    print(f"\n== {size:,} sản phẩm ==")
+    print(f"Xây chỉ mục: {build_ms:.0f} ms, đồng bộ lại 1% thay đổi: {resync_ms:.0f} ms")
+    print(f"{'truy vấn':<30}{'SQL (ms)':>12}{'chỉ mục (ms)':>15}{'tăng tốc':>10}")
+    for query in QUERIES:
+        sql_ms = timed(lambda: sql_search(connection, query), repeat)
+        index_ms = timed(lambda: index.search(query), repeat)
+        speedup = sql_ms / index_ms if index_ms else float("inf")
+        print(f"{query:<30}{sql_ms:>12.2f}{index_ms:>15.2f}{speedup:>9.1f}x")
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeat)
@@ -0,0 +1,138 @@
+"""
+So sánh độ trễ đầu-cuối của ChatBot.handle_query giữa cách lập kế hoạch tuần tự (phân loại -> trích xuất
+tham số -> truy vấn database) và cách chạy trước (SPECULATIVE_PLANNING): tra từ điển thương hiệu,
+khớp tên sản phẩm và lấy trước trang đầu của danh sách song song với lượt gọi Gemini phân loại.
+
+Gemini được thay bằng FakeGenerativeModel, MySQL bằng SQLiteDatabase có độ trễ giả lập mỗi truy vấn
+(benchmarks/fakes.py). Router cục bộ và cache câu hỏi bị tắt để mọi câu hỏi đều phải chờ Gemini phân loại;
+cả hai chế độ chạy cùng một danh sách câu hỏi. Mỗi lượt đo dùng một ChatBot mới, chạy --warmup câu hỏi
+không tính giờ trước, và thứ tự hai chế độ đảo lại sau mỗi vòng (--rounds) để chế độ chạy trước
+không phải gánh phần khởi động.
+
+    python benchmarks/bench_speculation.py --requests 200 --llm-latency 0.3 --db-latency 0.005
+    python benchmarks/bench_speculation.py --catalog-cache --classifier-mode single_call
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import statistics
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import BRANDS, MODELS, USES, generate_catalog  # noqa: E402
+from benchmarks.load_test import WORKLOAD, percentile  # noqa: E402
+
+SCENARIOS = ["price_filter", "brand_filter", "search_products", "product_info"]
+
+
+def make_jobs(args, products, count: int, seed: int):
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(count):
+        scenario = rng.choice(SCENARIOS)
+        template = rng.choice(WORKLOAD[scenario])
+        jobs.append((scenario, template.format(
+            price=rng.randrange(300, 3000), brand=rng.choice(BRANDS), use=rng.choice(USES),
+            model=rng.choice(MODELS), product=rng.choice(products)["name"].lower(),
+        )))
+    return jobs
+
+
+async def run_mode(bot, jobs, speculative: bool, concurrency: int, warmup_jobs=()):
+    bot.speculative = speculative
+    for _, message in warmup_jobs:
+        await bot.handle_query(message)
+    latencies = defaultdict(list)
+    semaphore = asyncio.Semaphore(concurrency)
+    llm_before = bot.model.calls
+
+    async def one(scenario: str, message: str):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.handle_query(message)
+            latencies[scenario].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(scenario, message) for scenario, message in jobs))
+    return latencies, time.perf_counter() - started, (bot.model.calls - llm_before) / len(jobs)
+
+
+async def main(args):
+    # Cảnh báo "không tìm thấy sản phẩm" của từng câu hỏi làm rối bảng kết quả
+    logging.getLogger('chatbot').addHandler(logging.NullHandler())
+    # Dùng chế độ phân loại của benchmark, không phụ thuộc biến môi trường của máy chạy
+    os.environ["PRICE_RULES"] = "0" if args.no_price_rules else "1"
+    os.environ["CATALOG_CACHE_TTL"] = "300" if args.catalog_cache else "0"
+
+    import google.generativeai as genai
+    from benchmarks.fakes import FakeGenerativeModel, SQLiteDatabase
+
+    model = FakeGenerativeModel(latency=args.llm_latency, jitter=0.0, seed=args.seed)
+    genai.GenerativeModel = lambda *a, **kw: model
+    import chatbot
+
+    products = generate_catalog(args.catalog_size, seed=args.seed)
+    db = SQLiteDatabase(products, latency=args.db_latency)
+    if args.catalog_cache:
+        db.enable_catalog_cache(300)
+        db.warm_up()
+    jobs = make_jobs(args, products, args.requests, args.seed)
+    # Câu hỏi khởi động khác câu hỏi đo để không có gì được tính sẵn cho lượt đo
+    warmup_jobs = make_jobs(args, products, args.warmup, args.seed + 1)
+
+    print(f"{args.requests} câu hỏi x {args.rounds} vòng, đồng thời {args.concurrency}, "
+          f"LLM {args.llm_latency * 1000:.0f} ms, database {args.db_latency * 1000:.1f} ms/truy vấn, "
+          f"phân loại: {args.classifier_mode}, cache danh mục: {'bật' if args.catalog_cache else 'tắt'}, "
+          f"khởi động {args.warmup} câu hỏi mỗi lượt")
+    modes = [("tuần tự", False), ("chạy trước", True)]
+    results = {name: (defaultdict(list), []) for name, _ in modes}
+    for round_index in range(args.rounds):
+        for name, speculative in (modes if round_index % 2 == 0 else modes[::-1]):
+            bot = chatbot.ChatBot(db, classifier_mode=args.classifier_mode, use_local_router=False,
+                                  use_query_cache=False)
+            latencies, elapsed, llm_per_request = await run_mode(bot, jobs, speculative, args.concurrency, warmup_jobs)
+            for scenario, samples in latencies.items():
+                results[name][0][scenario].extend(samples)
+            results[name][1].append((elapsed, llm_per_request))
+
+    print(f"{'chế độ':<12}{'kịch bản':<18}{'p50 (ms)':>11}{'p95 (ms)':>11}{'trung bình':>12}")
+    summary = {}
+    for name, _ in modes:
+        latencies, runs = results[name]
+        everything = []
+        for scenario in SCENARIOS:
+            samples = latencies.get(scenario)
+            if not samples:
+                continue
+            everything.extend(samples)
+            print(f"{name:<12}{scenario:<18}{percentile(samples, 0.5):>11.1f}{percentile(samples, 0.95):>11.1f}"
+                  f"{statistics.mean(samples):>12.1f}")
+        elapsed = statistics.mean(run[0] for run in runs)
+        llm_per_request = statistics.mean(run[1] for run in runs)
+        print(f"{name:<12}{'tổng':<18}{percentile(everything, 0.5):>11.1f}{percentile(everything, 0.95):>11.1f}"
+              f"{statistics.mean(everything):>12.1f}   LLM/req {llm_per_request:.2f}, {elapsed:.2f}s/vòng")
+        summary[name] = statistics.mean(everything)
+    saved = summary["tuần tự"] - summary["chạy trước"]
+    print(f"Chạy trước giảm trung bình {saved:.1f} ms/câu hỏi ({saved / summary['tuần tự']:.0%})")
+    db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=2, help="số vòng đo, thứ tự hai chế độ đảo lại mỗi vòng")
+    parser.add_argument("--warmup", type=int, default=10, help="số câu hỏi khởi động (không tính giờ) mỗi lượt đo")
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="độ trễ mỗi lượt gọi LLM (giây)")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="độ trễ mỗi truy vấn database (giây)")
+    parser.add_argument("--classifier-mode", choices=["per_scenario", "single_call"], default="single_call")
+    parser.add_argument("--catalog-cache", action="store_true", help="bật cache danh mục trong bộ nhớ")
+    parser.add_argument("--no-price-rules", action="store_true", help="tắt luật giá để câu hỏi giá cũng chờ Gemini")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
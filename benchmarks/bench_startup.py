@@ -0,0 +1,102 @@
+"""
+Đo thời gian khởi động nguội và bộ nhớ của từng worker API, có và không có cache dùng chung.
+
+Mỗi worker là một tiến trình riêng (như uvicorn --workers): import chatbot_api, khởi tạo
+Database/ChatBot (init_resources) rồi nạp trước danh mục (warm_up). Gemini được thay bằng
+FakeGenerativeModel, MySQL bằng một file SQLite nạp danh mục giả lập (benchmarks/fakes.py).
+Các worker khởi động lần lượt; với SHARED_CACHE=file, worker sau lấy danh mục từ kho dùng chung
+thay vì tải lại từ database.
+
+    python benchmarks/bench_startup.py --workers 4 --catalog-size 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def rss_mb() -> float:
+    """
+    Bộ nhớ thường trú hiện tại của tiến trình (MB)
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss là KB trên Linux, byte trên macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1 << 20) if sys.platform == "darwin" else usage / 1024
+
+
+def run_worker(db_path: str) -> None:
+    started = time.perf_counter()
+    import google.generativeai as genai
+    from benchmarks.fakes import FakeGenerativeModel, SQLiteDatabase
+
+    genai.GenerativeModel = FakeGenerativeModel
+    import chatbot_api
+    imported = time.perf_counter()
+
+    chatbot_api.init_resources(SQLiteDatabase(path=db_path))
+    initialized = time.perf_counter()
+
+    products = chatbot_api.db.warm_up()
+    warmed = time.perf_counter()
+    print(json.dumps({
+        'import_ms': (imported - started) * 1000,
+        'init_ms': (initialized - imported) * 1000,
+        'warm_up_ms': (warmed - initialized) * 1000,
+        'total_ms': (warmed - started) * 1000,
+        'rss_mb': rss_mb(),
+        'products': products,
+        'shared_loads': chatbot_api.db.catalog.stats()['shared_loads'],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--catalog-size", type=int, default=20000)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker)
+        return
+
+    from benchmarks.synthetic import generate_catalog
+    from benchmarks.fakes import SQLiteDatabase
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "catalog.sqlite")
+        SQLiteDatabase(generate_catalog(args.catalog_size), path=db_path).close()
+
+        print(f"{args.workers} worker, danh mục {args.catalog_size:,} sản phẩm")
+        print(f"{'cache':<10}{'worker':>7}{'import (ms)':>13}{'init (ms)':>11}{'warm-up (ms)':>14}"
+              f"{'tổng (ms)':>11}{'RSS (MB)':>10}{'từ kho chung':>14}")
+        for mode in ("", "file"):
+            env = dict(os.environ, CATALOG_CACHE_TTL="300", SHARED_CACHE=mode,
+                       SHARED_CACHE_DIR=os.path.join(tmp, "shared"), STARTUP_WARMUP="0")
+            for worker in range(args.workers):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", db_path],
+                    cwd=tmp, env=env, capture_output=True, text=True, check=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{mode or 'không':<10}{worker + 1:>7}{result['import_ms']:>13.0f}{result['init_ms']:>11.0f}"
+                      f"{result['warm_up_ms']:>14.0f}{result['total_ms']:>11.0f}{result['rss_mb']:>10.1f}"
+                      f"{'có' if result['shared_loads'] else 'không':>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Thay thế Gemini và MySQL để đo hiệu năng không cần mạng hay máy chủ database:
+
+- FakeGenerativeModel: cùng giao diện genai.GenerativeModel mà ChatBot dùng, trả lời tất định
+  theo nội dung prompt, có độ trễ và tỉ lệ lỗi cấu hình được
+- SQLiteDatabase: lớp con của Database chạy trên SQLite trong bộ nhớ, nạp danh mục giả lập
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import Database  # noqa: E402
+from text_utils import fold_diacritics  # noqa: E402
+from benchmarks.synthetic import BRANDS  # noqa: E402
+
+
+class ServiceUnavailable(Exception):
+    """
+    Lỗi giả lập, trùng tên lớp lỗi 503 của google.api_core để được thử lại như lỗi thật
+    """
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt: str):
+        self.text = text
+        # Ước lượng token thô: khoảng 4 ký tự một token
+        self.usage_metadata = _Usage(len(prompt) // 4 + 1, len(text) // 4 + 1)
+
+
+class FakeStreamResponse(FakeResponse):
+    def __init__(self, text: str, prompt: str, chunk_delay: float):
+        super().__init__(text, prompt)
+        self._chunk_delay = chunk_delay
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        words = self.text.split(" ")
+        for i in range(0, len(words), 4):
+            await asyncio.sleep(self._chunk_delay)
+            yield FakeResponse(" ".join(words[i:i + 4]) + " ", "")
+
+
+class FakeChat:
+    def __init__(self, model: "FakeGenerativeModel", history: Optional[List[Any]] = None):
+        self.model = model
+        self.history = list(history or [])
+
+    async def send_message_async(self, content: str, stream: bool = False):
+        await self.model._simulate()
+        text = ("Chào bạn! Cửa hàng có nhiều mẫu giày Nike, Adidas, Puma, Converse và Vans. "
+                "Bạn đang tìm giày để chạy bộ, đi chơi hay tập luyện?")
+        prompt = " ".join(str(item) for item in self.history) + content
+        self.history += [content, text]
+        if stream:
+            return FakeStreamResponse(text, prompt, self.model.latency / 20)
+        return FakeResponse(text, prompt)
+
+
+class FakeGenerativeModel:
+    """
+    Gemini giả lập: nhận diện loại prompt của ChatBot và trả lời tất định.
+    latency/jitter tính bằng giây, failure_rate là xác suất ném ServiceUnavailable
+    """
+
+    def __init__(self, model_name: str = "fake", system_instruction: Optional[str] = None,
+                 latency: float = 0.3, jitter: float = 0.1, failure_rate: float = 0.0, seed: int = 0, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def _next_delay(self) -> float:
+        with self._lock:
+            self.calls += 1
+            if self._rng.random() < self.failure_rate:
+                self.failures += 1
+                return -1.0
+            return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    async def _simulate(self) -> None:
+        delay = self._next_delay()
+        if delay < 0:
+            await asyncio.sleep(self.latency / 2)
+            raise ServiceUnavailable("Gemini giả lập: 503")
+        await asyncio.sleep(delay)
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> FakeResponse:
+        await self._simulate()
+        return FakeResponse(self.answer(prompt), prompt)
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        delay = self._next_delay()
+        time.sleep(abs(delay))
+        if delay < 0:
+            raise ServiceUnavailable("Gemini giả lập: 503")
+        return FakeResponse(self.answer(prompt), prompt)
+
+    def start_chat(self, history: Optional[List[Any]] = None) -> FakeChat:
+        return FakeChat(self, history)
+
+    # Nhận diện ý định thô theo từ khóa, đủ để các nhánh của ChatBot được chạy như thật
+    @staticmethod
+    def _intent(query: str) -> Dict[str, Any]:
+        lowered = query.lower()
+        brand = next((b for b in BRANDS if b.lower() in lowered), None)
+        price = re.search(r"\d+", lowered.replace(",", "").replace(".", ""))
+        if "giá" in lowered or "dưới" in lowered or "triệu" in lowered:
+            return {"scenario": "price_filter", "price": int(price.group()) if price else None}
+        if "thông tin" in lowered or "chi tiết" in lowered:
+            return {"scenario": "product_info", "product_name": re.sub(r".*(sản phẩm|về)\s+", "", lowered)}
+        if "thương hiệu" in lowered or "hãng" in lowered:
+            return {"scenario": "brand_filter", "brand": brand}
+        if "tìm" in lowered or "giày" in lowered:
+            return {"scenario": "search_products", "keyword": re.sub(r".*(tìm|kiếm)\s+", "", lowered)}
+        return {"scenario": None}
+
+    @staticmethod
+    def _quoted(prompt: str, label: str) -> str:
+        match = re.search(label + r'\s*"([^"]*)"', prompt)
+        return match.group(1) if match else ""
+
+    def _classification(self, query: str, scenarios: List[str]) -> Dict[str, Any]:
+        intent = self._intent(query)
+        scores = {name: (0.9 if name == intent["scenario"] else 0.1) for name in scenarios}
+        slots = {key: intent.get(key) for key in ("price", "brand", "keyword", "product_name")}
+        return {"scores": scores, "slots": slots}
+
+    def answer(self, prompt: str) -> str:
+        scenarios = re.findall(r'-\s*"(\w+)":', prompt)
+        if "Các câu hỏi:" in prompt:
+            queries = re.findall(r'^\s*\d+\.\s*"([^"]*)"', prompt, re.MULTILINE)
+            return json.dumps([self._classification(q, scenarios) for q in queries], ensure_ascii=False)
+        if "Câu hỏi:" in prompt and scenarios:
+            return json.dumps(self._classification(self._quoted(prompt, "Câu hỏi:"), scenarios), ensure_ascii=False)
+        if "Câu 1:" in prompt:
+            query, template = self._quoted(prompt, "Câu 1:"), self._quoted(prompt, "Câu 2:")
+            intent = self._intent(query)["scenario"]
+            expected = {"price_filter": "giá", "brand_filter": "thương hiệu",
+                        "search_products": "sản phẩm  X", "product_info": "Thông tin"}.get(intent)
+            return "0.9" if expected and expected in template else "0.1"
+        query = self._quoted(prompt, "Câu hỏi:") or prompt
+        intent = self._intent(query)
+        if "thương hiệu" in prompt:
+            return intent.get("brand") or "Nike"
+        if "tên sản phẩm" in prompt:
+            return intent.get("product_name") or query
+        return intent.get("keyword") or query.split()[-1]
+
+
+class SQLiteDatabase(Database):
+    """
+    Database chạy trên SQLite trong bộ nhớ với cùng lược đồ products/brands,
+    dùng lại nguyên các truy vấn SQL của Database (đổi placeholder %s thành ?).
+    products=None mở một file SQLite đã được nạp sẵn ở path; latency (giây) giả lập độ trễ mạng
+    của mỗi lần lấy cursor như khi gọi MySQL qua mạng
+    """
+
+    def __init__(self, products: Optional[List[Dict[str, Any]]] = None, path: str = ":memory:",
+                 latency: float = 0.0):
+        self.latency = latency
+        self.pool_size = None
+        self.pool = None
+        self.catalog = None
+        self.normalized_names = True
+        self.brand_ids = None
+        self.brand_alias_ttl = float("inf")
+        self._brand_ids_loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = lambda cursor, row: {
+            column[0]: row[i] for i, column in enumerate(cursor.description)
+        }
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        if products is None:
+            self.load_brand_aliases()
+            return
+        self.connection.executescript("""
+            CREATE TABLE brands (id INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price INTEGER, sale TEXT, image TEXT,
+                                   brand_id INTEGER, description TEXT, specification TEXT, updated_at TEXT,
+                                   name_normalized TEXT);
+            CREATE INDEX idx_products_name_normalized ON products (name_normalized);
+            CREATE INDEX idx_products_price ON products (price);
+            CREATE INDEX idx_products_brand_price ON products (brand_id, price);
+        """)
+        self.connection.executemany("INSERT INTO brands VALUES (?, ?)", list(enumerate(BRANDS, 1)))
+        self.connection.executemany(
+            "INSERT INTO products VALUES (:id, :name, :price, :sale, :image, :brand_id, :description, :specification,"
+            " '2024-01-01 00:00:00', :name_normalized)",
+            [dict(product, name_normalized=fold_diacritics(product["name"]).strip()) for product in products],
+        )
+        self.connection.commit()
+        self.load_brand_aliases()
+
+    @contextmanager
+    def _cursor(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            cursor = _PlaceholderCursor(self.connection.cursor())
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.connection.close()
+
+
+class _PlaceholderCursor:
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+
+    def execute(self, query: str, params=()):
+        self._cursor.execute(query.replace("%s", "?"), list(params or ()))
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
@@ -0,0 +1,130 @@
+"""
+Kiểm thử tải /api/chat hoàn toàn offline: Gemini được thay bằng FakeGenerativeModel,
+MySQL được thay bằng SQLiteDatabase nạp danh mục giả lập (xem benchmarks/fakes.py).
+
+Gửi request qua httpx.ASGITransport (không mở cổng mạng) với số request đồng thời cho trước,
+báo cáo p50/p95/p99, số request/giây và số lượt gọi LLM mỗi request theo từng kịch bản.
+Cần cài thêm httpx.
+
+    python benchmarks/load_test.py --requests 500 --concurrency 20 --catalog-size 20000
+    python benchmarks/load_test.py --llm-latency 0.8 --llm-failure-rate 0.05 --cache
+    python benchmarks/load_test.py --llm-failure-rate 1 --catalog-cache   # Gemini ngừng hoạt động
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import functools
+import statistics
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import BRANDS, MODELS, USES, generate_catalog  # noqa: E402
+
+# Mẫu câu hỏi cho từng kịch bản; {…} được điền ngẫu nhiên để các câu hỏi không trùng nhau
+WORKLOAD = {
+    "price_filter": ["giày dưới {price}k", "có giày nào giá rẻ hơn {price} nghìn không", "giày từ {price}k đến 3 triệu"],
+    "brand_filter": ["cho tôi xem sản phẩm thương hiệu {brand}", "shop có giày hãng {brand} không"],
+    "search_products": ["tìm giày {use}", "tìm giày {model} {use}"],
+    "product_info": ["cho tôi thông tin sản phẩm {product}", "chi tiết về {product}"],
+    "ai": ["xin chào", "cửa hàng mở cửa mấy giờ vậy bạn", "tư vấn giúp mình size giày với"],
+}
+
+
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+def build_app(args, products):
+    """
+    Thay Gemini bằng bản giả lập trước khi import chatbot_api, rồi khởi tạo API với SQLiteDatabase
+    """
+    os.environ["QUERY_CACHE"] = "1" if args.cache else "0"
+    os.environ["CATALOG_CACHE_TTL"] = "300" if args.catalog_cache else "0"
+
+    import google.generativeai as genai
+    from benchmarks.fakes import FakeGenerativeModel, SQLiteDatabase
+
+    genai.GenerativeModel = functools.partial(
+        FakeGenerativeModel, latency=args.llm_latency, jitter=args.llm_latency / 3,
+        failure_rate=args.llm_failure_rate, seed=args.seed
+    )
+    import chatbot_api
+    chatbot_api.init_resources(SQLiteDatabase(products))
+    return chatbot_api
+
+
+async def run(args):
+    import httpx
+
+    products = generate_catalog(args.catalog_size, seed=args.seed)
+    api = build_app(args, products)
+    rng = random.Random(args.seed)
+
+    def make_query(scenario: str) -> str:
+        template = rng.choice(WORKLOAD[scenario])
+        return template.format(
+            price=rng.randrange(300, 3000), brand=rng.choice(BRANDS), use=rng.choice(USES),
+            model=rng.choice(MODELS), product=rng.choice(products)["name"].lower(),
+        )
+
+    scenarios = [s for s in WORKLOAD if not args.scenarios or s in args.scenarios]
+    jobs = [(scenario, make_query(scenario)) for scenario in (rng.choice(scenarios) for _ in range(args.requests))]
+
+    latencies = defaultdict(list)
+    llm_calls = defaultdict(list)
+    errors = defaultdict(int)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def one(scenario: str, message: str):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/chat", json={"message": message},
+                                             headers={api.DEBUG_TIMING_HEADER: "1"})
+                latencies[scenario].append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors[scenario] += 1
+                    return
+                llm_calls[scenario].append(response.json().get("timing", {}).get("llm_calls", 0))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(scenario, message) for scenario, message in jobs))
+        elapsed = time.perf_counter() - started
+
+    print(f"\n{args.requests} request, đồng thời {args.concurrency}, danh mục {args.catalog_size:,} sản phẩm, "
+          f"LLM {args.llm_latency * 1000:.0f} ms (lỗi {args.llm_failure_rate:.0%}), "
+          f"cache câu hỏi: {'bật' if args.cache else 'tắt'}, cache danh mục: {'bật' if args.catalog_cache else 'tắt'}")
+    print(f"{'kịch bản':<18}{'n':>6}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'LLM/req':>9}{'lỗi':>6}")
+    all_latencies = []
+    for scenario in scenarios:
+        samples = latencies.get(scenario)
+        if not samples:
+            continue
+        all_latencies.extend(samples)
+        calls = llm_calls.get(scenario) or [0]
+        print(f"{scenario:<18}{len(samples):>6}{percentile(samples, 0.5):>11.1f}{percentile(samples, 0.95):>11.1f}"
+              f"{percentile(samples, 0.99):>11.1f}{statistics.mean(calls):>9.2f}{errors[scenario]:>6}")
+    print(f"{'tổng':<18}{len(all_latencies):>6}{percentile(all_latencies, 0.5):>11.1f}"
+          f"{percentile(all_latencies, 0.95):>11.1f}{percentile(all_latencies, 0.99):>11.1f}")
+    print(f"Thông lượng: {len(all_latencies) / elapsed:.1f} request/giây ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="độ trễ trung bình mỗi lượt gọi LLM (giây)")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--scenarios", nargs="*", choices=list(WORKLOAD), help="chỉ chạy các kịch bản này")
+    parser.add_argument("--cache", action="store_true", help="bật cache câu hỏi (QUERY_CACHE)")
+    parser.add_argument("--catalog-cache", action="store_true", help="bật cache danh mục trong bộ nhớ")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
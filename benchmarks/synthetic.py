@@ -0,0 +1,35 @@
+import random
+from typing import List, Dict, Any
+
+BRANDS = ["Nike", "Adidas", "Puma", "Converse", "Vans"]
+MODELS = [
+    "Air Max", "Air Force", "Ultraboost", "Stan Smith", "Suede", "RS-X",
+    "Chuck Taylor", "Run Star", "Old Skool", "Sk8-Hi", "Pegasus", "Superstar",
+]
+ADJECTIVES = ["trắng", "đen", "đỏ", "xanh", "cổ cao", "cổ thấp", "nữ", "nam", "trẻ em"]
+USES = ["chạy bộ", "đi bộ", "bóng rổ", "đá bóng", "trượt ván", "tập gym", "đi chơi"]
+MATERIALS = ["da", "vải canvas", "lưới thoáng khí", "da lộn", "cao su"]
+
+
+def generate_catalog(size: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Sinh danh mục sản phẩm giày giả lập với kích thước cho trước (dữ liệu lặp lại được theo seed)
+    """
+    rng = random.Random(seed)
+    products = []
+    for product_id in range(1, size + 1):
+        brand_id = rng.randrange(len(BRANDS)) + 1
+        brand = BRANDS[brand_id - 1]
+        name = f"{brand} {rng.choice(MODELS)} {rng.choice(ADJECTIVES)} {product_id}"
+        products.append({
+            "id": product_id,
+            "name": name,
+            "price": rng.randrange(200, 5000) * 1000,
+            "sale": f"{rng.choice([0, 10, 20, 30])}%" if rng.random() < 0.3 else None,
+            "brand_id": brand_id,
+            "brand": brand,
+            "description": f"Giày {rng.choice(USES)} chất liệu {rng.choice(MATERIALS)}, phù hợp {rng.choice(USES)}",
+            "specification": f"Size {rng.randrange(35, 46)}, đế {rng.choice(MATERIALS)}",
+            "image": f"/images/products/{product_id}.jpg",
+        })
+    return products
@@ -0,0 +1,213 @@
+import time
+import bisect
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from search_index import SearchIndex
+from fuzzy import ProductNameMatcher
+from text_utils import fold_diacritics
+
+logger = logging.getLogger('chatbot')
+
+
+class CatalogUnavailableError(Exception):
+    """
+    Không có ảnh chụp danh mục hợp lệ, cần truy vấn trực tiếp database
+    """
+
+
+class _Snapshot:
+    """
+    Ảnh chụp danh mục sản phẩm cùng các chỉ mục tra cứu nhanh
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], watermark: Any = None):
+        self.products = products
+        self.watermark = watermark
+
+        priced = sorted((p for p in products if p.get('price') is not None), key=lambda p: p['price'])
+        self.prices = [p['price'] for p in priced]
+        self.by_price = priced
+
+        # Danh sách theo thương hiệu giữ thứ tự giá tăng dần như truy vấn SQL có phân trang;
+        # tên thương hiệu và tên sản phẩm được chuẩn hóa bằng fold_diacritics giống Database
+        self.by_brand_id: Dict[Any, List[Dict[str, Any]]] = {}
+        self.by_brand: Dict[str, List[Dict[str, Any]]] = {}
+        for product in priced + [p for p in products if p.get('price') is None]:
+            if product.get('brand_id') is not None:
+                self.by_brand_id.setdefault(product['brand_id'], []).append(product)
+            if product.get('brand'):
+                self.by_brand.setdefault(fold_diacritics(product['brand']).strip(), []).append(product)
+
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        for product in products:
+            if product.get('name'):
+                self.by_name.setdefault(fold_diacritics(product['name']).strip(), product)
+
+        self.names = ProductNameMatcher(products)
+
+
+class CatalogCache:
+    """
+    Bộ nhớ đệm danh mục sản phẩm trong tiến trình, làm mới theo TTL hoặc theo mốc updated_at.
+    Nếu có shared (xem shared_cache.py), danh mục đã tải được chia sẻ giữa các worker theo mốc,
+    nên mỗi lần danh mục thay đổi chỉ một worker phải tải lại từ database.
+    brand_resolver (tên thương hiệu -> brand_id, ví dụ Database.lookup_brand_id) giúp tra thương hiệu
+    theo cùng bảng tên gọi với truy vấn SQL
+    """
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]],
+                 watermark_loader: Optional[Callable[[], Any]] = None,
+                 ttl: float = 300.0, shared: Optional[Any] = None,
+                 brand_resolver: Optional[Callable[[str], Optional[int]]] = None):
+        self._loader = loader
+        self._watermark_loader = watermark_loader
+        self._brand_resolver = brand_resolver
+        self.ttl = ttl
+        self.shared = shared
+        self.shared_loads = 0
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Chỉ mục tìm kiếm được giữ qua các lần nạp lại và chỉ cập nhật phần thay đổi
+        self.index = SearchIndex()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.invalidations = 0
+
+    def _load(self) -> None:
+        watermark = self._watermark_loader() if self._watermark_loader else None
+        products = self.shared.get("catalog", watermark) if self.shared is not None else None
+        if products is not None:
+            self.shared_loads += 1
+        else:
+            products = self._loader()
+            if self.shared is not None:
+                self.shared.set("catalog", watermark, products, self.ttl)
+        self.index.sync(products)
+        self._snapshot = _Snapshot(products, watermark)
+        self._checked_at = time.monotonic()
+        self.reloads += 1
+        logger.info(f"Đã nạp danh mục sản phẩm vào bộ nhớ đệm: {len(products)} sản phẩm")
+
+    def _current(self) -> _Snapshot:
+        """
+        Trả về ảnh chụp còn hiệu lực, nạp lại nếu đã hết hạn
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.ttl:
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            # Một luồng khác có thể vừa nạp lại xong
+            if self._snapshot is not snapshot and self._snapshot is not None:
+                self.hits += 1
+                return self._snapshot
+            try:
+                if snapshot is not None and self._watermark_loader is not None:
+                    # Danh mục chưa thay đổi thì chỉ gia hạn ảnh chụp hiện tại
+                    if self._watermark_loader() == snapshot.watermark:
+                        self._checked_at = time.monotonic()
+                        self.hits += 1
+                        return snapshot
+                self.misses += 1
+                self._load()
+                return self._snapshot
+            except Exception as e:
+                logger.error(f"Lỗi khi nạp danh mục sản phẩm vào bộ nhớ đệm: {str(e)}")
+                self._snapshot = None
+                raise CatalogUnavailableError(str(e)) from e
+
+    def invalidate(self, include_shared: bool = True) -> None:
+        """
+        Bỏ ảnh chụp hiện tại, lần tra cứu tiếp theo sẽ nạp lại từ database.
+        include_shared=False giữ nguyên danh mục trong kho dùng chung (worker khác vừa nạp lại)
+        """
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+            if include_shared and self.shared is not None:
+                self.shared.clear("catalog")
+        logger.info("Đã vô hiệu hóa bộ nhớ đệm danh mục sản phẩm")
+
+    def products_by_price(self, max_price: float) -> List[Dict[str, Any]]:
+        snapshot = self._current()
+        return snapshot.by_price[:bisect.bisect_left(snapshot.prices, max_price)]
+
+    def products_by_price_range(self, min_price: Optional[float], max_price: Optional[float],
+                                max_inclusive: bool = False) -> List[Dict[str, Any]]:
+        """
+        Sản phẩm có min_price <= giá < max_price (hoặc <= nếu max_inclusive), sắp xếp theo giá
+        """
+        snapshot = self._current()
+        start = bisect.bisect_left(snapshot.prices, min_price) if min_price is not None else 0
+        if max_price is None:
+            end = len(snapshot.prices)
+        elif max_inclusive:
+            end = bisect.bisect_right(snapshot.prices, max_price)
+        else:
+            end = bisect.bisect_left(snapshot.prices, max_price)
+        return snapshot.by_price[start:end]
+
+    def products_by_brand_name(self, brand_name: str) -> List[Dict[str, Any]]:
+        snapshot = self._current()
+        brand_id = self._brand_resolver(brand_name) if self._brand_resolver is not None else None
+        if brand_id is not None:
+            return list(snapshot.by_brand_id.get(brand_id, []))
+        # Không có bảng tên gọi: so tên đã bỏ dấu, giống Database.resolve_brand_id
+        # (trùng khớp, sau đó thương hiệu đầu tiên có chứa chuỗi cần tìm như LIKE '%brand%')
+        needle = fold_diacritics(brand_name).strip()
+        if not needle:
+            return []
+        if needle in snapshot.by_brand:
+            return list(snapshot.by_brand[needle])
+        for name, products in snapshot.by_brand.items():
+            if needle in name:
+                return list(products)
+        return []
+
+    def product_by_exact_name(self, name: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._current()
+        return snapshot.by_name.get(fold_diacritics(name).strip())
+
+    def match_product_names(self, query: str, limit: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        snapshot = self._current()
+        return snapshot.names.match(query, limit)
+
+    def search_products(self, keyword: str) -> List[Dict[str, Any]]:
+        self._current()
+        return self.index.search(keyword)
+
+    def warm_up(self) -> int:
+        """
+        Nạp ảnh chụp danh mục ngay (thay vì chờ lần tra cứu đầu tiên), trả về số sản phẩm
+        """
+        return len(self._current().products)
+
+    def version(self) -> Optional[int]:
+        """
+        Phiên bản của ảnh chụp hiện tại (tăng mỗi lần nạp lại), None nếu chưa có ảnh chụp
+        """
+        return self.reloads if self._snapshot is not None else None
+
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        lookups = self.hits + self.misses
+        return {
+            'products': len(snapshot.products) if snapshot else 0,
+            'watermark': str(snapshot.watermark) if snapshot and snapshot.watermark is not None else None,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'indexed_products': len(self.index),
+            'reloads': self.reloads,
+            'shared_loads': self.shared_loads,
+            'invalidations': self.invalidations,
+        }
@@ -1,32 +1,165 @@
 import os
 import re
+import json
 import logging
+import time
 import asyncio
-from typing import Dict, Any, Optional, Tuple
-from dotenv import load_dotenv
-import google.generativeai as genai
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable, AsyncIterator, Iterator, List
 
 from data import Database
+from router import RouteDecision, ScenarioRouter
+from query_cache import QueryCache, normalize_query
+from pagination import encode_page_token, decode_page_token, InvalidPageTokenError
+from sessions import SessionStore, AIUsageStats
+from price_rules import PriceRange, parse_price_query, describe_price_range
+from llm_client import GeminiClient, LLMOverloadedError, LLMUnavailableError
+from local_classifier import LocalClassifier
+from metrics import timed, span, record_llm_call
+from popular import PopularAnswers
+from speculation import Speculation
+from text_utils import fold_diacritics, strip_product_query
 
-logging.basicConfig(
-    level=logging.INFO, 
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='chatbot.log'
-)
 logger = logging.getLogger('chatbot')
-load_dotenv()
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# google.generativeai mất vài trăm ms để import nên chỉ được nạp (và cấu hình API key) ở lần dùng đầu tiên;
+# import module này không có tác dụng phụ nào
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def load_genai():
+    """
+    Import và cấu hình google.generativeai (chỉ lần gọi đầu tiên)
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+            _genai = genai
+    return _genai
+
+# Các chế độ xác định kịch bản:
+# - per_scenario: gọi Gemini một lần cho mỗi kịch bản (cách cũ)
+# - single_call: chấm điểm tất cả kịch bản và trích xuất tham số trong một lần gọi
+CLASSIFIER_PER_SCENARIO = "per_scenario"
+CLASSIFIER_SINGLE_CALL = "single_call"
+CLASSIFIER_MODES = (CLASSIFIER_PER_SCENARIO, CLASSIFIER_SINGLE_CALL)
+
+# Ngữ cảnh trợ lý bán hàng, được đặt một lần làm system instruction của mô hình chat
+SYSTEM_INSTRUCTION = """Bạn là trợ lý bán hàng cửa hàng bán giày, giúp trả lời câu hỏi khách hàng về sản phẩm giày.
+Hãy trả lời ngắn gọn câu hỏi của khách hàng và lái sang giới thiệu cho khách hàng về các thương hiệu giày mà cửa hàng bán : Nike, Adidas, Puma, Converse, Vans
+Hãy trả lời ngắn gọn và thân thiện. Trả lời bằng tiếng Việt.
+"""
+
+
+# Chỉ lấy trước danh sách theo giá khi số trong câu hỏi đủ lớn để là một mức giá (VND),
+# tránh đoán nhầm các số trong tên sản phẩm như "air force 1"
+MIN_SPECULATIVE_PRICE = 10_000
+
+# Trả lời khi Gemini không khả dụng mà câu hỏi không thuộc danh mục sản phẩm
+DEGRADED_MESSAGE = ("Xin lỗi, trợ lý AI tạm thời không khả dụng. Bạn vẫn có thể hỏi về sản phẩm theo giá, "
+                    "thương hiệu hoặc tên sản phẩm (ví dụ: giày Nike dưới 2 triệu).")
+
+
+# Các bước đã phải dùng giá trị dự phòng vì lượt gọi Gemini thất bại hoặc hết thời gian chờ trong lúc
+# xử lý câu hỏi hiện tại. Kết quả dựng từ các giá trị đó không được lưu vào cache.
+# Danh sách được dùng chung với các task con (asyncio.gather) nên lỗi ở đó cũng được ghi lại
+_llm_fallbacks: ContextVar[Optional[List[str]]] = ContextVar("llm_fallbacks", default=None)
+
+
+@contextmanager
+def _track_llm_fallbacks() -> Iterator[List[str]]:
+    """
+    Thu thập các bước dùng giá trị dự phòng; gọi lồng nhau thì dùng chung danh sách của lớp ngoài
+    """
+    fallbacks = _llm_fallbacks.get()
+    if fallbacks is not None:
+        yield fallbacks
+        return
+    fallbacks = []
+    token = _llm_fallbacks.set(fallbacks)
+    try:
+        yield fallbacks
+    finally:
+        _llm_fallbacks.reset(token)
+
+
+def _note_llm_fallback(step: str) -> None:
+    fallbacks = _llm_fallbacks.get()
+    if fallbacks is not None:
+        fallbacks.append(step)
+
+
+class AIResponseError(Exception):
+    """
+    Không lấy được câu trả lời từ Gemini AI
+    """
+
 
 class ChatBot:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, classifier_mode: Optional[str] = None,
+                 use_local_router: Optional[bool] = None, use_query_cache: Optional[bool] = None,
+                 shared_cache: Optional[Any] = None):
         """
-        Khởi tạo chatbot với kết nối database
+        Khởi tạo chatbot với kết nối database.
+        shared_cache: kho dùng chung giữa các worker cho cache câu trả lời (xem shared_cache.py)
         """
         self.db = db
+        # Số sản phẩm tối đa trong một trang trả lời
+        self.page_size = int(os.getenv("CHAT_PAGE_SIZE", "10"))
+        if use_query_cache is None:
+            use_query_cache = os.getenv("QUERY_CACHE", "1") == "1"
+        self.cache_fold_diacritics = os.getenv("QUERY_CACHE_FOLD_DIACRITICS", "0") == "1"
+        self.scenario_cache: Optional[QueryCache] = None
+        self.slot_cache: Optional[QueryCache] = None
+        self.response_cache: Optional[QueryCache] = None
+        if use_query_cache:
+            cache_ttl = float(os.getenv("QUERY_CACHE_TTL", "600"))
+            self.scenario_cache = QueryCache("scenario", int(os.getenv("SCENARIO_CACHE_MAX_BYTES", str(1 << 20))), cache_ttl)
+            self.slot_cache = QueryCache("slot", int(os.getenv("SLOT_CACHE_MAX_BYTES", str(1 << 20))), cache_ttl)
+            self.response_cache = QueryCache("response", int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(16 << 20))), cache_ttl,
+                                             shared=shared_cache)
+        # Câu trả lời dựng sẵn cho các câu hỏi phổ biến, do PopularAnswersJob cập nhật (xem popular.py)
+        self.popular = PopularAnswers()
+        if use_local_router is None:
+            use_local_router = os.getenv("CHATBOT_LOCAL_ROUTER", "1") == "1"
+        # Ngưỡng chấp nhận kết quả của router cục bộ mà không cần hỏi Gemini
+        self.router_min_score = float(os.getenv("ROUTER_MIN_SCORE", "0.3"))
+        self.router_min_margin = float(os.getenv("ROUTER_MIN_MARGIN", "0.08"))
+        # Thời gian chờ tối đa (giây) cho mỗi lần gọi Gemini bất đồng bộ
+        self.llm_timeout = float(os.getenv("GEMINI_TIMEOUT", "10"))
+        # Mọi lượt gọi Gemini bất đồng bộ đi qua client dùng chung (giới hạn đồng thời, tốc độ, thử lại)
+        self.llm = GeminiClient.from_env(timeout=self.llm_timeout)
+        # Xử lý gộp: số việc chạy đồng thời và số câu hỏi mỗi lần gọi Gemini phân loại
+        self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+        self.batch_classify_size = int(os.getenv("BATCH_CLASSIFY_SIZE", "20"))
+        # Câu hỏi về giá được nhận diện bằng luật, không cần gọi LLM
+        self.use_price_rules = os.getenv("PRICE_RULES", "1") == "1"
+        # product_info: tên khớp gần đúng đủ chắc chắn (điểm và khoảng cách với ứng viên thứ hai)
+        # thì trả về sản phẩm luôn, không cần Gemini trích xuất tên
+        self.fuzzy_min_score = float(os.getenv("FUZZY_MATCH_MIN_SCORE", "0.85"))
+        self.fuzzy_min_margin = float(os.getenv("FUZZY_MATCH_MIN_MARGIN", "0.05"))
+        # Chạy trước các việc rẻ (tra thương hiệu, khớp tên, lấy trước danh sách) trong lúc chờ Gemini phân loại
+        self.speculative = os.getenv("SPECULATIVE_PLANNING", "1") == "1"
+        self.classifier_mode = classifier_mode or os.getenv("CHATBOT_CLASSIFIER_MODE", CLASSIFIER_PER_SCENARIO)
+        if self.classifier_mode not in CLASSIFIER_MODES:
+            raise ValueError(f"Chế độ phân loại không hợp lệ: {self.classifier_mode}")
+        logger.info(f"Chế độ xác định kịch bản: {self.classifier_mode}")
+        # Mô hình Gemini được tạo ở lần dùng đầu tiên (xem load_models)
+        self._model = None
+        self._chat_model = None
+        self._models_lock = threading.Lock()
         try:
-            self.model = genai.GenerativeModel('gemini-2.0-flash')
-            logger.info("Đã khởi tạo mô hình Gemini AI thành công")
+            self.sessions = SessionStore(
+                max_sessions=int(os.getenv("CHAT_SESSION_MAX", "1000")),
+                idle_ttl=float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800")),
+                max_turns=int(os.getenv("CHAT_SESSION_MAX_TURNS", "10"))
+            )
+            self.ai_usage = AIUsageStats()
             
             self.scenarios = {
                 "price_filter": " sản phẩm có giá dưới X đồng",
@@ -35,10 +168,49 @@ class ChatBot:
                 "product_info": "Thông tin chi tiết về sản phẩm  X"
             }
             logger.info("Đã khởi tạo các kịch bản câu hỏi mẫu")
+
+            self.router = ScenarioRouter.from_env(self.scenarios) if use_local_router else None
+            # Định tuyến và trích xuất tham số không cần Gemini, dùng khi cầu dao Gemini đang mở
+            self.local_classifier = LocalClassifier(self.router, self.router_min_score, self.router_min_margin)
         except Exception as e:
-            logger.error(f"Lỗi khi khởi tạo mô hình Gemini AI: {str(e)}")
+            logger.error(f"Lỗi khi khởi tạo chatbot: {str(e)}")
             raise
+
+    def load_models(self) -> None:
+        """
+        Tạo các mô hình Gemini nếu chưa có; gọi sẵn khi khởi động để request đầu tiên không phải chờ
+        """
+        with self._models_lock:
+            if self._model is not None:
+                return
+            try:
+                genai = load_genai()
+                self._chat_model = genai.GenerativeModel('gemini-2.0-flash', system_instruction=SYSTEM_INSTRUCTION)
+                self._model = genai.GenerativeModel('gemini-2.0-flash')
+                logger.info("Đã khởi tạo mô hình Gemini AI thành công")
+            except Exception as e:
+                logger.error(f"Lỗi khi khởi tạo mô hình Gemini AI: {str(e)}")
+                raise
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load_models()
+        return self._model
+
+    @property
+    def chat_model(self):
+        if self._model is None:
+            self.load_models()
+        return self._chat_model
     
+    def degraded(self) -> bool:
+        """
+        Cầu dao Gemini đang mở: câu hỏi được trả lời bằng chế độ cục bộ, không gọi Gemini
+        """
+        return not self.llm.is_available()
+
+    @timed("format_product_info")
     def format_product_info(self, product: Dict[str, Any]) -> str:
         """
         Format thông tin sản phẩm để hiển thị
@@ -64,6 +236,7 @@ class ChatBot:
             logger.error(f"Lỗi khi format thông tin sản phẩm: {str(e)}")
             return "Không thể hiển thị thông tin sản phẩm"
     
+    @timed("llm.similarity")
     async def get_semantic_similarity(self, query: str, scenario: str) -> float:
         """
         Sử dụng Gemini để đánh giá mức độ tương đồng ngữ nghĩa giữa câu hỏi và kịch bản
@@ -78,9 +251,7 @@ class ChatBot:
             Câu 2: "{scenario}"
             """
             
-            response = await self.model.generate_content_async(prompt)
-            
-            result_text = response.text.strip()
+            result_text = await self._generate_text_async(prompt)
             match = re.search(r'([0-9]*[.])?[0-9]+', result_text)
             if match:
                 similarity = float(match.group())
@@ -90,14 +261,176 @@ class ChatBot:
                 logger.warning(f"Không thể trích xuất điểm số từ phản hồi: {result_text}")
                 return 0.0
                 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Lỗi khi đánh giá độ tương đồng ngữ nghĩa: {str(e)}")
+            _note_llm_fallback("similarity")
             return 0.0
     
+    @timed("llm.classify")
+    async def classify_scenarios(self, user_query: str) -> Tuple[Optional[str], float, Dict[str, Any]]:
+        """
+        Chấm điểm tất cả kịch bản và trích xuất tham số trong một lần gọi Gemini
+        """
+        try:
+            scenario_lines = "\n".join(
+                f'- "{name}": "{template}"' for name, template in self.scenarios.items()
+            )
+            prompt = f"""
+            Đánh giá độ tương đồng ngữ nghĩa giữa câu hỏi của khách hàng và từng kịch bản dưới đây
+            trên thang điểm từ 0 đến 1, trong đó 0 là hoàn toàn khác nhau và 1 là hoàn toàn giống nhau về ý nghĩa.
+            Đồng thời trích xuất các tham số có trong câu hỏi.
+
+            Các kịch bản:
+            {scenario_lines}
+
+            Câu hỏi: "{user_query}"
+
+            Chỉ trả về một đối tượng JSON duy nhất, không kèm diễn giải, theo dạng:
+            {{"scores": {{"<tên kịch bản>": <điểm>}},
+              "slots": {{"price": <số nguyên hoặc null>, "brand": <tên thương hiệu hoặc null>,
+                         "keyword": <từ khóa tìm kiếm hoặc null>, "product_name": <tên sản phẩm hoặc null>}}}}
+            """
+
+            try:
+                scores, slots = self._parse_classification(await self._generate_text_async(prompt))
+            except AIResponseError as e:
+                # Không đọc được kết quả: chấm điểm từng kịch bản, kết quả không được lưu cache
+                logger.warning(f"{str(e)}, chuyển sang chấm điểm từng kịch bản")
+                _note_llm_fallback("classify")
+                best_scenario, best_score = await self._score_each_scenario(user_query)
+                return best_scenario, best_score, {}
+            best_scenario, best_score = self._pick_scenario(scores)
+            logger.info(f"Kịch bản được chọn: {best_scenario} với điểm số: {best_score}, tham số: {slots}")
+            return best_scenario, best_score, slots
+
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi phân loại kịch bản trong một lần gọi: {str(e)}")
+            _note_llm_fallback("classify")
+            return None, 0.0, {}
+
+    @timed("llm.classify_batch")
+    async def classify_scenarios_batch(self, user_queries: List[str]) -> List[Tuple[Optional[str], float, Dict[str, Any]]]:
+        """
+        Phân loại nhiều câu hỏi trong một lần gọi Gemini; kết quả theo đúng thứ tự câu hỏi
+        """
+        try:
+            scenario_lines = "\n".join(
+                f'- "{name}": "{template}"' for name, template in self.scenarios.items()
+            )
+            question_lines = "\n".join(f'{i}. "{query}"' for i, query in enumerate(user_queries, 1))
+            prompt = f"""
+            Với từng câu hỏi của khách hàng dưới đây, đánh giá độ tương đồng ngữ nghĩa với từng kịch bản
+            trên thang điểm từ 0 đến 1, trong đó 0 là hoàn toàn khác nhau và 1 là hoàn toàn giống nhau về ý nghĩa.
+            Đồng thời trích xuất các tham số có trong câu hỏi.
+
+            Các kịch bản:
+            {scenario_lines}
+
+            Các câu hỏi:
+            {question_lines}
+
+            Chỉ trả về một mảng JSON duy nhất, không kèm diễn giải, mỗi phần tử ứng với một câu hỏi theo đúng thứ tự:
+            [{{"scores": {{"<tên kịch bản>": <điểm>}},
+               "slots": {{"price": <số nguyên hoặc null>, "brand": <tên thương hiệu hoặc null>,
+                          "keyword": <từ khóa tìm kiếm hoặc null>, "product_name": <tên sản phẩm hoặc null>}}}}]
+            """
+
+            result_text = await self._generate_text_async(prompt)
+            match = re.search(r'\[.*\]', result_text, re.DOTALL)
+            if not match:
+                raise AIResponseError(f"Không thể trích xuất mảng JSON từ phản hồi: {result_text}")
+            items = json.loads(match.group())
+            if not isinstance(items, list):
+                raise AIResponseError(f"Phản hồi phân loại gộp không phải mảng JSON: {result_text}")
+            if len(items) != len(user_queries):
+                # Thiếu hoặc thừa kết quả thì không biết phần tử nào ứng với câu hỏi nào: không lưu cache
+                logger.warning(f"Phân loại gộp trả về {len(items)} kết quả cho {len(user_queries)} câu hỏi")
+                _note_llm_fallback("classify_batch")
+
+            results = []
+            for i in range(len(user_queries)):
+                item = items[i] if i < len(items) and isinstance(items[i], dict) else {}
+                scores, slots = self._parse_classification_data(item)
+                best_scenario, best_score = self._pick_scenario(scores)
+                results.append((best_scenario, best_score, slots))
+            return results
+
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi phân loại gộp {len(user_queries)} câu hỏi: {str(e)}")
+            _note_llm_fallback("classify_batch")
+            return [(None, 0.0, {}) for _ in user_queries]
+
+    def _pick_scenario(self, scores: Dict[str, float]) -> Tuple[Optional[str], float]:
+        best_scenario = None
+        best_score = 0.0
+        for scenario_name in self.scenarios:
+            similarity = scores.get(scenario_name, 0.0)
+            logger.info(f"Độ tương đồng với kịch bản {scenario_name}: {similarity}")
+            if similarity > best_score:
+                best_score = similarity
+                best_scenario = scenario_name
+        return best_scenario, best_score
+
+    def _parse_classification(self, result_text: str) -> Tuple[Dict[str, float], Dict[str, Any]]:
+        """
+        Đọc kết quả JSON của bộ phân loại, bỏ qua các giá trị không hợp lệ.
+        Ném AIResponseError khi phản hồi không có đối tượng JSON đọc được
+        """
+        match = re.search(r'\{.*\}', result_text, re.DOTALL)
+        if not match:
+            raise AIResponseError(f"Không thể trích xuất JSON từ phản hồi: {result_text}")
+        try:
+            data = json.loads(match.group())
+        except ValueError as e:
+            raise AIResponseError(f"Phản hồi phân loại không phải JSON hợp lệ: {str(e)}") from e
+        if not isinstance(data, dict):
+            raise AIResponseError(f"Phản hồi phân loại không phải đối tượng JSON: {result_text}")
+        return self._parse_classification_data(data)
+
+    def _parse_classification_data(self, data: Dict[str, Any]) -> Tuple[Dict[str, float], Dict[str, Any]]:
+        scores = {}
+        for name, value in (data.get("scores") or {}).items():
+            if name not in self.scenarios:
+                continue
+            try:
+                scores[name] = max(0.0, min(float(value), 1.0))
+            except (TypeError, ValueError):
+                continue
+
+        slots = {}
+        for key, value in (data.get("slots") or {}).items():
+            if value in (None, ""):
+                continue
+            if key == "price":
+                try:
+                    value = int(float(str(value).replace(",", "")))
+                except ValueError:
+                    continue
+            elif isinstance(value, str):
+                value = value.strip()
+            slots[key] = value
+        return scores, slots
+
+    @timed("identify_scenario")
     async def identify_scenario(self, user_query: str) -> Tuple[str, float]:
         """
         Xác định kịch bản phù hợp nhất với câu hỏi của người dùng
         """
+        if self.classifier_mode == CLASSIFIER_SINGLE_CALL:
+            scenario, score, _ = await self.classify_scenarios(user_query)
+            return scenario, score
+        return await self._score_each_scenario(user_query)
+
+    async def _score_each_scenario(self, user_query: str) -> Tuple[Optional[str], float]:
+        """
+        Chấm điểm từng kịch bản bằng một lần gọi Gemini cho mỗi kịch bản (chế độ per_scenario)
+        """
         try:
             best_scenario = None
             best_score = 0.0
@@ -113,10 +446,66 @@ class ChatBot:
             logger.info(f"Kịch bản được chọn: {best_scenario} với điểm số: {best_score}")
             return best_scenario, best_score
             
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Lỗi khi xác định kịch bản: {str(e)}")
+            _note_llm_fallback("identify_scenario")
             return None, 0.0
     
+    def _route(self, user_query: str) -> Optional[RouteDecision]:
+        """
+        Kết quả của router cục bộ cho câu hỏi; None nếu router tắt hoặc lỗi
+        """
+        if self.router is None:
+            return None
+        try:
+            with span("router"):
+                decision = self.router.decide(user_query, self.router_min_score, self.router_min_margin)
+        except Exception as e:
+            logger.error(f"Lỗi router cục bộ, chuyển sang Gemini: {str(e)}")
+            return None
+        logger.info(f"Router cục bộ: {decision.scenario} ({decision.score:.3f}), chênh lệch: {decision.margin:.3f}")
+        return decision
+
+    def _confident_route(self, user_query: str) -> Optional[str]:
+        """
+        Kịch bản do router cục bộ chọn nếu đủ chắc chắn (đủ điểm và đủ chênh lệch), ngược lại None
+        """
+        decision = self._route(user_query)
+        return decision.scenario if decision is not None and decision.confident else None
+
+    @timed("detect_scenario")
+    async def detect_scenario(self, user_query: str,
+                              decision: Optional[RouteDecision] = None) -> Tuple[Optional[str], float, Dict[str, Any]]:
+        """
+        Định tuyến câu hỏi: thử router cục bộ trước, chỉ hỏi Gemini khi kết quả còn mơ hồ.
+        decision là kết quả router đã tính sẵn cho câu hỏi (nếu có)
+        """
+        if decision is None:
+            decision = self._route(user_query)
+        if decision is not None and decision.confident:
+            return decision.scenario, 1.0, {}
+        if decision is not None and decision.candidates:
+            candidates = decision.candidates
+            try:
+                # Chỉ so sánh lại các kịch bản sát điểm nhau bằng Gemini
+                similarities = await asyncio.gather(*(
+                    self.get_semantic_similarity(user_query, self.scenarios[name]) for name in candidates
+                ))
+                best_score, best_scenario = max(zip(similarities, candidates), key=lambda item: item[0])
+                logger.info(f"Gemini phân xử giữa {candidates}: chọn {best_scenario} ({best_score})")
+                return (best_scenario if best_score > 0 else None), best_score, {}
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi khi phân xử kết quả router cục bộ, chuyển sang Gemini: {str(e)}")
+
+        if self.classifier_mode == CLASSIFIER_SINGLE_CALL:
+            return await self.classify_scenarios(user_query)
+        scenario, confidence = await self.identify_scenario(user_query)
+        return scenario, confidence, {}
+
     def extract_price_from_query(self, query: str) -> Optional[int]:
         """
         Trích xuất giá trị giá từ câu hỏi
@@ -134,19 +523,71 @@ class ChatBot:
             logger.error(f"Lỗi khi trích xuất giá: {str(e)}")
             return None
 
-    def extract_brand_name_from_query(self, query: str) -> Optional[str]:
-        """
-        Trích xuất brand_name từ câu hỏi
-        """
-        try:
-            prompt = f"""
+    def _brand_name_prompt(self, query: str) -> str:
+        return f"""
             Từ câu hỏi sau đây, hãy trích xuất tên thương hiệu giày mà người dùng đang hỏi.
             Chỉ trả về tên thương hiệu chính xác, không kèm theo diễn giải hay bất kỳ từ nào khác.
 
             Câu hỏi: "{query}"
             """
 
-            response = self.model.generate_content(prompt)
+    def _product_name_prompt(self, query: str) -> str:
+        return f"""
+                Từ câu hỏi sau đây, hãy trích xuất tên sản phẩm giày mà người dùng đang hỏi thông tin.
+                Chỉ trả về tên sản phẩm chính xác, không kèm theo diễn giải hay bất kỳ từ nào khác.
+                
+                Câu hỏi: "{query}"
+                """
+
+    def _search_keyword_prompt(self, query: str) -> str:
+        return f"""
+            Từ câu hỏi tìm kiếm sau, hãy trích xuất các từ khóa quan trọng để tìm kiếm sản phẩm.
+            Chỉ trả về các từ khóa, không kèm theo diễn giải.
+            
+            Câu hỏi: "{query}"
+            """
+
+    def _strip_product_query(self, query: str) -> str:
+        """
+        Loại bỏ các từ không thuộc tên sản phẩm khỏi câu hỏi
+        """
+        return strip_product_query(query, keep_diacritics=True)
+
+    def _keyword_fallback(self, query: str) -> str:
+        # Fallback: trả về từ đầu tiên có ít nhất 3 ký tự
+        words = [w for w in query.split() if len(w) >= 3]
+        return words[0] if words else query
+
+    async def _match_product_name(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Tìm sản phẩm theo tên gần đúng trong danh mục; chỉ trả về khi kết quả tốt nhất
+        đủ điểm và bỏ xa ứng viên thứ hai
+        """
+        matches = await self.db.match_product_names_async(query, 2)
+        if not matches:
+            return None
+        score, product = matches[0]
+        margin = score - matches[1][0] if len(matches) > 1 else score
+        logger.info(f"Khớp tên gần đúng: {product.get('name')} ({score:.3f}), chênh lệch: {margin:.3f}")
+        if score >= self.fuzzy_min_score and margin >= self.fuzzy_min_margin:
+            return product
+        return None
+
+    async def _generate_text_async(self, prompt: str) -> str:
+        """
+        Gọi Gemini bất đồng bộ qua client dùng chung, thời gian chờ tối đa llm_timeout cho mỗi lần thử
+        """
+        response = await self.llm.generate(self.model, prompt)
+        record_llm_call("generate", response)
+        return response.text.strip()
+
+    @timed("extract.brand")
+    def extract_brand_name_from_query(self, query: str) -> Optional[str]:
+        """
+        Trích xuất brand_name từ câu hỏi
+        """
+        try:
+            response = self.model.generate_content(self._brand_name_prompt(query))
             brand_name = response.text.strip()
 
             logger.info(f"Đã trích xuất tên thương hiệu: {brand_name}")
@@ -156,32 +597,56 @@ class ChatBot:
             logger.error(f"Lỗi khi trích xuất tên thương hiệu: {str(e)}")
             return None
 
+    @timed("extract.brand")
+    async def extract_brand_name_from_query_async(self, query: str) -> Optional[str]:
+        """
+        Phiên bản bất đồng bộ của extract_brand_name_from_query
+        """
+        try:
+            brand_name = await self._generate_text_async(self._brand_name_prompt(query))
+
+            logger.info(f"Đã trích xuất tên thương hiệu: {brand_name}")
+            return brand_name
+
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi trích xuất tên thương hiệu: {str(e)}")
+            _note_llm_fallback("brand")
+            return None
+
+    @timed("extract.product_name")
     def extract_product_name_from_query(self, query: str) -> str:
         """
         Trích xuất tên sản phẩm từ câu hỏi
         """
         try:
-            query = query.lower()
-            words_to_remove = [
-                "thông tin", "chi tiết", "về", "sản phẩm", "có", "tên", "là", 
-                "cho", "tôi", "xem", "giày", "dép", "thể thao"
-            ]
-            
-            for word in words_to_remove:
-                query = query.replace(f" {word} ", " ")
-            
-            query = query.strip()
+            query = self._strip_product_query(query)
             
             if len(query.split()) > 2:
-                prompt = f"""
-                Từ câu hỏi sau đây, hãy trích xuất tên sản phẩm giày mà người dùng đang hỏi thông tin.
-                Chỉ trả về tên sản phẩm chính xác, không kèm theo diễn giải hay bất kỳ từ nào khác.
+                response = self.model.generate_content(self._product_name_prompt(query))
+                product_name = response.text.strip()
                 
-                Câu hỏi: "{query}"
-                """
+                logger.info(f"Đã trích xuất tên sản phẩm: {product_name}")
+                return product_name
+            else:
+                logger.info(f"Sử dụng trực tiếp làm tên sản phẩm: {query}")
+                return query
                 
-                response = self.model.generate_content(prompt)
-                product_name = response.text.strip()
+        except Exception as e:
+            logger.error(f"Lỗi khi trích xuất tên sản phẩm: {str(e)}")
+            return query.strip()
+
+    @timed("extract.product_name")
+    async def extract_product_name_from_query_async(self, query: str) -> str:
+        """
+        Phiên bản bất đồng bộ của extract_product_name_from_query
+        """
+        try:
+            query = self._strip_product_query(query)
+            
+            if len(query.split()) > 2:
+                product_name = await self._generate_text_async(self._product_name_prompt(query))
                 
                 logger.info(f"Đã trích xuất tên sản phẩm: {product_name}")
                 return product_name
@@ -189,160 +654,896 @@ class ChatBot:
                 logger.info(f"Sử dụng trực tiếp làm tên sản phẩm: {query}")
                 return query
                 
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Lỗi khi trích xuất tên sản phẩm: {str(e)}")
+            _note_llm_fallback("product_name")
             return query.strip()
     
+    @timed("extract.keyword")
     def extract_search_keyword(self, query: str) -> str:
         """
         Trích xuất từ khóa tìm kiếm từ câu hỏi
         """
         try:
-            prompt = f"""
-            Từ câu hỏi tìm kiếm sau, hãy trích xuất các từ khóa quan trọng để tìm kiếm sản phẩm.
-            Chỉ trả về các từ khóa, không kèm theo diễn giải.
+            response = self.model.generate_content(self._search_keyword_prompt(query))
+            keywords = response.text.strip()
             
-            Câu hỏi: "{query}"
-            """
+            logger.info(f"Đã trích xuất từ khóa tìm kiếm: {keywords}")
+            return keywords
             
-            response = self.model.generate_content(prompt)
-            keywords = response.text.strip()
+        except Exception as e:
+            logger.error(f"Lỗi khi trích xuất từ khóa tìm kiếm: {str(e)}")
+            return self._keyword_fallback(query)
+
+    @timed("extract.keyword")
+    async def extract_search_keyword_async(self, query: str) -> str:
+        """
+        Phiên bản bất đồng bộ của extract_search_keyword
+        """
+        try:
+            keywords = await self._generate_text_async(self._search_keyword_prompt(query))
             
             logger.info(f"Đã trích xuất từ khóa tìm kiếm: {keywords}")
             return keywords
             
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Lỗi khi trích xuất từ khóa tìm kiếm: {str(e)}")
-            # Fallback: trả về từ đầu tiên có ít nhất 3 ký tự
-            words = [w for w in query.split() if len(w) >= 3]
-            return words[0] if words else query
+            _note_llm_fallback("keyword")
+            return self._keyword_fallback(query)
     
-    async def get_ai_response(self, user_query: str) -> str:
+    async def get_ai_response(self, user_query: str, session_id: Optional[str] = None) -> str:
         """
         Lấy câu trả lời từ Gemini AI cho các câu hỏi không xác định
         """
         try:
-            # Thiết lập ngữ cảnh cho AI
-            prompt = """Bạn là trợ lý bán hàng cửa hàng bán giày, giúp trả lời câu hỏi khách hàng về sản phẩm giày.
-            Hãy trả lời ngắn gọn câu hỏi của khách hàng và lái sang giới thiệu cho khách hàng về các thương hiệu giày mà cửa hàng bán : Nike, Adidas, Puma, Converse, Vans
-            Hãy trả lời ngắn gọn và thân thiện. Trả lời bằng tiếng Việt.
-            """
-            
-            chat = self.model.start_chat(history=[
-                {
-                    "role": "user",
-                    "parts": [prompt]
-                },
-                {
-                    "role": "model",
-                    "parts": ["Tôi sẽ trả lời câu hỏi của bạn về sản phẩm một cách ngắn gọn và thân thiện."]
-                }
-            ])
-            
-            response = await chat.send_message_async(user_query)
+            return await self._ask_ai(user_query, session_id)
+        except (AIResponseError, LLMOverloadedError) as e:
+            return self._error_result(e)['response']
+
+    def _start_ai_chat(self):
+        """
+        Tạo phiên chat Gemini; ngữ cảnh trợ lý đã nằm trong system instruction nên không cần gửi lại
+        """
+        return self.chat_model.start_chat()
+
+    def _record_ai_usage(self, kind: str, started: float, response: Any) -> None:
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) if usage is not None else None
+        self.ai_usage.record(kind, time.perf_counter() - started, prompt_tokens)
+        record_llm_call(kind, response)
+        logger.info(f"Lượt gọi AI ({kind}): {prompt_tokens} token prompt, {time.perf_counter() - started:.2f}s")
+
+    @timed("llm.chat")
+    async def _ask_ai(self, user_query: str, session_id: Optional[str] = None) -> str:
+        """
+        Gọi Gemini AI, ném AIResponseError khi thất bại và LLMOverloadedError khi hệ thống quá tải.
+        Có session_id thì dùng lại phiên chat của client để giữ ngữ cảnh hội thoại
+        """
+        try:
+            started = time.perf_counter()
+            if session_id:
+                entry = self.sessions.get_or_create(session_id, self._start_ai_chat)
+                async with entry.lock:
+                    response = await self.llm.send_message(entry.chat, user_query)
+                    entry.turns += 1
+                    self.sessions.trim_history(entry)
+                self._record_ai_usage("session", started, response)
+            else:
+                response = await self.llm.send_message(self._start_ai_chat(), user_query)
+                self._record_ai_usage("stateless", started, response)
             return response.text
-            
+
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"Lỗi khi gọi API Gemini: {str(e)}")
-            return f"Xin lỗi, tôi không thể kết nối với AI để trả lời câu hỏi của bạn. Lỗi: {str(e)}"
+            raise AIResponseError(str(e)) from e
+
+    async def _ask_ai_stream(self, user_query: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Gọi Gemini AI ở chế độ streaming, trả về từng đoạn văn bản ngay khi nhận được
+        """
+        try:
+            started = time.perf_counter()
+            if session_id:
+                entry = self.sessions.get_or_create(session_id, self._start_ai_chat)
+                async with entry.lock:
+                    response = await self.llm.send_message(entry.chat, user_query, stream=True)
+                    async for chunk in response:
+                        if chunk.text:
+                            yield chunk.text
+                    entry.turns += 1
+                    self.sessions.trim_history(entry)
+                self._record_ai_usage("session", started, response)
+            else:
+                response = await self.llm.send_message(self._start_ai_chat(), user_query, stream=True)
+                async for chunk in response:
+                    if chunk.text:
+                        yield chunk.text
+                self._record_ai_usage("stateless", started, response)
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"Lỗi khi gọi API Gemini (streaming): {str(e)}")
+            raise AIResponseError(str(e)) from e
+
+    def ai_stats(self) -> Dict[str, Any]:
+        """
+        Thống kê phiên chat và mức dùng token/độ trễ của các lượt gọi AI
+        """
+        return {
+            'sessions': self.sessions.stats(),
+            'usage': self.ai_usage.stats(),
+            'client': self.llm.stats(),
+        }
     
+    async def _cached(self, cache: Optional[QueryCache], key: Any, factory: Callable[[], Awaitable[Any]],
+                      should_cache: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Lấy kết quả qua cache nếu cache được bật
+        """
+        if cache is None:
+            return await factory()
+        return await cache.get_or_compute(key, factory, should_cache)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Thống kê tỉ lệ trúng của các cache phân loại, tham số và câu trả lời
+        """
+        stats = {
+            cache.name: cache.stats()
+            for cache in (self.scenario_cache, self.slot_cache, self.response_cache)
+            if cache is not None
+        }
+        stats['popular'] = self.popular.stats()
+        return stats
+
+    def clear_caches(self) -> None:
+        for cache in (self.scenario_cache, self.slot_cache, self.response_cache):
+            if cache is not None:
+                cache.clear()
+        self.popular.clear()
+        logger.info("Đã xóa cache câu hỏi")
+
+    def _popular_answer(self, key: Tuple[str, int, bool]) -> Optional[Dict[str, Any]]:
+        """
+        Câu trả lời dựng sẵn cho câu hỏi phổ biến. Có bộ nhớ đệm danh mục thì chỉ dùng khi bảng được
+        dựng từ đúng ảnh chụp hiện tại (so trong bộ nhớ, không truy vấn database)
+        """
+        if self.db.catalog is not None and not self.popular.is_current(self.db.catalog.version()):
+            return None
+        return self.popular.lookup(key)
+
+    async def catalog_version(self) -> Any:
+        return await self.db.catalog_version_async()
+
+    async def precompute_answers(self, user_queries: List[str]) -> Optional[Dict[Tuple[str, int, bool], Dict[str, Any]]]:
+        """
+        Dựng sẵn câu trả lời (văn bản và JSON, kích thước trang mặc định) cho các câu hỏi cho trước.
+        Chỉ giữ câu trả lời từ danh mục (danh sách, chi tiết sản phẩm): bỏ qua câu hỏi phải hỏi AI vì câu trả lời
+        của AI không cố định, câu trả lời cố định (thường là lời nhắc khi thiếu tham số) và câu hỏi mà kế hoạch
+        phải dùng giá trị dự phòng do Gemini lỗi. Trả về None nếu cầu dao Gemini mở trong lúc dựng
+        (kế hoạch có thể đã được lập bằng chế độ cục bộ), khi đó cả bảng bị bỏ
+        """
+        answers = {}
+        for user_query in user_queries:
+            key = normalize_query(user_query, fold=self.cache_fold_diacritics)
+            try:
+                plan = await self._plan_query(user_query.lower().strip(), key)
+                if self.degraded():
+                    logger.warning("Gemini không khả dụng trong lúc dựng câu trả lời cho câu hỏi phổ biến, bỏ bảng đang dựng")
+                    return None
+                if plan['action'] in ("ai", "text") or plan.get('fallback'):
+                    continue
+                for render_text in (True, False):
+                    answers[(key, self.page_size, render_text)] = await self._answer_plan(
+                        user_query, plan, self.page_size, render_text
+                    )
+            except Exception as e:
+                logger.error(f"Lỗi khi dựng câu trả lời cho câu hỏi phổ biến '{user_query}': {str(e)}")
+        return answers
+
     async def process_query(self, user_query: str) -> str:
         """
         Xử lý câu hỏi của người dùng và trả về câu trả lời
         """
         try:
-            user_query = user_query.lower().strip()
-            logger.info(f"Đang xử lý câu hỏi: {user_query}")
+            result = await self.handle_query(user_query)
+        except LLMOverloadedError as e:
+            return self._error_message(e)
+        return result['response']
+
+    async def handle_query(self, user_query: str, page_size: Optional[int] = None,
+                           page_token: Optional[str] = None, render_text: bool = True,
+                           session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Xử lý câu hỏi (hoặc trang tiếp theo của một danh sách) và trả về kết quả kèm thông tin phân trang:
+        response, scenario, products, total, next_page_token.
+        render_text=False bỏ qua bước format từng sản phẩm thành văn bản, chỉ trả về products dạng dữ liệu.
+        session_id giữ ngữ cảnh hội thoại với AI giữa các tin nhắn của cùng một client
+        """
+        page_size = page_size or self.page_size
+        # Câu trả lời của AI trong một phiên phụ thuộc ngữ cảnh hội thoại nên không dùng chung cache
+        response_cache = None if session_id else self.response_cache
+        try:
+            if page_token:
+                kind, value, offset = decode_page_token(page_token)
+                key = ("page", kind, value, offset, page_size, render_text)
+                return await self._cached(
+                    self.response_cache, key, lambda: self._list_products(kind, value, offset, page_size, render_text)
+                )
+            key = normalize_query(user_query, fold=self.cache_fold_diacritics)
+            popular = self._popular_answer((key, page_size, render_text))
+            if popular is not None:
+                return popular
+            # Câu trả lời của chế độ cục bộ không được lưu để hết sự cố là dùng lại Gemini ngay;
+            # câu trả lời dựng từ giá trị dự phòng (Gemini lỗi hoặc hết thời gian chờ) cũng vậy
+            with _track_llm_fallbacks() as fallbacks:
+                return await self._cached(
+                    response_cache, (key, page_size, render_text),
+                    lambda: self._process_query(user_query, key, page_size, render_text, session_id),
+                    should_cache=lambda _: not fallbacks and not self.degraded()
+                )
+        except (InvalidPageTokenError, LLMOverloadedError):
+            raise
+        except Exception as e:
+            return self._error_result(e)
+
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        """
+        Câu trả lời khi xử lý thất bại; chi tiết lỗi chỉ ghi vào log, không gửi cho người dùng
+        """
+        return self._text_result(self._error_message(error))
+
+    def _error_message(self, error: Exception) -> str:
+        if isinstance(error, LLMUnavailableError):
+            return DEGRADED_MESSAGE
+        if isinstance(error, LLMOverloadedError):
+            return "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau ít phút."
+        if isinstance(error, AIResponseError):
+            return "Xin lỗi, tôi không thể kết nối với AI để trả lời câu hỏi của bạn. Vui lòng thử lại sau."
+        logger.error(f"Lỗi không xác định khi xử lý câu hỏi: {str(error)}")
+        return "Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi của bạn."
+
+    @staticmethod
+    def _raise_batch_overload(outcomes: List[Any]) -> None:
+        """
+        Ném lại lỗi quá tải đầu tiên trong kết quả của asyncio.gather để cả lượt xử lý gộp trả 429/503
+        """
+        for outcome in outcomes:
+            if isinstance(outcome, LLMOverloadedError):
+                raise outcome
+
+    def _batch_error_result(self, error: BaseException) -> Dict[str, Any]:
+        """
+        Câu trả lời cho một câu hỏi lỗi trong lượt xử lý gộp; chỉ lỗi dự kiến của từng câu được trả về
+        như câu trả lời, các lỗi khác được ném lại
+        """
+        if isinstance(error, (AIResponseError, InvalidPageTokenError)):
+            return self._error_result(error)
+        raise error
+
+    async def process_queries(self, user_queries: List[str], page_size: Optional[int] = None,
+                              render_text: bool = True, concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Xử lý nhiều câu hỏi một lượt, kết quả theo đúng thứ tự đầu vào:
+        các câu chưa rõ kịch bản được phân loại gộp (mỗi lần gọi Gemini tối đa batch_classify_size câu),
+        danh sách theo giá và theo thương hiệu được lấy bằng truy vấn gộp,
+        phần còn lại (tìm kiếm, hỏi AI) chạy đồng thời với tối đa concurrency việc cùng lúc
+        """
+        page_size = page_size or self.page_size
+        semaphore = asyncio.Semaphore(concurrency or self.batch_concurrency)
+
+        async def limited(coro):
+            async with semaphore:
+                return await coro
+
+        # Câu hỏi trùng nhau sau khi chuẩn hóa chỉ được xử lý một lần
+        keys = [normalize_query(user_query, fold=self.cache_fold_diacritics) for user_query in user_queries]
+        results: Dict[str, Dict[str, Any]] = {}
+        pending: Dict[str, str] = {}
+        for key, user_query in zip(keys, user_queries):
+            if key in results or key in pending:
+                continue
+            cached = self._popular_answer((key, page_size, render_text))
+            if cached is None and self.response_cache is not None:
+                cached = self.response_cache.lookup((key, page_size, render_text))
+            if cached is not None:
+                results[key] = cached
+            else:
+                pending[key] = user_query
+        # Câu hỏi dạng chữ thường dùng cho định tuyến, giống _process_query
+        normalized = {key: user_query.lower().strip() for key, user_query in pending.items()}
+
+        # Bước 1: xác định kịch bản; chỉ các câu mà luật giá, cache và router cục bộ chưa quyết được mới gửi Gemini
+        detections: Dict[str, Tuple[Optional[str], float, Dict[str, Any]]] = {}
+        to_classify = []
+        # Cầu dao Gemini đang mở: bỏ qua bước này, _plan_query lập kế hoạch bằng chế độ cục bộ
+        degraded = self.degraded()
+        for key, user_query in normalized.items():
+            if degraded or (self.use_price_rules and parse_price_query(user_query) is not None):
+                continue
+            cached = self.scenario_cache.get(key) if self.scenario_cache is not None else None
+            scenario = None if cached is not None else self._confident_route(user_query)
+            if cached is not None:
+                detections[key] = cached
+            elif scenario is not None:
+                detections[key] = (scenario, 1.0, {})
+            else:
+                to_classify.append(key)
+
+        # Câu hỏi mà lượt phân loại gộp bị lỗi: kết quả không được lưu cache
+        unreliable = set()
+
+        async def classify_chunk(chunk: List[str]) -> List[Optional[Tuple[Optional[str], float, Dict[str, Any]]]]:
+            with _track_llm_fallbacks() as fallbacks:
+                try:
+                    chunk_detections = await limited(self.classify_scenarios_batch([normalized[key] for key in chunk]))
+                except LLMUnavailableError:
+                    # Cầu dao vừa mở: để trống kết quả, _plan_query sẽ lập kế hoạch bằng chế độ cục bộ
+                    return [None] * len(chunk)
+            if fallbacks:
+                unreliable.update(chunk)
+            return chunk_detections
+
+        chunks = [to_classify[i:i + self.batch_classify_size]
+                  for i in range(0, len(to_classify), self.batch_classify_size)]
+        classified = await asyncio.gather(*(classify_chunk(chunk) for chunk in chunks))
+        for chunk, chunk_results in zip(chunks, classified):
+            for key, detection in zip(chunk, chunk_results):
+                if detection is None:
+                    continue
+                detections[key] = detection
+                if self.scenario_cache is not None and detection[0] is not None and key not in unreliable:
+                    self.scenario_cache.set(key, detection)
+        logger.info(f"Xử lý gộp {len(user_queries)} câu hỏi: {len(pending)} cần xử lý, "
+                    f"{len(to_classify)} câu phân loại bằng {len(chunks)} lần gọi Gemini")
+
+        # Bước 2: lập kế hoạch trả lời cho từng câu
+        plan_keys = list(pending)
+        planned = await asyncio.gather(*(
+            limited(self._plan_query(normalized[key], key, detections.get(key))) for key in plan_keys
+        ), return_exceptions=True)
+        self._raise_batch_overload(planned)
+        plans = {}
+        for key, plan in zip(plan_keys, planned):
+            if isinstance(plan, BaseException):
+                results[key] = self._batch_error_result(plan)
+            else:
+                plans[key] = plan
+
+        # Bước 3: gộp truy vấn danh sách theo giá và theo thương hiệu
+        listings: Dict[str, Dict[str, Any]] = {}
+        price_keys = [key for key, plan in plans.items()
+                      if plan['action'] == "list" and plan['kind'] in ("price", "price_range")]
+        brand_keys = [key for key, plan in plans.items() if plan['action'] == "list" and plan['kind'] == "brand"]
+        if price_keys:
+            ranges = [(None, plans[key]['value'], False) if plans[key]['kind'] == "price" else tuple(plans[key]['value'])
+                      for key in price_keys]
+            pages = await self.db.get_products_by_price_ranges_page_async(ranges, page_size, not render_text)
+            for key, (products, total) in zip(price_keys, pages):
+                listings[key] = self._make_listing(plans[key]['kind'], plans[key]['value'], products, total)
+        if brand_keys:
+            pages = await self.db.get_products_by_brand_names_page_async(
+                [plans[key]['value'] for key in brand_keys], page_size, not render_text
+            )
+            for key, (products, total) in zip(brand_keys, pages):
+                listings[key] = self._make_listing("brand", plans[key]['value'], products, total)
+
+        # Bước 4: các việc còn lại chạy đồng thời
+        answer_keys = list(plans)
+        answers = await asyncio.gather(*(
+            limited(self._answer_plan(pending[key], plans[key], page_size, render_text, listing=listings.get(key)))
+            for key in answer_keys
+        ), return_exceptions=True)
+        self._raise_batch_overload(answers)
+        for key, answer in zip(answer_keys, answers):
+            if isinstance(answer, BaseException):
+                results[key] = self._batch_error_result(answer)
+                continue
+            results[key] = answer
+            if self.response_cache is not None and key not in unreliable and not plans[key].get('fallback') \
+                    and not self.degraded():
+                self.response_cache.set((key, page_size, render_text), answer)
+
+        return [results[key] for key in keys]
+
+    def _text_result(self, response: str, scenario: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            'response': response,
+            'scenario': scenario,
+            'products': [],
+            'total': None,
+            'next_page_token': None,
+        }
+
+    def _detail_result(self, product: Dict[str, Any], scenario: str, render_text: bool = True,
+                       total: Optional[int] = None) -> Dict[str, Any]:
+        response = "Thông tin chi tiết về sản phẩm:"
+        if render_text:
+            response += f"\n\n{self.format_product_info(product)}"
+        return {
+            'response': response,
+            'scenario': scenario,
+            'products': [self.product_payload(product)],
+            'total': total,
+            'next_page_token': None,
+        }
+
+    def product_payload(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Dữ liệu sản phẩm dạng có cấu trúc để trả về cho frontend
+        """
+        price = product.get('price')
+        sale = product.get('sale')
+        return {
+            'id': product.get('id'),
+            'name': product.get('name'),
+            'price': int(price) if price is not None else None,
+            'sale': sale if sale is None or isinstance(sale, (str, int, float)) else str(sale),
+            'brand': product.get('brand'),
+            'image': product.get('image'),
+        }
+
+    async def _fetch_listing(self, kind: str, value: Any, offset: int, page_size: int,
+                             summary: bool = False) -> Dict[str, Any]:
+        """
+        Lấy một trang của danh sách sản phẩm theo loại (giá, thương hiệu, tìm kiếm, tên tương tự).
+        summary=True chỉ lấy các cột cần cho payload JSON
+        """
+        if kind == "price":
+            products, total = await self.db.get_products_by_price_page_async(value, page_size, offset, summary)
+        elif kind == "price_range":
+            price_range = PriceRange(*value)
+            products, total = await self.db.get_products_by_price_range_page_async(
+                price_range.min_price, price_range.max_price, page_size, offset, summary, price_range.max_inclusive
+            )
+        elif kind == "brand":
+            products, total = await self.db.get_products_by_brand_name_page_async(value, page_size, offset, summary)
+        else:
+            products, total = await self.db.search_products_page_async(value, page_size, offset, summary)
+        return self._make_listing(kind, value, products, total)
+
+    def _make_listing(self, kind: str, value: Any, products: List[Dict[str, Any]], total: int) -> Dict[str, Any]:
+        """
+        Gắn tiêu đề, câu thông báo không tìm thấy và kịch bản cho một trang sản phẩm
+        """
+        if kind == "price":
+            header = f"Tìm thấy {total} sản phẩm có giá dưới {format(value, ',d')} VND:"
+            not_found = f"Không tìm thấy sản phẩm nào có giá dưới {format(value, ',d')} VND."
+            scenario = "price_filter"
+        elif kind == "price_range":
+            description = describe_price_range(PriceRange(*value))
+            header = f"Tìm thấy {total} sản phẩm có giá {description}:"
+            not_found = f"Không tìm thấy sản phẩm nào có giá {description}."
+            scenario = "price_filter"
+        elif kind == "brand":
+            header = f"Tìm thấy {total} sản phẩm của thương hiệu '{value}':"
+            not_found = f"Không tìm thấy sản phẩm nào của thương hiệu '{value}'."
+            scenario = "brand_filter"
+        elif kind == "search":
+            header = f"Tìm thấy {total} sản phẩm phù hợp với từ khóa '{value}':"
+            not_found = f"Không tìm thấy sản phẩm nào phù hợp với từ khóa '{value}'."
+            scenario = "search_products"
+        else:
+            header = f"Tìm thấy {total} sản phẩm có tên tương tự '{value}':"
+            not_found = (f"Không tìm thấy sản phẩm nào có tên là '{value}'. Bạn có thể thử cung cấp tên chính xác "
+                         f"hoặc dùng chức năng tìm kiếm sản phẩm.")
+            scenario = "product_info"
+
+        return {
+            'products': products,
+            'total': total,
+            'header': header,
+            'not_found': not_found,
+            'scenario': scenario,
+        }
+
+    def _listing_needs_cards(self, kind: str, listing: Dict[str, Any]) -> bool:
+        """
+        Danh sách có được hiển thị thành từng thẻ sản phẩm hay chỉ là một câu trả lời đơn
+        """
+        if not listing['products']:
+            return False
+        return not (kind == "similar" and listing['total'] == 1)
+
+    def _render_listing(self, kind: str, value: Any, offset: int, listing: Dict[str, Any],
+                        cards: Optional[List[str]] = None, render_text: bool = True) -> Dict[str, Any]:
+        """
+        Hiển thị một trang danh sách sản phẩm; cards là các thẻ sản phẩm đã format sẵn (nếu có)
+        """
+        products = listing['products']
+        total = listing['total']
+        scenario = listing['scenario']
+
+        if not products:
+            if offset == 0:
+                logger.warning(f"Không tìm thấy sản phẩm nào ({kind}: {value})")
+                return self._text_result(listing['not_found'], scenario)
+            return {'response': "Không còn sản phẩm nào khác.", 'scenario': scenario, 'products': [],
+                    'total': total, 'next_page_token': None}
+
+        if not self._listing_needs_cards(kind, listing):
+            return self._detail_result(products[0], scenario, render_text, total)
+
+        next_offset = offset + len(products)
+        if render_text:
+            if cards is None:
+                cards = [self.format_product_info(product) for product in products]
+            response = listing['header'] + "\n\n" + "".join(card + "\n\n" for card in cards)
+            if total > len(products):
+                response += self._page_summary(offset, next_offset, total)
+        else:
+            response = listing['header']
+            if total > len(products):
+                response += " " + self._page_summary(offset, next_offset, total)
+
+        return {
+            'response': response,
+            'scenario': scenario,
+            'products': [self.product_payload(product) for product in products],
+            'total': total,
+            'next_page_token': encode_page_token(kind, value, next_offset) if next_offset < total else None,
+        }
+
+    def _page_summary(self, offset: int, next_offset: int, total: int) -> str:
+        return f"Hiển thị sản phẩm {offset + 1}-{next_offset} trên tổng số {total}."
+
+    async def _list_products(self, kind: str, value: Any, offset: int, page_size: int,
+                             render_text: bool = True) -> Dict[str, Any]:
+        """
+        Lấy và hiển thị một trang của danh sách sản phẩm
+        """
+        listing = await self._fetch_listing(kind, value, offset, page_size, summary=not render_text)
+        return self._render_listing(kind, value, offset, listing, render_text=render_text)
+
+    async def _process_query(self, user_query: str, key: str, page_size: int,
+                             render_text: bool = True, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Xử lý câu hỏi khi không có sẵn trong cache; lỗi được ném ra để không bị lưu vào cache
+        """
+        plan = await self._plan_query(user_query.lower().strip(), key, page_size=page_size, render_text=render_text)
+        return await self._answer_plan(user_query, plan, page_size, render_text, session_id)
+
+    async def _answer_plan(self, user_query: str, plan: Dict[str, Any], page_size: int, render_text: bool = True,
+                           session_id: Optional[str] = None, listing: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Thực hiện kế hoạch trả lời; listing là trang đầu đã lấy sẵn (ví dụ từ truy vấn gộp hoặc lấy trước
+        trong lúc chờ Gemini) nếu có
+        """
+        listing = listing or plan.get('listing')
+        if plan['action'] == "list":
+            if listing is not None:
+                return self._render_listing(plan['kind'], plan['value'], 0, listing, render_text=render_text)
+            return await self._list_products(plan['kind'], plan['value'], 0, page_size, render_text)
+        if plan['action'] == "detail":
+            return self._detail_result(plan['product'], plan['scenario'], render_text)
+        if plan['action'] == "text":
+            return self._text_result(plan['response'], plan['scenario'])
+        try:
+            return self._text_result(await self._ask_ai(user_query, session_id))
+        except LLMUnavailableError:
+            return self._text_result(DEGRADED_MESSAGE)
+
+    async def _plan_query(self, user_query: str, key: str,
+                          detection: Optional[Tuple[Optional[str], float, Dict[str, Any]]] = None,
+                          page_size: Optional[int] = None, render_text: bool = True) -> Dict[str, Any]:
+        """
+        Xác định kịch bản và tham số, từ đó quyết định cách trả lời:
+        list (danh sách sản phẩm), detail (một sản phẩm), text (câu trả lời cố định) hoặc ai (hỏi Gemini).
+        detection là kết quả (kịch bản, độ tin cậy, tham số) đã có sẵn, ví dụ từ phân loại gộp.
+        Có page_size thì kế hoạch list có thể kèm 'listing' là trang đầu đã lấy trước trong lúc chờ Gemini.
+        Kế hoạch có 'fallback' nếu phải dùng giá trị dự phòng do Gemini lỗi; câu trả lời khi đó không được lưu cache
+        """
+        with _track_llm_fallbacks() as fallbacks:
+            plan = await self._make_plan(user_query, key, detection, page_size, render_text)
+        if fallbacks:
+            logger.info(f"Kế hoạch dùng giá trị dự phòng ({', '.join(fallbacks)}), không lưu cache: {user_query}")
+            plan['fallback'] = True
+        return plan
+
+    async def _make_plan(self, user_query: str, key: str,
+                         detection: Optional[Tuple[Optional[str], float, Dict[str, Any]]],
+                         page_size: Optional[int], render_text: bool) -> Dict[str, Any]:
+        logger.info(f"Đang xử lý câu hỏi: {user_query}")
+
+        if self.use_price_rules:
+            with span("price_rules"):
+                price_range = parse_price_query(user_query)
+            if price_range is not None:
+                logger.info(f"Luật giá khớp, tìm sản phẩm có giá {describe_price_range(price_range)}")
+                return {'action': "list", 'kind': "price_range", 'value': tuple(price_range)}
+
+        if detection is None and self.degraded():
+            return await self._local_plan(user_query)
+
+        speculation = None
+        # Router cục bộ chạy một lần cho cả việc quyết định chạy trước và detect_scenario
+        decision = None
+        if detection is None and self.speculative and not self._scenario_cached(key):
+            decision = self._route(user_query)
+            if decision is None or not decision.confident:
+                speculation = self._start_speculation(user_query, page_size, render_text)
+        try:
+            scenario, confidence, slots = detection or await self._cached(
+                self.scenario_cache, key, lambda: self.detect_scenario(user_query, decision),
+                should_cache=lambda result: result[0] is not None and not _llm_fallbacks.get()
+            )
+            return await self._plan_scenario(user_query, key, scenario, confidence, slots, speculation)
+        except LLMUnavailableError:
+            # Cầu dao vừa mở giữa chừng: trả lời bằng luật cục bộ; quá tải, giới hạn tần suất thì ném ra
+            logger.warning(f"Gemini không khả dụng khi xử lý câu hỏi, chuyển sang chế độ cục bộ: {user_query}")
+            return await self._local_plan(user_query)
+        finally:
+            if speculation is not None:
+                speculation.cancel_rest()
+
+    def _scenario_cached(self, key: str) -> bool:
+        return self.scenario_cache is not None and self.scenario_cache.get(key) is not None
+
+    def _start_speculation(self, user_query: str, page_size: Optional[int], render_text: bool) -> Speculation:
+        """
+        Bắt đầu các việc chạy trước trong lúc Gemini xác định kịch bản:
+        thương hiệu theo từ điển (kèm trang đầu của danh sách), tên sản phẩm khớp gần đúng
+        (nạp luôn ảnh chụp danh mục nếu đã hết hạn) và trang đầu theo mức giá có trong câu hỏi
+        """
+        speculation = Speculation()
+        speculation.start("brand", self._speculate_brand(user_query, page_size, not render_text))
+        if self.db.catalog is not None:
+            speculation.start("product", self._match_product_name(user_query))
+        max_price = self.extract_price_from_query(user_query)
+        if page_size is not None and max_price is not None and max_price >= MIN_SPECULATIVE_PRICE:
+            speculation.start("price", self._speculate_listing("price", max_price, page_size, not render_text))
+        return speculation
+
+    async def _speculate_brand(self, user_query: str, page_size: Optional[int],
+                               summary: bool) -> Optional[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Thương hiệu có trong câu hỏi theo từ điển tên gọi (tên trong bảng brands) và trang đầu của danh sách
+        """
+        brand_ids = await self.db.brand_aliases_async()
+        alias = self.local_classifier.find_brand(user_query, brand_ids)
+        if alias is None:
+            return None
+        brand_name = self._canonical_brand(brand_ids, alias)
+        if page_size is None:
+            return brand_name, None
+        return brand_name, await self._fetch_listing("brand", brand_name, 0, page_size, summary)
+
+    async def _speculate_listing(self, kind: str, value: Any, page_size: int,
+                                 summary: bool) -> Tuple[Any, Dict[str, Any]]:
+        return value, await self._fetch_listing(kind, value, 0, page_size, summary)
+
+    async def _take_listing(self, speculation: Optional[Speculation], name: str, value: Any) -> Optional[Dict[str, Any]]:
+        """
+        Trang đầu đã lấy trước cho đúng giá trị value; None nếu không có hoặc đoán sai
+        """
+        if speculation is None:
+            return None
+        prefetched = await speculation.take(name)
+        if prefetched is None or prefetched[0] != value:
+            return None
+        return prefetched[1]
+
+    async def _plan_scenario(self, user_query: str, key: str, scenario: Optional[str], confidence: float,
+                             slots: Dict[str, Any], speculation: Optional[Speculation] = None) -> Dict[str, Any]:
+        """
+        Lập kế hoạch trả lời khi đã biết kịch bản; dùng kết quả chạy trước (nếu có) thay cho việc tính lại
+        """
+        # Ngưỡng độ tin cậy
+        CONFIDENCE_THRESHOLD = 0.5
+        
+        if confidence < CONFIDENCE_THRESHOLD:
+            logger.info(f"Độ tin cậy ({confidence}) thấp hơn ngưỡng, chuyển cho AI")
+            return await self._ai_plan(user_query)
+        
+        # Xử lý theo kịch bản được xác định
+        if scenario == "price_filter":
+            max_price = slots.get("price") or self.extract_price_from_query(user_query)
             
-            scenario, confidence = await self.identify_scenario(user_query)
+            if max_price is None:
+                return {'action': "text", 'scenario': scenario,
+                        'response': "Vui lòng cung cấp mức giá bạn muốn tìm (ví dụ: giày dưới 1000000 đồng)"}
             
-            # Ngưỡng độ tin cậy
-            CONFIDENCE_THRESHOLD = 0.5
+            logger.info(f"Tìm sản phẩm có giá dưới: {max_price}")
+            plan = {'action': "list", 'kind': "price", 'value': max_price}
+            listing = await self._take_listing(speculation, "price", max_price)
+            if listing is not None:
+                plan['listing'] = listing
+            return plan
+
+        elif scenario == "brand_filter":
+            # Thương hiệu tìm được trong từ điển thì không cần Gemini trích xuất,
+            # kể cả khi không chạy trước (router cục bộ đã chắc chắn về kịch bản)
+            def lookup_brand():
+                return self._speculate_brand(user_query, None, False)
+            if speculation is not None:
+                prefetched = await speculation.take("brand", lookup_brand)
+            else:
+                prefetched = await lookup_brand()
+            brand_name = slots.get("brand") or (prefetched[0] if prefetched else None) or await self._cached(
+                self.slot_cache, ("brand", key), lambda: self.extract_brand_name_from_query_async(user_query),
+                should_cache=self._slot_cacheable
+            )
+
+            if brand_name is not None:
+                logger.info(f"Tìm sản phẩm theo tên thương hiệu: {brand_name}")
+                plan = {'action': "list", 'kind': "brand", 'value': brand_name}
+                if prefetched and prefetched[1] is not None \
+                        and fold_diacritics(brand_name).strip() == prefetched[0]:
+                    plan['value'], plan['listing'] = prefetched
+                return plan
+
+            else:
+                return {'action': "text", 'scenario': scenario,
+                        'response': "Vui lòng cung cấp tên của thương hiệu bạn muốn tìm (ví dụ: sản phẩm của thương hiệu Nike)"}
+        
+        elif scenario == "search_products":
+            keywords = slots.get("keyword") or await self._cached(
+                self.slot_cache, ("keyword", key), lambda: self.extract_search_keyword_async(user_query),
+                should_cache=self._slot_cacheable
+            )
             
-            if confidence < CONFIDENCE_THRESHOLD:
-                logger.info(f"Độ tin cậy ({confidence}) thấp hơn ngưỡng, chuyển cho AI")
-                return await self.get_ai_response(user_query)
+            logger.info(f"Tìm kiếm sản phẩm với từ khóa: {keywords}")
+            return {'action': "list", 'kind': "search", 'value': keywords}
+        
+        elif scenario == "product_info":
+            if speculation is not None:
+                matched_product = await speculation.take("product", lambda: self._match_product_name(user_query))
+            else:
+                matched_product = await self._match_product_name(user_query)
+            if matched_product is not None:
+                return {'action': "detail", 'scenario': scenario, 'product': matched_product}
+
+            product_name = slots.get("product_name") or await self._cached(
+                self.slot_cache, ("product_name", key), lambda: self.extract_product_name_from_query_async(user_query),
+                should_cache=self._slot_cacheable
+            )
             
-            # Xử lý theo kịch bản được xác định
-            if scenario == "price_filter":
-                max_price = self.extract_price_from_query(user_query)
+            if product_name:
+                logger.info(f"Tìm thông tin sản phẩm theo tên: {product_name}")
                 
-                logger.info(f"Tìm sản phẩm có giá dưới: {max_price}")
-                products = self.db.get_products_by_price(max_price)
+                exact_product = await self.db.get_product_by_exact_name_async(product_name)
+                if exact_product:
+                    return {'action': "detail", 'scenario': scenario, 'product': exact_product}
                 
-                if products and len(products) > 0:
-                    response = f"Tìm thấy {len(products)} sản phẩm có giá dưới {format(max_price, ',d')} VND:\n\n"
-                    for product in products:
-                        response += self.format_product_info(product) + "\n\n"
-                    return response
-                else:
-                    logger.warning(f"Không tìm thấy sản phẩm nào có giá dưới {max_price}")
-                    return f"Không tìm thấy sản phẩm nào có giá dưới {format(max_price, ',d')} VND."
+                return {'action': "list", 'kind': "similar", 'value': product_name}
+            else:
+                return {'action': "text", 'scenario': scenario,
+                        'response': "Vui lòng cung cấp tên của sản phẩm bạn muốn xem thông tin chi tiết."}
+        
+        logger.info("Chuyển câu hỏi cho Gemini AI xử lý")
+        return await self._ai_plan(user_query)
 
-            elif scenario == "brand_filter":
-                brand_name = self.extract_brand_name_from_query(user_query)
+    def _slot_cacheable(self, value: Any) -> bool:
+        """
+        Tham số được lưu cache khi có giá trị và không phải giá trị dự phòng của lượt gọi Gemini thất bại
+        """
+        return bool(value) and not _llm_fallbacks.get()
 
-                if brand_name is not None:
-                    logger.info(f"Tìm sản phẩm theo tên thương hiệu: {brand_name}")
-                    products = self.db.get_products_by_brand_name(brand_name)
+    async def _ai_plan(self, user_query: str) -> Dict[str, Any]:
+        """
+        Kế hoạch hỏi Gemini; nếu cầu dao vừa mở trong lúc xác định kịch bản thì trả lời bằng chế độ cục bộ
+        """
+        if self.degraded():
+            return await self._local_plan(user_query)
+        return {'action': "ai"}
 
-                    if products and len(products) > 0:
-                        response = f"Tìm thấy {len(products)} sản phẩm của thương hiệu '{brand_name}':\n\n"
-                        for product in products:
-                            response += self.format_product_info(product) + "\n\n"
-                        return response
+    def _canonical_brand(self, brand_ids: Dict[str, int], alias: str) -> str:
+        """
+        Tên gọi khác (ví dụ "addidas") được đổi về tên thương hiệu trong bảng brands
+        """
+        return next(name for name, value in brand_ids.items() if value == brand_ids[alias])
 
-                    else:
-                        logger.warning(f"Không tìm thấy sản phẩm nào của thương hiệu: {brand_name}")
-                        return f"Không tìm thấy sản phẩm nào của thương hiệu '{brand_name}'."
+    @timed("local_plan")
+    async def _local_plan(self, user_query: str) -> Dict[str, Any]:
+        """
+        Lập kế hoạch trả lời không gọi Gemini: kịch bản và tham số từ LocalClassifier,
+        tên sản phẩm khớp gần đúng trên danh mục. Câu hỏi ngoài danh mục nhận câu trả lời cố định
+        """
+        brand_ids = await self.db.brand_aliases_async()
+        scenario, slots = self.local_classifier.classify(user_query, brand_ids)
+        logger.info(f"Chế độ cục bộ (Gemini không khả dụng): kịch bản {scenario}, tham số {slots}")
 
+        if scenario == "price_filter":
+            return {'action': "list", 'kind': "price_range", 'value': tuple(slots['price_range'])}
+        product_name = self._strip_product_query(user_query) or slots.get('product_name')
+        if scenario == "product_info":
+            matched_product = await self._match_product_name(user_query)
+            if matched_product is not None:
+                return {'action': "detail", 'scenario': scenario, 'product': matched_product}
+            exact_product = await self.db.get_product_by_exact_name_async(product_name)
+            if exact_product:
+                return {'action': "detail", 'scenario': scenario, 'product': exact_product}
+            if 'brand' in slots:
+                # Có thương hiệu nhưng không khớp tên sản phẩm nào: trả về danh sách của thương hiệu
+                scenario = "brand_filter"
+            else:
+                return {'action': "list", 'kind': "similar", 'value': product_name}
+        if scenario == "brand_filter":
+            return {'action': "list", 'kind': "brand", 'value': self._canonical_brand(brand_ids, slots['brand'])}
+        if scenario == "search_products":
+            return {'action': "list", 'kind': "search", 'value': product_name}
+        return {'action': "text", 'scenario': None, 'response': DEGRADED_MESSAGE}
+
+    async def stream_query(self, user_query: str, page_size: Optional[int] = None,
+                           page_token: Optional[str] = None,
+                           session_id: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Xử lý câu hỏi ở chế độ streaming, trả về lần lượt các sự kiện (tên, dữ liệu):
+        message (đoạn văn bản), product (từng thẻ sản phẩm), token (từng đoạn trả lời của AI),
+        done (thông tin phân trang) hoặc error
+        """
+        page_size = page_size or self.page_size
+        response_cache = None if session_id else self.response_cache
+        try:
+            if page_token:
+                response_cache = self.response_cache
+                kind, value, offset = decode_page_token(page_token)
+                plan = {'action': "list", 'kind': kind, 'value': value}
+                cache_key: Any = ("page", kind, value, offset, page_size, True)
+            else:
+                offset = 0
+                key = normalize_query(user_query, fold=self.cache_fold_diacritics)
+                cache_key = (key, page_size, True)
+                cached = self._popular_answer(cache_key)
+                if cached is None and response_cache is not None:
+                    cached = response_cache.lookup(cache_key)
+                if cached is not None:
+                    yield "message", {'text': cached['response']}
+                    yield "done", self._stream_meta(cached)
+                    return
+                plan = await self._plan_query(user_query.lower().strip(), key, page_size=page_size)
+
+            if plan['action'] == "list":
+                kind, value = plan['kind'], plan['value']
+                listing = plan.get('listing') or await self._fetch_listing(kind, value, offset, page_size)
+                if self._listing_needs_cards(kind, listing):
+                    yield "message", {'text': listing['header'] + "\n\n"}
+                    cards = []
+                    for index, product in enumerate(listing['products']):
+                        card = self.format_product_info(product)
+                        cards.append(card)
+                        yield "product", {'index': offset + index, 'text': card,
+                                          'product': self.product_payload(product)}
+                    result = self._render_listing(kind, value, offset, listing, cards)
+                    if listing['total'] > len(cards):
+                        yield "message", {'text': self._page_summary(offset, offset + len(cards), listing['total'])}
                 else:
-                    return "Vui lòng cung cấp tên của thương hiệu bạn muốn tìm (ví dụ: sản phẩm của thương hiệu Nike)"
-            
-            elif scenario == "search_products":
-                keywords = self.extract_search_keyword(user_query)
-                
-                logger.info(f"Tìm kiếm sản phẩm với từ khóa: {keywords}")
-                products = self.db.search_products(keywords)
-                
-                if products and len(products) > 0:
-                    response = f"Tìm thấy {len(products)} sản phẩm phù hợp với từ khóa '{keywords}':\n\n"
-                    for product in products:
-                        response += self.format_product_info(product) + "\n\n"
-                    return response
-                else:
-                    logger.warning(f"Không tìm thấy sản phẩm nào với từ khóa: {keywords}")
-                    return f"Không tìm thấy sản phẩm nào phù hợp với từ khóa '{keywords}'."
-            
-            elif scenario == "product_info":
-                product_name = self.extract_product_name_from_query(user_query)
-                
-                if product_name:
-                    logger.info(f"Tìm thông tin sản phẩm theo tên: {product_name}")
-                    
-                    exact_product = self.db.get_product_by_exact_name(product_name)
-                    if exact_product:
-                        return f"Thông tin chi tiết về sản phẩm:\n\n{self.format_product_info(exact_product)}"
-                    
-                    products = self.db.search_products(product_name)
-                    
-                    if products and len(products) > 0:
-                        if len(products) == 1:
-                            return f"Thông tin chi tiết về sản phẩm:\n\n{self.format_product_info(products[0])}"
-                        else:
-                            response = f"Tìm thấy {len(products)} sản phẩm có tên tương tự '{product_name}':\n\n"
-                            for product in products:
-                                response += self.format_product_info(product) + "\n\n"
-                            return response
-                    else:
-                        logger.warning(f"Không tìm thấy sản phẩm nào với tên: {product_name}")
-                        return f"Không tìm thấy sản phẩm nào có tên là '{product_name}'. Bạn có thể thử cung cấp tên chính xác hoặc dùng chức năng tìm kiếm sản phẩm."
+                    result = self._render_listing(kind, value, offset, listing)
+                    yield "message", {'text': result['response']}
+            elif plan['action'] == "ai":
+                parts = []
+                async for chunk in self._ask_ai_stream(user_query, session_id):
+                    parts.append(chunk)
+                    yield "token", {'text': chunk}
+                result = self._text_result("".join(parts))
+            else:
+                if plan['action'] == "detail":
+                    result = self._detail_result(plan['product'], plan['scenario'])
                 else:
-                    return "Vui lòng cung cấp tên của sản phẩm bạn muốn xem thông tin chi tiết."
-            
-            logger.info("Chuyển câu hỏi cho Gemini AI xử lý")
-            return await self.get_ai_response(user_query)
-                
+                    result = self._text_result(plan['response'], plan['scenario'])
+                yield "message", {'text': result['response']}
+
+            if response_cache is not None and not plan.get('fallback') and not self.degraded():
+                response_cache.set(cache_key, result)
+            yield "done", self._stream_meta(result)
+
+        except InvalidPageTokenError as e:
+            yield "error", {'message': str(e)}
+        except LLMOverloadedError as e:
+            yield "error", {'message': self._error_message(e), 'status': e.status_code,
+                            'retry_after': round(e.retry_after, 1)}
         except Exception as e:
-            logger.error(f"Lỗi không xác định khi xử lý câu hỏi: {str(e)}")
-            return f"Xin lỗi, đã xảy ra lỗi khi xử lý câu hỏi của bạn: {str(e)}"
\ No newline at end of file
+            yield "error", {'message': self._error_message(e)}
+
+    def _stream_meta(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'scenario': result['scenario'],
+            'total': result['total'],
+            'next_page_token': result['next_page_token'],
+        }
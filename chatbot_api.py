@@ -2,19 +2,35 @@ import os
 import logging
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
+import json
+import math
+import time
+import uuid
+import threading
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
 
 from data import Database
+from migrations import bootstrap
 from chatbot import ChatBot
+from pagination import InvalidPageTokenError, decode_page_token
+from llm_client import LLMOverloadedError
+from log_setup import setup_logging, request_id_var
+from metrics import registry, trace_request
+from shared_cache import backend_from_env
+from popular import PopularAnswersJob
+
+try:
+    # orjson nhanh hơn đáng kể khi trả về danh sách sản phẩm lớn
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='chatbot_api.log'
-)
 logger = logging.getLogger('chatbot_api')
 load_dotenv()
 
@@ -22,17 +38,150 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_USER = os.getenv("DB_USER", "admin")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "123456")
 DB_NAME = os.getenv("DB_NAME", "web_tmdt")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "50"))
+# text: chỉ trả về văn bản (mặc định, tương thích client cũ); json: danh sách sản phẩm có cấu trúc; both: cả hai
+RESPONSE_FORMATS = ("text", "json", "both")
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "100"))
+# Gửi header này (giá trị bất kỳ) để nhận thêm bảng thời gian từng bước trong câu trả lời của /api/chat
+DEBUG_TIMING_HEADER = os.getenv("DEBUG_TIMING_HEADER", "X-Debug-Timing")
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+# Cột dùng làm mốc thay đổi danh mục; bảng không có cột này thì danh mục chỉ làm mới theo TTL
+# (enable_catalog_cache kiểm tra khi khởi động). Đặt rỗng để tắt hẳn
+CATALOG_WATERMARK_COLUMN = os.getenv("CATALOG_WATERMARK_COLUMN", "updated_at")
+# Tự thêm cột name_normalized và các chỉ mục khi khởi động (xem migrations.py)
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "0") == "1"
+# Nạp trước danh mục ở nền ngay khi worker khởi động xong
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+# Dựng sẵn câu trả lời cho các câu hỏi phổ biến nhất trong log (xem popular.py)
+POPULAR_ANSWERS = os.getenv("POPULAR_ANSWERS", "1") == "1"
+# Số giây giữa hai lần kiểm tra mã vô hiệu hóa danh mục trong kho dùng chung (xem sync_invalidation)
+INVALIDATION_CHECK_INTERVAL = float(os.getenv("INVALIDATION_CHECK_INTERVAL", "1"))
+INVALIDATION_NAMESPACE = "invalidation"
+INVALIDATION_TTL = 365 * 24 * 3600
+
+# Database và ChatBot được tạo riêng cho từng worker trong lifespan (hoặc ở request đầu tiên),
+# không tạo lúc import: chạy nhiều worker (uvicorn --workers, gunicorn --preload) không chia sẻ
+# kết nối qua fork. Đặt SHARED_CACHE=file để các worker dùng chung cache câu trả lời và danh mục
+db: Optional[Database] = None
+chatbot: Optional[ChatBot] = None
+shared_cache = None
+_init_lock = threading.Lock()
+# Mã lần vô hiệu hóa danh mục mà worker này đã áp dụng và thời điểm kiểm tra gần nhất
+_invalidation_seen: Optional[str] = None
+_invalidation_checked_at = 0.0
+# Đang nạp trước sau khi khởi tạo; worker sẵn sàng khi đã khởi tạo và không còn nạp trước
+_warming = False
+_started_at = time.time()
+# Các endpoint kiểm tra sức khỏe trả lời ngay, không chờ khởi tạo
+HEALTH_PATHS = ("/api/health", "/api/health/live", "/api/health/ready")
+
+
+def init_resources(database: Optional[Database] = None) -> ChatBot:
+    """
+    Tạo Database và ChatBot cho worker hiện tại; các lần gọi sau trả về ChatBot đã tạo.
+    database: dùng Database có sẵn thay vì kết nối MySQL theo biến môi trường
+    """
+    global db, chatbot, shared_cache
+    with _init_lock:
+        if chatbot is not None:
+            return chatbot
+        setup_logging('chatbot_api.log')
+        started = time.perf_counter()
+        shared_cache = backend_from_env()
+        sync_invalidation(force=True)
+        if database is None:
+            logger.info(f"Kết nối đến database: {DB_NAME} trên host: {DB_HOST}")
+            database = Database(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, pool_size=DB_POOL_SIZE)
+        bootstrap(database, apply=DB_AUTO_MIGRATE)
+        if CATALOG_CACHE_TTL > 0:
+            database.enable_catalog_cache(ttl=CATALOG_CACHE_TTL, watermark_column=CATALOG_WATERMARK_COLUMN or None,
+                                          shared=shared_cache)
+        db = database
+        chatbot = ChatBot(database, shared_cache=shared_cache)
+        logger.info(f"Worker {os.getpid()} đã khởi tạo trong {time.perf_counter() - started:.2f}s")
+        return chatbot
+
+
+def sync_invalidation(force: bool = False) -> None:
+    """
+    Áp dụng lần vô hiệu hóa danh mục do worker khác thực hiện: /api/catalog/invalidate ghi một mã mới
+    vào kho dùng chung, mỗi worker so với mã đã áp dụng (tối đa mỗi INVALIDATION_CHECK_INTERVAL giây)
+    và bỏ ảnh chụp danh mục, cache câu trả lời, bảng câu hỏi phổ biến trong tiến trình của mình.
+    Không có kho dùng chung (SHARED_CACHE rỗng) thì mỗi worker độc lập, việc này không làm gì
+    """
+    global _invalidation_seen, _invalidation_checked_at
+    if shared_cache is None:
+        return
+    now = time.monotonic()
+    if not force and now - _invalidation_checked_at < INVALIDATION_CHECK_INTERVAL:
+        return
+    _invalidation_checked_at = now
+    current = shared_cache.get(INVALIDATION_NAMESPACE, "catalog")
+    if current == _invalidation_seen:
+        return
+    # Lần kiểm tra lúc khởi tạo chỉ ghi nhận mã hiện có, chưa có dữ liệu cũ để bỏ
+    if not force:
+        drop_catalog_caches(include_shared=False)
+        logger.info(f"Worker {os.getpid()} áp dụng lần vô hiệu hóa danh mục {current} của worker khác")
+    _invalidation_seen = current
+
+
+def drop_catalog_caches(include_shared: bool = True) -> None:
+    """
+    Bỏ ảnh chụp danh mục và các câu trả lời đã lưu (có thể chứa dữ liệu danh mục cũ)
+    """
+    if db is not None and db.catalog is not None:
+        db.catalog.invalidate(include_shared=include_shared)
+    if chatbot is not None:
+        if chatbot.response_cache is not None:
+            chatbot.response_cache.clear(include_shared=include_shared)
+        chatbot.popular.clear()
+
+
+async def warm_up() -> None:
+    """
+    Nạp trước mô hình Gemini và danh mục để request đầu tiên không phải chờ
+    """
+    started = time.perf_counter()
+    try:
+        await run_in_threadpool(chatbot.load_models)
+        products = await db.warm_up_async()
+        logger.info(f"Worker {os.getpid()} đã nạp trước {products} sản phẩm trong {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"Lỗi khi nạp trước: {str(e)}")
+
+
+async def start_up() -> None:
+    """
+    Khởi tạo ở nền sau khi server đã mở cổng, để kiểm tra liveness trả lời được ngay trong lúc khởi động
+    """
+    global _warming
+    _warming = STARTUP_WARMUP
+    while True:
+        try:
+            await run_in_threadpool(init_resources)
+            break
+        except Exception as e:
+            logger.error(f"Lỗi khi khởi tạo Chatbot API, thử lại sau 5s: {str(e)}")
+            await asyncio.sleep(5)
+    if STARTUP_WARMUP:
+        await warm_up()
+        _warming = False
+    logger.info(f"Chatbot API đã sẵn sàng phục vụ sau {time.time() - _started_at:.2f}s")
+    if POPULAR_ANSWERS:
+        await PopularAnswersJob.from_env(chatbot).run()
 
-logger.info(f"Kết nối đến database: {DB_NAME} trên host: {DB_HOST}")
-db = Database(DB_HOST, DB_USER, DB_PASSWORD, DB_NAME)
-chatbot = ChatBot(db)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("Chatbot API đã khởi động và sẵn sàng phục vụ")
+    task = asyncio.create_task(start_up())
+    logger.info("Chatbot API đã khởi động, đang khởi tạo")
     yield
-    db.close()
-    logger.info("Đã đóng kết nối database.")
+    task.cancel()
+    if db is not None:
+        db.close()
+        logger.info("Đã đóng kết nối database.")
 
 
 app = FastAPI(lifespan=lifespan)
@@ -45,34 +194,310 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def ensure_resources(request: Request, call_next):
+    # Request đến trong lúc đang khởi tạo thì chờ khởi tạo xong; server không chạy lifespan
+    # (một số ASGI server, client kiểm thử) thì khởi tạo ở request đầu tiên
+    if chatbot is None and request.url.path not in HEALTH_PATHS:
+        await run_in_threadpool(init_resources)
+    if request.url.path not in HEALTH_PATHS:
+        sync_invalidation()
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Mã yêu cầu xuất hiện trong mọi dòng log của request này và được trả lại cho client
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
 async def run_async(coro):
     return await coro
 
 
+def overload_exception(error: LLMOverloadedError) -> HTTPException:
+    """
+    Quá tải thì trả 429/503 kèm Retry-After để client lùi lại thay vì xếp hàng thêm
+    """
+    return HTTPException(
+        status_code=error.status_code,
+        detail="Hệ thống đang quá tải, vui lòng thử lại sau",
+        headers={'Retry-After': str(max(1, math.ceil(error.retry_after)))}
+    )
+
+
 @app.post("/api/chat")
 async def chat(request: Request):
     try:
         data = await request.json()
         user_message = data.get('message', '')
+        page_token = data.get('page_token')
+        page_size = data.get('page_size')
+        response_format = data.get('response_format', 'text')
+        session_id = data.get('session_id')
 
-        if not user_message:
+        if not user_message and not page_token:
             raise HTTPException(status_code=400, detail="Không có tin nhắn được cung cấp")
+        if page_size is not None and (not isinstance(page_size, int) or not 1 <= page_size <= MAX_PAGE_SIZE):
+            raise HTTPException(status_code=400, detail=f"page_size phải nằm trong khoảng 1-{MAX_PAGE_SIZE}")
+        if response_format not in RESPONSE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"response_format phải là một trong {RESPONSE_FORMATS}")
 
         logger.info(f"Nhận được tin nhắn: {user_message}")
-        response = await chatbot.process_query(user_message)
-        logger.info(f"Trả lời: {response}")
-        return JSONResponse(content={
+        with trace_request() as trace:
+            scenario = None
+            try:
+                result = await chatbot.handle_query(
+                    user_message, page_size=page_size, page_token=page_token,
+                    render_text=response_format != 'json', session_id=session_id
+                )
+                scenario = result['scenario']
+            finally:
+                trace.finish(scenario, endpoint="chat")
+        logger.info(f"Trả lời: {result['response']}")
+        content = {
             'status': 'success',
-            'response': response
-        })
+            'response': result['response'],
+            'total': result['total'],
+            'next_page_token': result['next_page_token']
+        }
+        if response_format != 'text':
+            content['products'] = result['products']
+        if request.headers.get(DEBUG_TIMING_HEADER):
+            content['timing'] = trace.breakdown()
+        return FastJSONResponse(content=content)
+    except HTTPException:
+        raise
+    except InvalidPageTokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LLMOverloadedError as e:
+        logger.warning(f"Từ chối tin nhắn do quá tải: {str(e)}")
+        raise overload_exception(e)
     except Exception as e:
         logger.error(f"Lỗi xử lý tin nhắn: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi server")
+
+
+@app.post("/api/chat/batch")
+async def chat_batch(request: Request):
+    try:
+        data = await request.json()
+        messages = data.get('messages')
+        page_size = data.get('page_size')
+        response_format = data.get('response_format', 'text')
+        concurrency = data.get('concurrency')
+
+        if not isinstance(messages, list) or not messages or not all(isinstance(m, str) and m for m in messages):
+            raise HTTPException(status_code=400, detail="messages phải là danh sách tin nhắn không rỗng")
+        if len(messages) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BATCH_SIZE} tin nhắn mỗi lần")
+        if page_size is not None and (not isinstance(page_size, int) or not 1 <= page_size <= MAX_PAGE_SIZE):
+            raise HTTPException(status_code=400, detail=f"page_size phải nằm trong khoảng 1-{MAX_PAGE_SIZE}")
+        if response_format not in RESPONSE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"response_format phải là một trong {RESPONSE_FORMATS}")
+        if concurrency is not None and (not isinstance(concurrency, int) or not 1 <= concurrency <= chatbot.batch_concurrency):
+            raise HTTPException(status_code=400, detail=f"concurrency phải nằm trong khoảng 1-{chatbot.batch_concurrency}")
+
+        if chatbot.llm.is_saturated():
+            raise overload_exception(LLMOverloadedError("Hàng đợi gọi Gemini đã đầy"))
+
+        logger.info(f"Nhận được {len(messages)} tin nhắn (batch)")
+        with trace_request() as trace:
+            try:
+                results = await chatbot.process_queries(
+                    messages, page_size=page_size, render_text=response_format != 'json', concurrency=concurrency
+                )
+            finally:
+                trace.finish("batch", endpoint="batch")
+        items = []
+        for result in results:
+            item = {
+                'response': result['response'],
+                'total': result['total'],
+                'next_page_token': result['next_page_token']
+            }
+            if response_format != 'text':
+                item['products'] = result['products']
+            items.append(item)
+        content = {'status': 'success', 'results': items}
+        if request.headers.get(DEBUG_TIMING_HEADER):
+            content['timing'] = trace.breakdown()
+        return FastJSONResponse(content=content)
+    except HTTPException:
+        raise
+    except LLMOverloadedError as e:
+        logger.warning(f"Từ chối batch tin nhắn do quá tải: {str(e)}")
+        raise overload_exception(e)
+    except Exception as e:
+        logger.error(f"Lỗi xử lý batch tin nhắn: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi server")
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: Request):
+    data = await request.json()
+    user_message = data.get('message', '')
+    page_token = data.get('page_token')
+    page_size = data.get('page_size')
+    session_id = data.get('session_id')
+
+    if not user_message and not page_token:
+        raise HTTPException(status_code=400, detail="Không có tin nhắn được cung cấp")
+    if page_size is not None and (not isinstance(page_size, int) or not 1 <= page_size <= MAX_PAGE_SIZE):
+        raise HTTPException(status_code=400, detail=f"page_size phải nằm trong khoảng 1-{MAX_PAGE_SIZE}")
+    if page_token:
+        try:
+            decode_page_token(page_token)
+        except InvalidPageTokenError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if chatbot.llm.is_saturated():
+        raise overload_exception(LLMOverloadedError("Hàng đợi gọi Gemini đã đầy"))
+
+    logger.info(f"Nhận được tin nhắn (streaming): {user_message}")
+
+    async def event_stream():
+        with trace_request() as trace:
+            scenario = None
+            try:
+                async for event, payload in chatbot.stream_query(
+                    user_message, page_size=page_size, page_token=page_token, session_id=session_id
+                ):
+                    if event == "done":
+                        scenario = payload.get('scenario')
+                    yield format_sse(event, payload)
+            finally:
+                trace.finish(scenario, endpoint="stream")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.post("/api/catalog/invalidate")
+async def invalidate_catalog():
+    if db.catalog is None:
+        raise HTTPException(status_code=404, detail="Bộ nhớ đệm danh mục chưa được bật")
+    global _invalidation_seen
+    drop_catalog_caches()
+    # Các worker khác thấy mã mới trong kho dùng chung và tự bỏ dữ liệu cũ (xem sync_invalidation);
+    # không bật SHARED_CACHE thì chỉ worker nhận request này được làm mới
+    if shared_cache is not None:
+        _invalidation_seen = uuid.uuid4().hex
+        shared_cache.set(INVALIDATION_NAMESPACE, "catalog", _invalidation_seen, INVALIDATION_TTL)
+    return JSONResponse(content={
+        'status': 'success',
+        'message': 'Đã vô hiệu hóa bộ nhớ đệm danh mục sản phẩm'
+    })
+
+
+@app.get("/api/catalog/stats")
+async def catalog_stats():
+    if db.catalog is None:
+        raise HTTPException(status_code=404, detail="Bộ nhớ đệm danh mục chưa được bật")
+    return JSONResponse(content={
+        'status': 'success',
+        'stats': db.catalog.stats()
+    })
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return JSONResponse(content={
+        'status': 'success',
+        'stats': chatbot.cache_stats()
+    })
+
+
+@app.get("/api/ai/stats")
+async def ai_stats():
+    return JSONResponse(content={
+        'status': 'success',
+        'stats': chatbot.ai_stats()
+    })
+
+
+@app.get("/api/metrics")
+async def metrics():
+    llm_stats = chatbot.llm.stats()
+    gauges = {
+        'chatbot_llm_active_calls': llm_stats['active'],
+        'chatbot_llm_waiting_calls': llm_stats['waiting'],
+        'chatbot_llm_rejected_calls': llm_stats['rejected'],
+        'chatbot_llm_retried_calls': llm_stats['retries'],
+        'chatbot_llm_coalesced_calls': llm_stats['coalesced'],
+        # 1 khi cầu dao Gemini đang mở (trả lời bằng chế độ cục bộ)
+        'chatbot_llm_circuit_open': int(llm_stats['breaker']['state'] != "closed"),
+        'chatbot_llm_circuit_opens': llm_stats['breaker']['opens'],
+        'chatbot_llm_circuit_rejected_calls': llm_stats['breaker']['rejected'],
+        'chatbot_active_sessions': len(chatbot.sessions),
+    }
+    for name, stats in chatbot.cache_stats().items():
+        if isinstance(stats, dict) and 'hit_rate' in stats:
+            gauges[f'chatbot_{name}_cache_hit_rate'] = stats['hit_rate']
+    if db.catalog is not None:
+        gauges['chatbot_catalog_hit_rate'] = db.catalog.stats()['hit_rate']
+    return PlainTextResponse(registry.render(gauges), media_type="text/plain; version=0.0.4")
+
+
+@app.delete("/api/sessions/{session_id}")
+async def end_session(session_id: str):
+    if not chatbot.sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail="Không tìm thấy phiên chat")
+    return JSONResponse(content={
+        'status': 'success',
+        'message': 'Đã kết thúc phiên chat'
+    })
+
+
+def is_ready() -> bool:
+    return chatbot is not None and not _warming
+
+
+@app.get("/api/health/live")
+async def liveness():
+    # Tiến trình còn chạy và event loop còn phản hồi; không phụ thuộc database hay Gemini
+    return JSONResponse(content={
+        'status': 'alive',
+        'uptime': round(time.time() - _started_at, 3)
+    })
+
+
+@app.get("/api/health/ready")
+async def readiness():
+    if not is_ready():
+        return JSONResponse(status_code=503, content={'status': 'starting'})
+    database_ok = await db.ping_async()
+    return JSONResponse(status_code=200 if database_ok else 503, content={
+        'status': 'ready' if database_ok else 'unavailable',
+        'database': 'ok' if database_ok else 'unavailable'
+    })
 
 
 @app.get("/api/health")
 async def health_check():
+    database = 'starting'
+    if db is not None:
+        database = 'ok' if await db.ping_async() else 'unavailable'
     return JSONResponse(content={
         'status': 'online',
-        'message': 'Chatbot API đang hoạt động'
+        'message': 'Chatbot API đang hoạt động',
+        'ready': is_ready(),
+        'database': database,
+        # Gemini lỗi không làm API mất sẵn sàng: câu hỏi về danh mục vẫn được trả lời bằng chế độ cục bộ
+        'gemini': chatbot.llm.breaker.stats() if chatbot is not None else 'starting',
+        'degraded': chatbot.degraded() if chatbot is not None else False
     })
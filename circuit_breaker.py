@@ -0,0 +1,113 @@
+import os
+import time
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('chatbot')
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Cầu dao cho một dịch vụ bên ngoài (Gemini): sau failure_threshold lỗi liên tiếp thì mở,
+    mọi lượt gọi bị từ chối ngay trong recovery_timeout giây; hết thời gian đó cho một lượt gọi thử,
+    thành công thì đóng lại, thất bại thì mở tiếp
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+        self.opens = 0
+        self.rejected = 0
+        self.failures = 0
+        self.successes = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        return cls(
+            name,
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30")),
+        )
+
+    def _cooled_down(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at >= self.recovery_timeout
+
+    def _probe_pending(self) -> bool:
+        # Lượt gọi thử không báo kết quả (bị hủy giữa chừng) thì sau recovery_timeout cho thử lượt khác
+        return self._probe_started is not None and time.monotonic() - self._probe_started < self.recovery_timeout
+
+    def available(self) -> bool:
+        """
+        Có thể gọi dịch vụ: cầu dao đóng, hoặc đã hết thời gian chờ và chưa có lượt gọi thử nào đang chạy.
+        Không thay đổi trạng thái, dùng để chọn chế độ xử lý trước khi gọi
+        """
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_OPEN:
+            return self._cooled_down()
+        return not self._probe_pending()
+
+    def retry_after(self) -> float:
+        """
+        Số giây còn lại trước khi được gọi thử
+        """
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        """
+        Xin phép thực hiện một lượt gọi; False nghĩa là phải từ chối ngay
+        """
+        if self.state == STATE_OPEN and self._cooled_down():
+            self.state = STATE_HALF_OPEN
+            self._probe_started = None
+            logger.info(f"Cầu dao {self.name}: thử gọi lại sau {self.recovery_timeout:.0f}s")
+        if self.state == STATE_CLOSED:
+            return True
+        if self.state == STATE_HALF_OPEN and not self._probe_pending():
+            self._probe_started = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        if self.state != STATE_CLOSED:
+            logger.info(f"Cầu dao {self.name}: dịch vụ đã phục hồi, đóng lại")
+        self.state = STATE_CLOSED
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != STATE_OPEN:
+                self.opens += 1
+                logger.warning(f"Cầu dao {self.name}: mở sau {self.consecutive_failures} lỗi liên tiếp, "
+                               f"tạm ngừng gọi trong {self.recovery_timeout:.0f}s")
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+            self._probe_started = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'open_for': round(time.monotonic() - self.opened_at, 3) if self.opened_at is not None else None,
+            'opens': self.opens,
+            'rejected': self.rejected,
+            'failures': self.failures,
+            'successes': self.successes,
+        }
@@ -1,104 +1,399 @@
-import mysql.connector
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import contextvars
+import threading
+import asyncio
 import logging
+import time
 import os
 
+from catalog import CatalogCache, CatalogUnavailableError
+from metrics import timed
+from text_utils import fold_diacritics
+
 # Database class for handling all database operations
 logger = logging.getLogger('chatbot')
+
+# Các cột trả về cho danh sách sản phẩm: bản rút gọn cho payload JSON, bản đầy đủ để hiển thị văn bản
+PRODUCT_SUMMARY_COLUMNS = "p.id, p.name, p.price, p.sale, p.image, b.name as brand"
+PRODUCT_DETAIL_COLUMNS = PRODUCT_SUMMARY_COLUMNS + ", p.description, p.specification"
+PRODUCT_SOURCE = "products p LEFT JOIN brands b ON p.brand_id = b.id"
+# Điều kiện và thứ tự của các danh sách phân trang; p.id giữ thứ tự ổn định giữa các trang khi trùng giá.
+# migrations.py chạy EXPLAIN trên đúng các truy vấn dựng từ đây
+BRAND_CONDITION = "p.brand_id = %s"
+PAGE_ORDER = "p.price, p.id"
+
+
+def price_condition(min_price: Optional[float], max_price: Optional[float],
+                    max_inclusive: bool = False) -> Tuple[str, List[Any]]:
+    """
+    Điều kiện cho khoảng giá [min_price, max_price) (hoặc [min_price, max_price] nếu max_inclusive)
+    """
+    conditions, params = [], []
+    if min_price is not None:
+        conditions.append("p.price >= %s")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("p.price <= %s" if max_inclusive else "p.price < %s")
+        params.append(max_price)
+    return " AND ".join(conditions) or "p.price IS NOT NULL", params
+
+
+def count_query(source: str, where: str) -> str:
+    return f"SELECT COUNT(*) AS total FROM {source} WHERE {where}"
+
+
+def page_query(select: str, source: str, where: str, order_by: str) -> str:
+    """
+    Một trang kết quả; tham số là tham số của where rồi đến LIMIT và OFFSET
+    """
+    return f"SELECT {select} FROM {source} WHERE {where} ORDER BY {order_by} LIMIT %s OFFSET %s"
+
+
+def batch_count_query(source: str, wheres: List[str]) -> str:
+    """
+    Đếm số dòng cho nhiều điều kiện trong một truy vấn (cột total_i);
+    tham số là tham số của các điều kiện, lặp lại hai lần
+    """
+    counts = ", ".join(f"SUM(CASE WHEN {where} THEN 1 ELSE 0 END) AS total_{i}" for i, where in enumerate(wheres))
+    any_where = " OR ".join(f"({where})" for where in wheres)
+    return f"SELECT {counts} FROM {source} WHERE {any_where}"
+
+
+def batch_page_query(select: str, source: str, slots: List[Tuple[int, str]], order_by: str) -> str:
+    """
+    Trang đầu cho nhiều điều kiện (số thứ tự, điều kiện) gộp bằng UNION ALL, cột batch_slot cho biết
+    dòng thuộc điều kiện nào; tham số là tham số của từng điều kiện kèm LIMIT
+    """
+    return " UNION ALL ".join(
+        f"SELECT * FROM (SELECT {select}, {i} AS batch_slot FROM {source} WHERE {where} "
+        f"ORDER BY {order_by} LIMIT %s) AS page_{i}"
+        for i, where in slots
+    )
+
+
+# Tra tên chính xác qua cột name_normalized (chữ thường, bỏ dấu; xem migrations.py).
+# ref_or_null trên chỉ mục: các dòng chưa được điền name_normalized vẫn so theo LOWER(name)
+EXACT_NAME_QUERY = """
+    SELECT * FROM products
+    WHERE (name_normalized = %s OR name_normalized IS NULL)
+      AND (name_normalized = %s OR LOWER(name) = LOWER(%s))
+    LIMIT 1
+"""
+LEGACY_EXACT_NAME_QUERY = "SELECT * FROM products WHERE LOWER(name) = LOWER(%s)"
+BRAND_PRODUCTS_QUERY = """
+    SELECT p.id, p.name, p.price, p.description, p.specification, p.image, p.sale, b.name as brand
+    FROM products p
+    JOIN brands b ON p.brand_id = b.id
+    WHERE p.brand_id = %s
+"""
+
+# Tên gọi khác của thương hiệu (đã bỏ dấu) -> tên thương hiệu trong bảng brands
+BRAND_ALIASES = {
+    "adidas": ["adi", "addidas", "adidass"],
+    "nike": ["naiki", "nai ki"],
+    "converse": ["cvs", "convers"],
+    "puma": ["pumma"],
+    "vans": ["van"],
+}
+
 class Database:
-    def __init__(self, host: str, user: str, password: str, database: str):
+    def __init__(self, host: str, user: str, password: str, database: str, pool_size: Optional[int] = None):
         """
         Khởi tạo kết nối đến database MySQL
+
+        Nếu có pool_size, dùng connection pool và mỗi lần truy vấn mượn một kết nối riêng;
+        nếu không, dùng một kết nối duy nhất được bảo vệ bằng khóa.
         """
+        self.pool_size = pool_size
+        self.pool = None
+        self.connection = None
+        self.cursor = None
+        self._lock = threading.Lock()
+        # Các kết nối đang được mượn từ pool, để close() đóng cả những kết nối chưa được trả về
+        self._borrowed: set = set()
+        self._borrowed_lock = threading.Lock()
+        self.catalog: Optional[CatalogCache] = None
+        # Được bootstrap (migrations.py) bật khi bảng products đã có cột name_normalized
+        self.normalized_names = False
+        self.brand_ids: Optional[Dict[str, int]] = None
+        self.brand_alias_ttl = float(os.getenv("BRAND_ALIAS_TTL", "300"))
+        self._brand_ids_loaded_at = 0.0
         try:
-            self.connection = mysql.connector.connect(
-                host=host,
-                user=user,
-                password=password,
-                database=database
-            )
-            self.cursor = self.connection.cursor(dictionary=True)
-            logger.info("Đã kết nối thành công đến MySQL database")
+            # Import khi tạo kết nối để import data.py (và các lớp con như bản SQLite của benchmark) không phải nạp driver
+            import mysql.connector
+            from mysql.connector import pooling
+
+            config = {
+                "host": host,
+                "user": user,
+                "password": password,
+                "database": database,
+            }
+            if pool_size:
+                self.pool = pooling.MySQLConnectionPool(
+                    pool_name="tmdt_pool",
+                    pool_size=pool_size,
+                    pool_reset_session=True,
+                    **config
+                )
+                logger.info(f"Đã tạo connection pool MySQL với {pool_size} kết nối")
+            else:
+                self.connection = mysql.connector.connect(**config)
+                self.cursor = self.connection.cursor(dictionary=True)
+                logger.info("Đã kết nối thành công đến MySQL database")
+            # Thread pool riêng để gọi các truy vấn đồng bộ mà không chặn event loop
+            self._executor = ThreadPoolExecutor(max_workers=pool_size or 1, thread_name_prefix="db")
         except Exception as e:
             logger.error(f"Lỗi kết nối database: {str(e)}")
             raise
 
+    def _ensure_connected(self, connection) -> bool:
+        """
+        Kiểm tra kết nối, tự kết nối lại nếu bị ngắt. Trả về True nếu đã kết nối lại
+        """
+        if connection.is_connected():
+            return False
+        logger.warning("Mất kết nối database, đang kết nối lại")
+        connection.reconnect(attempts=3, delay=1)
+        return True
+
+    @contextmanager
+    def _cursor(self):
+        """
+        Mượn một cursor cho một lần truy vấn
+        """
+        if self.pool is not None:
+            connection = self.pool.get_connection()
+            with self._borrowed_lock:
+                self._borrowed.add(connection)
+            try:
+                self._ensure_connected(connection)
+                cursor = connection.cursor(dictionary=True)
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+            finally:
+                with self._borrowed_lock:
+                    self._borrowed.discard(connection)
+                # Trả kết nối về pool
+                connection.close()
+        else:
+            with self._lock:
+                if self._ensure_connected(self.connection):
+                    self.cursor = self.connection.cursor(dictionary=True)
+                yield self.cursor
+
+    def ping(self) -> bool:
+        """
+        Kiểm tra tình trạng kết nối database
+        """
+        try:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT 1 AS ok")
+                cursor.fetchall()
+            return True
+        except Exception as e:
+            logger.error(f"Kiểm tra kết nối database thất bại: {str(e)}")
+            return False
+
+    def enable_catalog_cache(self, ttl: float = 300.0, watermark_column: Optional[str] = "updated_at",
+                             shared: Optional[Any] = None):
+        """
+        Bật bộ nhớ đệm danh mục sản phẩm trong tiến trình cho các truy vấn tra cứu.
+        watermark_column được thử truy vấn một lần; bảng products không có cột đó thì chỉ làm mới theo TTL.
+        shared: kho dùng chung giữa các worker (xem shared_cache.py)
+        """
+        watermark_loader = None
+        if watermark_column:
+            try:
+                self.get_catalog_watermark(watermark_column)
+                watermark_loader = functools.partial(self.get_catalog_watermark, watermark_column)
+            except Exception as e:
+                logger.warning(f"Không dùng được cột mốc {watermark_column} của bảng products, "
+                               f"danh mục chỉ làm mới theo TTL: {str(e)}")
+                watermark_column = None
+        self.catalog = CatalogCache(self.fetch_catalog, watermark_loader, ttl=ttl, shared=shared,
+                                    brand_resolver=self.lookup_brand_id)
+        logger.info(f"Đã bật bộ nhớ đệm danh mục sản phẩm (TTL: {ttl}s, mốc: {watermark_column})")
+        return self.catalog
+
+    @timed("db.fetch_catalog")
+    def fetch_catalog(self) -> List[Dict[str, Any]]:
+        """
+        Lấy toàn bộ danh mục sản phẩm kèm tên thương hiệu (dùng để nạp bộ nhớ đệm)
+        """
+        query = """
+            SELECT p.*, b.name as brand
+            FROM products p
+            LEFT JOIN brands b ON p.brand_id = b.id
+        """
+        with self._cursor() as cursor:
+            cursor.execute(query)
+            return cursor.fetchall()
+
+    @timed("db.get_catalog_watermark")
+    def get_catalog_watermark(self, column: str = "updated_at") -> tuple:
+        """
+        Mốc thay đổi của danh mục: thời điểm cập nhật mới nhất và số lượng sản phẩm
+        """
+        query = f"SELECT MAX({column}) AS watermark, COUNT(*) AS total FROM products"
+        with self._cursor() as cursor:
+            cursor.execute(query)
+            row = cursor.fetchone()
+        return row['watermark'], row['total']
+
+    def load_brand_aliases(self) -> Dict[str, int]:
+        """
+        Nạp bảng tra tên thương hiệu (đã bỏ dấu, kể cả BRAND_ALIASES) -> brand_id,
+        để tra thương hiệu không cần truy vấn LIKE trên bảng brands
+        """
+        with self._cursor() as cursor:
+            cursor.execute("SELECT id, name FROM brands ORDER BY id")
+            brands = cursor.fetchall()
+        brand_ids: Dict[str, int] = {}
+        for brand in brands:
+            brand_ids.setdefault(fold_diacritics(brand['name'] or "").strip(), brand['id'])
+        for name, aliases in BRAND_ALIASES.items():
+            if name in brand_ids:
+                for alias in aliases:
+                    brand_ids.setdefault(alias, brand_ids[name])
+        self.brand_ids = brand_ids
+        self._brand_ids_loaded_at = time.monotonic()
+        logger.info(f"Đã nạp {len(brands)} thương hiệu ({len(brand_ids)} tên gọi)")
+        return brand_ids
+
+    def brand_aliases(self) -> Dict[str, int]:
+        """
+        Bảng tên gọi thương hiệu -> brand_id, nạp ở lần gọi đầu tiên; trả về bảng rỗng nếu không nạp được
+        """
+        if self.brand_ids is None:
+            try:
+                self.load_brand_aliases()
+            except Exception as e:
+                logger.error(f"Lỗi khi nạp bảng tên thương hiệu: {str(e)}")
+                return {}
+        return self.brand_ids
+
+    def resolve_brand_id(self, cursor, brand_name: str) -> Optional[int]:
+        """
+        Tìm brand_id cho tên thương hiệu: tra bảng tên gọi đã nạp (trùng khớp, sau đó chứa chuỗi
+        cần tìm như LIKE '%brand%'); chưa nạp thì truy vấn bảng brands như trước
+        """
+        if self.brand_ids is not None and time.monotonic() - self._brand_ids_loaded_at > self.brand_alias_ttl:
+            try:
+                self.load_brand_aliases()
+            except Exception as e:
+                logger.error(f"Lỗi khi nạp lại bảng tên thương hiệu: {str(e)}")
+                self._brand_ids_loaded_at = time.monotonic()
+        if self.brand_ids is None:
+            cursor.execute("SELECT id FROM brands WHERE name LIKE %s", (f"%{brand_name}%",))
+            brand_result = cursor.fetchone()
+            # Đọc hết các dòng còn lại để có thể dùng lại cursor
+            cursor.fetchall()
+            return brand_result['id'] if brand_result else None
+        needle = fold_diacritics(brand_name).strip()
+        if not needle:
+            return None
+        if needle in self.brand_ids:
+            return self.brand_ids[needle]
+        # Dict giữ thứ tự chèn (theo id), giống thương hiệu đầu tiên mà LIKE trả về
+        return next((brand_id for name, brand_id in self.brand_ids.items() if needle in name), None)
+
+    def lookup_brand_id(self, brand_name: str) -> Optional[int]:
+        """
+        brand_id theo bảng tên gọi thương hiệu như resolve_brand_id nhưng không truy vấn bảng brands;
+        None nếu không tìm thấy hoặc không nạp được bảng tên gọi
+        """
+        if not self.brand_aliases():
+            return None
+        return self.resolve_brand_id(None, brand_name)
+
+    async def _run_async(self, func: Callable, *args, **kwargs):
+        """
+        Chạy một phương thức đồng bộ trên thread pool của database
+        """
+        loop = asyncio.get_running_loop()
+        # run_in_executor không tự truyền contextvars; chép ngữ cảnh để log và số liệu gắn đúng request
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, functools.partial(func, *args, **kwargs))
+
+    @timed("db.get_products_by_price")
     def get_products_by_price(self, max_price: float) -> List[Dict[str, Any]]:
         """
         Lấy danh sách sản phẩm có giá thấp hơn max_price
         """
+        if self.catalog is not None:
+            try:
+                return self.catalog.products_by_price(max_price)
+            except CatalogUnavailableError:
+                pass
         try:
             query = "SELECT * FROM products WHERE price < %s"
             logger.info(f"Thực thi truy vấn: {query} với giá: {max_price}")
-            self.cursor.execute(query, (max_price,))
-            results = self.cursor.fetchall()
+            with self._cursor() as cursor:
+                cursor.execute(query, (max_price,))
+                results = cursor.fetchall()
             logger.info(f"Tìm thấy {len(results)} sản phẩm có giá dưới {max_price}")
             return results
         except Exception as e:
             logger.error(f"Lỗi khi truy vấn sản phẩm theo giá: {str(e)}")
             return []
 
+    @timed("db.get_products_by_brand_name")
     def get_products_by_brand_name(self, brand_name: str) -> List[Dict[str, Any]]:
         """
         Lấy danh sách sản phẩm theo brand_name
         """
+        if self.catalog is not None:
+            try:
+                return self.catalog.products_by_brand_name(brand_name)
+            except CatalogUnavailableError:
+                pass
         try:
-            brand_query = "SELECT id FROM brands WHERE name LIKE %s"
-            self.cursor.execute(brand_query, (f"%{brand_name}%",))
-            brand_result = self.cursor.fetchone()
-            logger.info(f"Kết quả tìm kiếm thương hiệu: {brand_result}")
-
-            if not brand_result:
-                return []
-            brand_id = brand_result['id']  # Sử dụng dictionary cursor
-
-            product_query = """
-                SELECT p.id, p.name, p.price, p.description, p.specification, p.image, p.sale, b.name as brand
-                FROM products p
-                JOIN brands b ON p.brand_id = b.id
-                WHERE p.brand_id = %s
-            """
-            self.cursor.execute(product_query, (brand_id,))
-            return self.cursor.fetchall()
+            with self._cursor() as cursor:
+                brand_id = self.resolve_brand_id(cursor, brand_name)
+                logger.info(f"Kết quả tìm kiếm thương hiệu '{brand_name}': {brand_id}")
+                if brand_id is None:
+                    return []
+                cursor.execute(BRAND_PRODUCTS_QUERY, (brand_id,))
+                return cursor.fetchall()
         except Exception as e:
             logger.error(f"Lỗi khi lấy sản phẩm theo tên thương hiệu: {str(e)}")
             return []
 
+    @timed("db.search_products")
     def search_products(self, keyword: str) -> List[Dict[str, Any]]:
         """
         Tìm kiếm sản phẩm theo từ khóa trong tên hoặc mô tả
         """
+        if self.catalog is not None:
+            try:
+                return self.catalog.search_products(keyword)
+            except CatalogUnavailableError:
+                pass
         try:
             keywords = keyword.split()
-            conditions = []
-            params = []
-
-            for word in keywords:
-                conditions.append("name LIKE %s")
-                params.append(f"%{word}%")
 
             # tất cả từ khóa đều có mặt
-            query = f"SELECT * FROM products WHERE {' AND '.join(conditions)}"
+            conditions, params = self._search_condition(keywords, relaxed=False)
+            query = f"SELECT * FROM products WHERE {conditions}"
 
             logger.info(f"Thực thi truy vấn tìm kiếm với từ khóa: {keyword}")
-            self.cursor.execute(query, params)
-            results = self.cursor.fetchall()
-
-            # tìm với OR
-            if not results:
-                or_conditions = []
-                or_params = []
+            with self._cursor() as cursor:
+                cursor.execute(query, params)
+                results = cursor.fetchall()
 
-                for word in keywords:
-                    or_conditions.append("name LIKE %s")
-                    or_params.append(f"%{word}%")
-                    or_conditions.append("description LIKE %s")
-                    or_params.append(f"%{word}%")
-
-                or_query = f"SELECT * FROM products WHERE {' OR '.join(or_conditions)}"
-                logger.info(f"Thử lại với truy vấn OR: {or_query}")
-                self.cursor.execute(or_query, or_params)
-                results = self.cursor.fetchall()
+                # tìm với OR
+                if not results:
+                    or_conditions, or_params = self._search_condition(keywords, relaxed=True)
+                    or_query = f"SELECT * FROM products WHERE {or_conditions}"
+                    logger.info(f"Thử lại với truy vấn OR: {or_query}")
+                    cursor.execute(or_query, or_params)
+                    results = cursor.fetchall()
 
             logger.info(f"Tìm thấy {len(results)} sản phẩm phù hợp với từ khóa '{keyword}'")
             return results
@@ -106,24 +401,384 @@ class Database:
             logger.error(f"Lỗi khi tìm kiếm sản phẩm: {str(e)}")
             return []
 
+    def _search_condition(self, keywords: List[str], relaxed: bool, prefix: str = "") -> Tuple[str, List[Any]]:
+        """
+        Điều kiện tìm kiếm: AND trên tên, hoặc OR trên tên và mô tả khi nới lỏng
+        """
+        conditions = []
+        params = []
+        for word in keywords:
+            conditions.append(f"{prefix}name LIKE %s")
+            params.append(f"%{word}%")
+            if relaxed:
+                conditions.append(f"{prefix}description LIKE %s")
+                params.append(f"%{word}%")
+        return f" {'OR' if relaxed else 'AND'} ".join(conditions), params
+
+    def _fetch_page(self, cursor, select: str, source: str, where: str, params: List[Any],
+                    order_by: str, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Đếm tổng số dòng và lấy một trang kết quả
+        """
+        cursor.execute(count_query(source, where), params)
+        total = cursor.fetchone()['total']
+        if total <= offset:
+            return [], total
+        cursor.execute(page_query(select, source, where, order_by), list(params) + [limit, offset])
+        return cursor.fetchall(), total
+
+    def _fetch_first_pages(self, cursor, select: str, source: str, conditions: List[Tuple[str, List[Any]]],
+                           order_by: str, limit: int) -> List[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Lấy trang đầu cho nhiều điều kiện cùng lúc: một truy vấn đếm (SUM CASE) và một truy vấn
+        UNION ALL có LIMIT cho từng điều kiện, thay vì hai truy vấn cho mỗi điều kiện
+        """
+        if not conditions:
+            return []
+        count_params = [param for _, params in conditions for param in params] * 2
+        cursor.execute(batch_count_query(source, [where for where, _ in conditions]), count_params)
+        row = cursor.fetchone() or {}
+        totals = [int(row.get(f"total_{i}") or 0) for i in range(len(conditions))]
+
+        slots, params = [], []
+        for i, (where, where_params) in enumerate(conditions):
+            if totals[i]:
+                slots.append((i, where))
+                params.extend(list(where_params) + [limit])
+        pages: List[List[Dict[str, Any]]] = [[] for _ in conditions]
+        if slots:
+            cursor.execute(batch_page_query(select, source, slots, order_by), params)
+            for product in cursor.fetchall():
+                pages[product.pop('batch_slot')].append(product)
+        return list(zip(pages, totals))
+
+    @timed("db.get_products_by_price_ranges_page")
+    def get_products_by_price_ranges_page(self, ranges: List[Tuple[Optional[float], Optional[float], bool]],
+                                          limit: int, summary: bool = False) -> List[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Lấy trang đầu cho nhiều khoảng giá (min_price, max_price, max_inclusive) trong hai lượt truy vấn.
+        Kết quả theo đúng thứ tự của ranges
+        """
+        if self.catalog is not None:
+            try:
+                results = []
+                for min_price, max_price, max_inclusive in ranges:
+                    products = self.catalog.products_by_price_range(min_price, max_price, max_inclusive)
+                    results.append((products[:limit], len(products)))
+                return results
+            except CatalogUnavailableError:
+                pass
+        conditions = [price_condition(min_price, max_price, max_inclusive)
+                      for min_price, max_price, max_inclusive in ranges]
+        try:
+            logger.info(f"Truy vấn gộp {len(ranges)} khoảng giá (limit: {limit})")
+            with self._cursor() as cursor:
+                return self._fetch_first_pages(
+                    cursor, PRODUCT_SUMMARY_COLUMNS if summary else PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE,
+                    conditions, PAGE_ORDER, limit
+                )
+        except Exception as e:
+            logger.error(f"Lỗi khi truy vấn gộp sản phẩm theo khoảng giá: {str(e)}")
+            return [([], 0) for _ in ranges]
+
+    @timed("db.get_products_by_brand_names_page")
+    def get_products_by_brand_names_page(self, brand_names: List[str], limit: int,
+                                         summary: bool = False) -> List[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Lấy trang đầu sản phẩm cho nhiều thương hiệu: tra tất cả thương hiệu trong một truy vấn,
+        sau đó lấy sản phẩm bằng _fetch_first_pages. Kết quả theo đúng thứ tự của brand_names
+        """
+        if self.catalog is not None:
+            try:
+                results = []
+                for brand_name in brand_names:
+                    products = self.catalog.products_by_brand_name(brand_name)
+                    results.append((products[:limit], len(products)))
+                return results
+            except CatalogUnavailableError:
+                pass
+        if not brand_names:
+            return []
+        try:
+            with self._cursor() as cursor:
+                if self.brand_ids is not None:
+                    brand_ids = [self.resolve_brand_id(cursor, brand_name) for brand_name in brand_names]
+                else:
+                    where = " OR ".join("name LIKE %s" for _ in brand_names)
+                    cursor.execute(f"SELECT id, name FROM brands WHERE {where} ORDER BY id",
+                                   [f"%{brand_name}%" for brand_name in brand_names])
+                    brands = cursor.fetchall()
+
+                    # Giống get_products_by_brand_name_page: lấy thương hiệu đầu tiên có chứa chuỗi cần tìm
+                    brand_ids = []
+                    for brand_name in brand_names:
+                        needle = brand_name.lower()
+                        brand_ids.append(next((b['id'] for b in brands if needle in b['name'].lower()), None))
+
+                unique_ids = list(dict.fromkeys(brand_id for brand_id in brand_ids if brand_id is not None))
+                pages = self._fetch_first_pages(
+                    cursor, PRODUCT_SUMMARY_COLUMNS if summary else PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE,
+                    [(BRAND_CONDITION, [brand_id]) for brand_id in unique_ids], PAGE_ORDER, limit
+                )
+            by_id = dict(zip(unique_ids, pages))
+            return [by_id.get(brand_id, ([], 0)) for brand_id in brand_ids]
+        except Exception as e:
+            logger.error(f"Lỗi khi truy vấn gộp sản phẩm theo thương hiệu: {str(e)}")
+            return [([], 0) for _ in brand_names]
+
+    @timed("db.get_products_by_price_page")
+    def get_products_by_price_page(self, max_price: float, limit: int, offset: int = 0,
+                                   summary: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Lấy một trang sản phẩm có giá thấp hơn max_price (sắp xếp theo giá) kèm tổng số sản phẩm.
+        summary=True chỉ lấy các cột cần cho payload JSON
+        """
+        if self.catalog is not None:
+            try:
+                products = self.catalog.products_by_price(max_price)
+                return products[offset:offset + limit], len(products)
+            except CatalogUnavailableError:
+                pass
+        where, params = price_condition(None, max_price)
+        try:
+            logger.info(f"Truy vấn trang sản phẩm có giá dưới {max_price} (limit: {limit}, offset: {offset})")
+            with self._cursor() as cursor:
+                return self._fetch_page(
+                    cursor, PRODUCT_SUMMARY_COLUMNS if summary else PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE,
+                    where, params, PAGE_ORDER, limit, offset
+                )
+        except Exception as e:
+            logger.error(f"Lỗi khi truy vấn sản phẩm theo giá: {str(e)}")
+            return [], 0
+
+    @timed("db.get_products_by_price_range_page")
+    def get_products_by_price_range_page(self, min_price: Optional[float], max_price: Optional[float],
+                                         limit: int, offset: int = 0, summary: bool = False,
+                                         max_inclusive: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Lấy một trang sản phẩm trong khoảng giá [min_price, max_price) (hoặc [min_price, max_price]
+        nếu max_inclusive), sắp xếp theo giá, kèm tổng số sản phẩm. None là không giới hạn phía đó
+        """
+        if self.catalog is not None:
+            try:
+                products = self.catalog.products_by_price_range(min_price, max_price, max_inclusive)
+                return products[offset:offset + limit], len(products)
+            except CatalogUnavailableError:
+                pass
+        where, params = price_condition(min_price, max_price, max_inclusive)
+        try:
+            logger.info(f"Truy vấn trang sản phẩm có giá từ {min_price} đến {max_price} "
+                        f"(limit: {limit}, offset: {offset})")
+            with self._cursor() as cursor:
+                return self._fetch_page(
+                    cursor, PRODUCT_SUMMARY_COLUMNS if summary else PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE,
+                    where, params, PAGE_ORDER, limit, offset
+                )
+        except Exception as e:
+            logger.error(f"Lỗi khi truy vấn sản phẩm theo khoảng giá: {str(e)}")
+            return [], 0
+
+    @timed("db.get_products_by_brand_name_page")
+    def get_products_by_brand_name_page(self, brand_name: str, limit: int, offset: int = 0,
+                                        summary: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Lấy một trang sản phẩm theo brand_name (sắp xếp theo giá) kèm tổng số sản phẩm
+        """
+        if self.catalog is not None:
+            try:
+                products = self.catalog.products_by_brand_name(brand_name)
+                return products[offset:offset + limit], len(products)
+            except CatalogUnavailableError:
+                pass
+        try:
+            with self._cursor() as cursor:
+                brand_id = self.resolve_brand_id(cursor, brand_name)
+                if brand_id is None:
+                    return [], 0
+                return self._fetch_page(
+                    cursor, PRODUCT_SUMMARY_COLUMNS if summary else PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE,
+                    BRAND_CONDITION, [brand_id], PAGE_ORDER, limit, offset
+                )
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy sản phẩm theo tên thương hiệu: {str(e)}")
+            return [], 0
+
+    @timed("db.search_products_page")
+    def search_products_page(self, keyword: str, limit: int, offset: int = 0,
+                             summary: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Lấy một trang kết quả tìm kiếm kèm tổng số sản phẩm.
+        Dùng chỉ mục (xếp theo độ liên quan) nếu có, nếu không thì truy vấn SQL (xếp theo giá)
+        """
+        if self.catalog is not None:
+            try:
+                products = self.catalog.search_products(keyword)
+                return products[offset:offset + limit], len(products)
+            except CatalogUnavailableError:
+                pass
+        try:
+            keywords = keyword.split()
+            with self._cursor() as cursor:
+                conditions, params = self._search_condition(keywords, relaxed=False, prefix="p.")
+                cursor.execute(f"SELECT COUNT(*) AS total FROM products p WHERE {conditions}", params)
+                if cursor.fetchone()['total'] == 0:
+                    conditions, params = self._search_condition(keywords, relaxed=True, prefix="p.")
+                return self._fetch_page(
+                    cursor, PRODUCT_SUMMARY_COLUMNS if summary else PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE,
+                    f"({conditions})", params, PAGE_ORDER, limit, offset
+                )
+        except Exception as e:
+            logger.error(f"Lỗi khi tìm kiếm sản phẩm: {str(e)}")
+            return [], 0
+
+    @timed("db.get_product_by_exact_name")
     def get_product_by_exact_name(self, name: str) -> Optional[Dict[str, Any]]:
         """
         Lấy thông tin sản phẩm theo tên chính xác
         """
+        if self.catalog is not None:
+            try:
+                return self.catalog.product_by_exact_name(name)
+            except CatalogUnavailableError:
+                pass
         try:
-            query = "SELECT * FROM products WHERE LOWER(name) = LOWER(%s)"
+            if self.normalized_names:
+                normalized = fold_diacritics(name).strip()
+                query, params = EXACT_NAME_QUERY, (normalized, normalized, name)
+            else:
+                query, params = LEGACY_EXACT_NAME_QUERY, (name,)
             logger.info(f"Thực thi truy vấn tìm theo tên chính xác: {name}")
-            self.cursor.execute(query, (name,))
-            result = self.cursor.fetchone()
+            with self._cursor() as cursor:
+                cursor.execute(query, params)
+                result = cursor.fetchone()
+                cursor.fetchall()
             return result
         except Exception as e:
             logger.error(f"Lỗi khi tìm sản phẩm theo tên chính xác: {str(e)}")
             return None
 
+    def warm_up(self) -> int:
+        """
+        Mở sẵn kết nối và nạp trước danh mục vào bộ nhớ đệm (nếu đã bật), trả về số sản phẩm đã nạp
+        """
+        self.ping()
+        if self.catalog is None:
+            return 0
+        try:
+            return self.catalog.warm_up()
+        except CatalogUnavailableError:
+            return 0
+
+    def catalog_version(self) -> Any:
+        """
+        Phiên bản hiện tại của danh mục: số lần nạp lại của bộ nhớ đệm (nạp lại nếu đã hết hạn),
+        hoặc mốc thay đổi trong database khi chưa bật bộ nhớ đệm. None nếu không xác định được
+        """
+        if self.catalog is not None:
+            try:
+                self.catalog.warm_up()
+                return self.catalog.version()
+            except CatalogUnavailableError:
+                return None
+        try:
+            return self.get_catalog_watermark()
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy mốc thay đổi của danh mục: {str(e)}")
+            return None
+
+    @timed("db.match_product_names")
+    def match_product_names(self, query: str, limit: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Tìm sản phẩm theo tên gần đúng trên danh mục trong bộ nhớ, kèm điểm (0-1).
+        Trả về danh sách rỗng nếu chưa bật bộ nhớ đệm danh mục
+        """
+        if self.catalog is None:
+            return []
+        try:
+            return self.catalog.match_product_names(query, limit)
+        except CatalogUnavailableError:
+            return []
+
+    async def ping_async(self) -> bool:
+        return await self._run_async(self.ping)
+
+    async def warm_up_async(self) -> int:
+        return await self._run_async(self.warm_up)
+
+    async def catalog_version_async(self) -> Any:
+        return await self._run_async(self.catalog_version)
+
+    async def brand_aliases_async(self) -> Dict[str, int]:
+        if self.brand_ids is not None:
+            return self.brand_ids
+        return await self._run_async(self.brand_aliases)
+
+    async def get_products_by_price_async(self, max_price: float) -> List[Dict[str, Any]]:
+        return await self._run_async(self.get_products_by_price, max_price)
+
+    async def get_products_by_brand_name_async(self, brand_name: str) -> List[Dict[str, Any]]:
+        return await self._run_async(self.get_products_by_brand_name, brand_name)
+
+    async def search_products_async(self, keyword: str) -> List[Dict[str, Any]]:
+        return await self._run_async(self.search_products, keyword)
+
+    async def get_product_by_exact_name_async(self, name: str) -> Optional[Dict[str, Any]]:
+        return await self._run_async(self.get_product_by_exact_name, name)
+
+    async def match_product_names_async(self, query: str, limit: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        return await self._run_async(self.match_product_names, query, limit)
+
+    async def get_products_by_price_page_async(self, max_price: float, limit: int, offset: int = 0,
+                                               summary: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        return await self._run_async(self.get_products_by_price_page, max_price, limit, offset, summary)
+
+    async def get_products_by_price_range_page_async(self, min_price: Optional[float], max_price: Optional[float],
+                                                     limit: int, offset: int = 0, summary: bool = False,
+                                                     max_inclusive: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        return await self._run_async(self.get_products_by_price_range_page, min_price, max_price,
+                                     limit, offset, summary, max_inclusive)
+
+    async def get_products_by_price_ranges_page_async(self, ranges: List[Tuple[Optional[float], Optional[float], bool]],
+                                                      limit: int, summary: bool = False) -> List[Tuple[List[Dict[str, Any]], int]]:
+        return await self._run_async(self.get_products_by_price_ranges_page, ranges, limit, summary)
+
+    async def get_products_by_brand_names_page_async(self, brand_names: List[str], limit: int,
+                                                     summary: bool = False) -> List[Tuple[List[Dict[str, Any]], int]]:
+        return await self._run_async(self.get_products_by_brand_names_page, brand_names, limit, summary)
+
+    async def get_products_by_brand_name_page_async(self, brand_name: str, limit: int, offset: int = 0,
+                                                    summary: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        return await self._run_async(self.get_products_by_brand_name_page, brand_name, limit, offset, summary)
+
+    async def search_products_page_async(self, keyword: str, limit: int, offset: int = 0,
+                                         summary: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+        return await self._run_async(self.search_products_page, keyword, limit, offset, summary)
+
     def close(self):
+        """
+        Đóng kết nối database. Với pool: trả các kết nối còn đang được mượn về pool rồi đóng toàn bộ pool.
+        MySQLConnectionPool không có API công khai để đóng pool nên dùng _remove_connections
+        (có trong mysql-connector-python 8.0 đến 9.x); phiên bản không có phương thức này thì các kết nối
+        rảnh được đóng khi tiến trình kết thúc
+        """
         try:
-            self.cursor.close()
-            self.connection.close()
+            self._executor.shutdown(wait=True)
+            if self.pool is not None:
+                with self._borrowed_lock:
+                    borrowed = list(self._borrowed)
+                    self._borrowed.clear()
+                if borrowed:
+                    logger.warning(f"Đóng database khi còn {len(borrowed)} kết nối đang được dùng")
+                for connection in borrowed:
+                    connection.close()
+                remove_connections = getattr(self.pool, "_remove_connections", None)
+                if remove_connections is not None:
+                    remove_connections()
+                else:
+                    logger.warning("mysql-connector không hỗ trợ đóng pool, kết nối rảnh được đóng khi thoát")
+            else:
+                self.cursor.close()
+                self.connection.close()
             logger.info("Đã đóng kết nối database")
         except Exception as e:
             logger.error(f"Lỗi khi đóng kết nối database: {str(e)}")
\ No newline at end of file
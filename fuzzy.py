@@ -0,0 +1,94 @@
+from collections import Counter
+from typing import List, Dict, Any, Tuple
+
+from text_utils import tokenize, strip_product_query
+
+# Số ứng viên (theo số trigram trùng) được chấm lại bằng khoảng cách chỉnh sửa
+MAX_CANDIDATES = 50
+# Hai từ có độ giống nhau dưới mức này coi như không khớp
+MIN_TOKEN_SIMILARITY = 0.5
+
+
+def levenshtein(a: str, b: str) -> int:
+    """
+    Khoảng cách chỉnh sửa (thêm, xóa, thay một ký tự)
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _similarity(a: str, b: str) -> float:
+    if a == b:
+        return 1.0
+    return 1.0 - levenshtein(a, b) / max(len(a), len(b))
+
+
+def _trigrams(token: str) -> List[str]:
+    padded = f" {token} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+class ProductNameMatcher:
+    """
+    Tìm sản phẩm theo tên gần đúng: chỉ mục trigram trên các từ của tên (đã bỏ dấu) để chọn ứng viên,
+    sau đó xếp hạng lại bằng khoảng cách chỉnh sửa giữa từng từ của câu hỏi và tên sản phẩm.
+    Chịu được lỗi gõ phím và câu hỏi không dấu
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        self._products: List[Dict[str, Any]] = []
+        self._tokens: List[List[str]] = []
+        self._postings: Dict[str, List[int]] = {}
+        for product in products:
+            tokens = tokenize(product.get('name'))
+            if not tokens:
+                continue
+            doc = len(self._products)
+            self._products.append(product)
+            self._tokens.append(tokens)
+            for trigram in {t for token in tokens for t in _trigrams(token)}:
+                self._postings.setdefault(trigram, []).append(doc)
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def _score(self, query_tokens: List[str], doc: int) -> float:
+        name_tokens = self._tokens[doc]
+        matched = set()
+        total = 0.0
+        for token in query_tokens:
+            best, best_index = 0.0, None
+            for index, name_token in enumerate(name_tokens):
+                similarity = _similarity(token, name_token)
+                if similarity > best:
+                    best, best_index = similarity, index
+            if best >= MIN_TOKEN_SIMILARITY:
+                total += best
+                matched.add(best_index)
+        # Độ phủ câu hỏi là chính; phần tên không được nhắc tới chỉ trừ nhẹ để ưu tiên tên ngắn khớp đúng
+        return total / len(query_tokens) * (0.8 + 0.2 * len(matched) / len(name_tokens))
+
+    def match(self, query: str, limit: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Các sản phẩm có tên gần với câu hỏi nhất, kèm điểm từ 0 đến 1, sắp xếp giảm dần
+        """
+        query_tokens = tokenize(strip_product_query(query))
+        if not query_tokens:
+            return []
+        hits: Counter = Counter()
+        postings = [self._postings[t] for t in {t for token in query_tokens for t in _trigrams(token)}
+                    if t in self._postings]
+        # Trigram xuất hiện trong quá nửa danh mục gần như không phân biệt được ứng viên, bỏ qua cho nhanh
+        selective = [posting for posting in postings if len(posting) * 2 <= len(self._products)]
+        for posting in selective or postings:
+            hits.update(posting)
+        scored = [(self._score(query_tokens, doc), doc) for doc, _ in hits.most_common(MAX_CANDIDATES)]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(round(score, 4), self._products[doc]) for score, doc in scored[:limit]]
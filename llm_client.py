@@ -0,0 +1,282 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger('chatbot')
+
+# Lỗi tạm thời phía Gemini có thể thử lại (so theo tên lớp để không phụ thuộc google.api_core)
+RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+                    "InternalServerError", "DeadlineExceeded", "TimeoutError"}
+RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+
+
+class LLMOverloadedError(Exception):
+    """
+    Hệ thống đang quá tải, từ chối ngay thay vì xếp hàng chờ vô hạn
+    """
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimitedError(LLMOverloadedError):
+    """
+    Vượt giới hạn tốc độ gọi Gemini (của ứng dụng hoặc của phía Google)
+    """
+    status_code = 429
+
+
+class LLMUnavailableError(LLMOverloadedError):
+    """
+    Cầu dao đang mở: Gemini lỗi liên tục nên tạm ngừng gọi, từ chối ngay không chờ
+    """
+
+
+class LLMTimeoutError(Exception):
+    """
+    Gemini không trả lời trong thời gian chờ của lần thử cuối hoặc đã hết deadline của lượt gọi.
+    Là lỗi của lượt gọi (không phải quá tải): nơi gọi dùng giá trị dự phòng như với các lỗi Gemini khác
+    """
+
+
+class TokenBucket:
+    """
+    Giới hạn tốc độ theo thuật toán token bucket: rate token/giây, tối đa capacity token
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, max_wait: float) -> None:
+        """
+        Lấy một token, chờ nếu cần; ném LLMRateLimitedError nếu phải chờ lâu hơn max_wait
+        """
+        if self.rate <= 0:
+            return
+        self._refill()
+        wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        if wait > max_wait:
+            raise LLMRateLimitedError("Vượt giới hạn tốc độ gọi Gemini", retry_after=wait)
+        # Giữ chỗ trước khi chờ để các lượt gọi sau xếp hàng phía sau
+        self._tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class GeminiClient:
+    """
+    Lớp bọc dùng chung cho mọi lượt gọi Gemini: giới hạn số lượt gọi đồng thời và hàng đợi,
+    giới hạn tốc độ, thử lại với backoff ngẫu nhiên, deadline cho mỗi lượt gọi
+    và gộp các prompt giống nhau đang chạy
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 32, queue_timeout: float = 2.0,
+                 rate: float = 10.0, burst: float = 20.0, timeout: float = 10.0, deadline: float = 20.0,
+                 max_retries: int = 2, retry_base_delay: float = 0.5, retry_max_delay: float = 4.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CircuitBreaker("gemini")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.active = 0
+        self.waiting = 0
+        self.calls = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, timeout: Optional[float] = None) -> "GeminiClient":
+        """
+        Khởi tạo client từ các biến môi trường GEMINI_*
+        """
+        return cls(
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.getenv("GEMINI_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", "2")),
+            rate=float(os.getenv("GEMINI_RATE_LIMIT", "10")),
+            burst=float(os.getenv("GEMINI_RATE_BURST", "20")),
+            timeout=timeout if timeout is not None else float(os.getenv("GEMINI_TIMEOUT", "10")),
+            deadline=float(os.getenv("GEMINI_DEADLINE", "20")),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+            retry_base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5")),
+            retry_max_delay=float(os.getenv("GEMINI_RETRY_MAX_DELAY", "4")),
+            breaker=CircuitBreaker.from_env("gemini"),
+        )
+
+    def is_available(self) -> bool:
+        """
+        Cầu dao cho phép gọi Gemini (đóng, hoặc đến lượt gọi thử)
+        """
+        return self.breaker.available()
+
+    def is_saturated(self) -> bool:
+        """
+        Hàng đợi đã đầy: lượt gọi mới sẽ bị từ chối ngay
+        """
+        return self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def _slot(self, remaining: float):
+        """
+        Giữ một chỗ trong số lượt gọi đồng thời; hàng đợi đầy hoặc chờ quá lâu thì báo quá tải
+        """
+        if not self._semaphore.locked():
+            # Còn chỗ trống: acquire() trả về ngay, không phải xếp hàng
+            await self._semaphore.acquire()
+        else:
+            if self.is_saturated():
+                self.rejected += 1
+                raise LLMOverloadedError("Hàng đợi gọi Gemini đã đầy")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=min(self.queue_timeout, remaining))
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise LLMOverloadedError("Chờ lượt gọi Gemini quá lâu")
+            finally:
+                self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: ngẫu nhiên trong [0, base * 2^attempt] để các client không thử lại cùng lúc
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    async def _call_with_retries(self, factory: Callable[[], Awaitable[Any]], deadline: float) -> Any:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("Hết deadline của lượt gọi Gemini")
+            if not self.breaker.allow():
+                raise LLMUnavailableError("Gemini tạm thời không khả dụng",
+                                          retry_after=max(self.breaker.retry_after(), 1.0))
+            await self.bucket.acquire(max_wait=min(self.queue_timeout, remaining))
+            try:
+                async with self._slot(remaining):
+                    self.calls += 1
+                    remaining = deadline - time.monotonic()
+                    result = await asyncio.wait_for(factory(), timeout=min(self.timeout, max(remaining, 0.001)))
+                self.breaker.record_success()
+                return result
+            except LLMOverloadedError:
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                name = type(e).__name__
+                delay = self._backoff(attempt)
+                if name not in RETRYABLE_ERRORS or attempt >= self.max_retries \
+                        or time.monotonic() + delay >= deadline:
+                    self.failures += 1
+                    if name in RATE_LIMIT_ERRORS:
+                        raise LLMRateLimitedError("Gemini từ chối do vượt giới hạn tốc độ",
+                                                  retry_after=self.retry_max_delay) from e
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise LLMTimeoutError(f"Gemini không trả lời sau {attempt + 1} lần thử") from e
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"Lỗi tạm thời khi gọi Gemini ({name}), thử lại lần {attempt} sau {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def call(self, factory: Callable[[], Awaitable[Any]], key: Optional[Hashable] = None,
+                   deadline: Optional[float] = None) -> Any:
+        """
+        Gọi factory() qua các giới hạn của client. deadline (giây) tính cho cả các lần thử lại;
+        hết thời gian chờ thì ném LLMTimeoutError
+        Có key thì các lượt gọi trùng key đang chạy sẽ dùng chung một kết quả
+        """
+        deadline_at = time.monotonic() + (deadline if deadline is not None else self.deadline)
+        if key is None:
+            return await self._call_with_retries(factory, deadline_at)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # Lượt gọi dẫn đầu bị hủy (ví dụ client ngắt kết nối), tự gọi lại trong phần deadline còn lại
+                if self._inflight.get(key) is inflight:
+                    self._inflight.pop(key, None)
+                return await self.call(factory, key=key, deadline=deadline_at - time.monotonic())
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._call_with_retries(factory, deadline_at)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Tránh cảnh báo "exception was never retrieved" khi không có ai chờ
+                future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                self._inflight.pop(key, None)
+
+    async def generate(self, model: Any, prompt: str, deadline: Optional[float] = None) -> Any:
+        """
+        generate_content_async qua client; các prompt giống nhau gửi tới cùng một model được gộp lại
+        """
+        return await self.call(lambda: model.generate_content_async(prompt), key=(id(model), prompt),
+                               deadline=deadline)
+
+    async def send_message(self, chat: Any, content: str, stream: bool = False,
+                           deadline: Optional[float] = None) -> Any:
+        """
+        Gửi tin nhắn trong một phiên chat (không gộp vì mỗi phiên có lịch sử riêng).
+        Với stream=True chỉ bước mở kết nối được tính vào giới hạn đồng thời
+        """
+        return await self.call(lambda: chat.send_message_async(content, stream=stream), deadline=deadline)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'calls': self.calls,
+            'retries': self.retries,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+            'failures': self.failures,
+            'breaker': self.breaker.stats(),
+        }
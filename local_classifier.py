@@ -0,0 +1,76 @@
+import re
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from price_rules import parse_price_query
+from text_utils import fold_diacritics, strip_product_query
+
+logger = logging.getLogger('chatbot')
+
+# Các mẫu được so khớp trên câu hỏi đã bỏ dấu
+_PRODUCT_INFO_PATTERN = re.compile(r"\b(?:thong tin|chi tiet|mo ta|thong so|review|danh gia)\b")
+# Các từ thường đi kèm tên thương hiệu trong câu hỏi danh sách theo thương hiệu
+_BRAND_FILLER_PATTERN = re.compile(
+    r"\b(?:thuong hieu|cua hang|san pham|hang|hieu|brand|shop|ban|khong|cac|nhung|mau|nao|ko|k)\b"
+)
+
+
+class LocalClassifier:
+    """
+    Xác định kịch bản và tham số chỉ bằng luật cục bộ, không gọi Gemini: biểu thức chính quy cho giá
+    và câu hỏi thông tin, từ điển tên thương hiệu (bảng brands và BRAND_ALIASES), router n-gram cho phần còn lại.
+    Dùng khi cầu dao Gemini đang mở
+    """
+
+    def __init__(self, router: Optional[Any] = None, min_router_score: float = 0.3, min_router_margin: float = 0.08):
+        self.router = router
+        self.min_router_score = min_router_score
+        self.min_router_margin = min_router_margin
+
+    def find_brand(self, query: str, brand_names: Iterable[str]) -> Optional[str]:
+        """
+        Tên thương hiệu (đã bỏ dấu) xuất hiện trong câu hỏi, ưu tiên tên dài nhất.
+        So trên câu hỏi còn dấu để tên gọi như "van" không khớp nhầm với "vấn"
+        """
+        lowered = query.lower()
+        for name in sorted(brand_names, key=len, reverse=True):
+            if name and re.search(r"(?<!\w)" + re.escape(name) + r"(?!\w)", lowered):
+                return name
+        return None
+
+    def classify(self, query: str, brand_names: Iterable[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Trả về (kịch bản, tham số); tham số có thể gồm price_range, brand và product_name (phần còn lại của
+        câu hỏi sau khi bỏ các từ không thuộc tên sản phẩm). Kịch bản None nếu không nhận ra
+        """
+        folded = fold_diacritics(query)
+        slots: Dict[str, Any] = {}
+        price_range = parse_price_query(query)
+        if price_range is not None:
+            slots['price_range'] = price_range
+        brand = self.find_brand(query, brand_names)
+        if brand is not None:
+            slots['brand'] = brand
+        rest = strip_product_query(query)
+        if rest:
+            slots['product_name'] = rest
+
+        if _PRODUCT_INFO_PATTERN.search(folded) and rest:
+            return "product_info", slots
+        if price_range is not None:
+            return "price_filter", slots
+        if brand is not None:
+            remainder = re.sub(r"(?<!\w)" + re.escape(brand) + r"(?!\w)", " ", rest)
+            remainder = _BRAND_FILLER_PATTERN.sub(" ", remainder).split()
+            # Chỉ có tên thương hiệu: danh sách theo thương hiệu; còn từ khác thì có thể là tên sản phẩm
+            return ("brand_filter" if not remainder else "product_info"), slots
+
+        if self.router is not None:
+            try:
+                decision = self.router.decide(query, self.min_router_score, self.min_router_margin)
+                # Không có giá hoặc thương hiệu để lọc thì chỉ còn tìm kiếm hoặc tra tên sản phẩm
+                if decision.confident and decision.scenario in ("search_products", "product_info") and rest:
+                    return decision.scenario, slots
+            except Exception as e:
+                logger.error(f"Lỗi router cục bộ: {str(e)}")
+        return None, slots
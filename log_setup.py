@@ -0,0 +1,123 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from typing import Optional
+
+# Mã yêu cầu hiện tại, được middleware của API gán cho mỗi request
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Gắn request_id của ngữ cảnh hiện tại vào bản ghi log
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class TruncateFilter(logging.Filter):
+    """
+    Cắt bớt thông điệp quá dài (ví dụ toàn bộ danh sách sản phẩm trong câu trả lời)
+    """
+
+    def __init__(self, max_length: int):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if self.max_length and len(message) > self.max_length:
+            record.msg = f"{message[:self.max_length]}... (+{len(message) - self.max_length} ký tự)"
+            record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Chỉ giữ lại một phần log mức INFO/DEBUG; WARNING trở lên luôn được ghi
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Ghi mỗi bản ghi log thành một dòng JSON
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler không chặn: hàng đợi đầy thì bỏ bản ghi và đếm số bản ghi bị bỏ
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(filename: str, level: int = logging.INFO) -> Optional[logging.handlers.QueueListener]:
+    """
+    Cấu hình logging cho tiến trình: các logger chỉ đưa bản ghi vào hàng đợi,
+    một luồng nền ghi ra file. Giống logging.basicConfig, chỉ lần gọi đầu tiên có hiệu lực.
+
+    Biến môi trường: LOG_FORMAT (text|json), LOG_MAX_MESSAGE (số ký tự tối đa, 0 là không cắt),
+    LOG_SAMPLE_RATE (tỉ lệ giữ log INFO), LOG_QUEUE_SIZE
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return _listener
+
+    file_handler = logging.FileHandler(filename, encoding='utf-8')
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    # Các filter chạy ở luồng gọi log, trước khi bản ghi vào hàng đợi
+    queue_handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1"))))
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(TruncateFilter(int(os.getenv("LOG_MAX_MESSAGE", "2000"))))
+
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
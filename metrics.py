@@ -0,0 +1,235 @@
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+# Các mốc (giây) của histogram độ trễ
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    Histogram dạng Prometheus: số lần quan sát rơi vào từng mốc (cộng dồn), tổng và số lượng
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Nơi gom histogram và counter theo tên + nhãn, xuất ra định dạng văn bản của Prometheus
+    """
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    @staticmethod
+    def _labels(labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ""
+        escaped = (f'{k}="{_escape(v)}"' for k, v in items)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """
+        Xuất toàn bộ số liệu theo định dạng văn bản của Prometheus (text/plain; version=0.0.4)
+        """
+        lines: List[str] = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            snapshot = [(key, h.buckets, list(h.counts), h.total, h.count) for key, h in histograms]
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+
+        for (name, labels), buckets, counts, total, count in snapshot:
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f"{name}_bucket{self._labels(labels, ('le', f'{bound:g}'))} {bucket_count}")
+            lines.append(f"{name}_bucket{self._labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {count}")
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("chatbot_stage_seconds", "Thời gian của từng bước xử lý câu hỏi")
+registry.describe("chatbot_request_seconds", "Tổng thời gian xử lý một request")
+registry.describe("chatbot_llm_calls_total", "Số lượt gọi Gemini")
+registry.describe("chatbot_llm_tokens_total", "Số token của các lượt gọi Gemini")
+
+
+class RequestTrace:
+    """
+    Các span đo được trong một request; được ghi vào histogram khi request kết thúc
+    để gắn nhãn kịch bản cuối cùng của câu hỏi
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def add(self, stage: str, seconds: float) -> None:
+        # list.append an toàn khi được gọi từ các luồng database
+        self.spans.append((stage, seconds))
+
+    def finish(self, scenario: Optional[str], endpoint: str = "chat") -> None:
+        scenario = scenario or "none"
+        for stage, seconds in self.spans:
+            registry.observe("chatbot_stage_seconds", seconds, stage=stage, scenario=scenario)
+        registry.observe("chatbot_request_seconds", time.perf_counter() - self.started,
+                         endpoint=endpoint, scenario=scenario)
+
+    def breakdown(self) -> Dict[str, Any]:
+        """
+        Thời gian theo từng bước (ms) để trả về cho client khi bật header debug
+        """
+        stages: Dict[str, Dict[str, float]] = {}
+        for stage, seconds in self.spans:
+            entry = stages.setdefault(stage, {'count': 0, 'ms': 0.0})
+            entry['count'] += 1
+            entry['ms'] = round(entry['ms'] + seconds * 1000, 2)
+        return {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'stages': stages,
+            'llm_calls': self.llm_calls,
+            'prompt_tokens': self.prompt_tokens,
+            'output_tokens': self.output_tokens,
+        }
+
+
+_trace_var: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def trace_request():
+    """
+    Bắt đầu thu thập span cho request hiện tại
+    """
+    trace = RequestTrace()
+    token = _trace_var.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace_var.reset(token)
+
+
+def record_span(stage: str, seconds: float) -> None:
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+    else:
+        registry.observe("chatbot_stage_seconds", seconds, stage=stage, scenario="none")
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Đo thời gian một đoạn code
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def timed(stage: str):
+    """
+    Decorator đo thời gian một hàm (đồng bộ hoặc bất đồng bộ)
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_llm_call(kind: str, response: Any) -> None:
+    """
+    Đếm lượt gọi Gemini và số token (nếu phản hồi có usage_metadata)
+    """
+    registry.inc("chatbot_llm_calls_total", kind=kind)
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', None) or 0
+    if prompt_tokens:
+        registry.inc("chatbot_llm_tokens_total", prompt_tokens, kind=kind, type="prompt")
+    if output_tokens:
+        registry.inc("chatbot_llm_tokens_total", output_tokens, kind=kind, type="output")
+
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.llm_calls += 1
+        trace.prompt_tokens += prompt_tokens
+        trace.output_tokens += output_tokens
@@ -0,0 +1,258 @@
+"""
+Chuẩn bị lược đồ cho các truy vấn tra cứu dùng chỉ mục:
+
+- cột products.name_normalized (chữ thường, bỏ dấu) thay cho LOWER(name) = LOWER(%s);
+  trigger đặt lại cột về NULL khi tên sản phẩm đổi để tra cứu quay về LOWER(name) cho đến lần điền tiếp theo
+- chỉ mục trên name_normalized, (brand_id, price) và price
+- kiểm tra bằng EXPLAIN rằng các truy vấn tra cứu thực sự dùng các chỉ mục đó
+
+Chạy một lần khi triển khai (hoặc đặt DB_AUTO_MIGRATE=1 để API tự chạy lúc khởi động):
+
+    python migrations.py
+"""
+import os
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from data import (
+    Database, EXACT_NAME_QUERY, PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE, BRAND_CONDITION, PAGE_ORDER,
+    price_condition, count_query, page_query, batch_count_query, batch_page_query
+)
+from text_utils import fold_diacritics
+
+logger = logging.getLogger('chatbot')
+
+NORMALIZED_NAME_COLUMN = "name_normalized"
+NORMALIZED_NAME_TRIGGER = "trg_products_name_normalized"
+
+# MySQL không bỏ dấu tiếng Việt được (đ, các dấu thanh) nên giá trị mới do Python tính trong
+# backfill_normalized_names; trigger chỉ xóa giá trị cũ khi tên đổi mà người ghi không tự cập nhật cột
+NORMALIZED_NAME_TRIGGER_SQL = f"""
+    CREATE TRIGGER {NORMALIZED_NAME_TRIGGER} BEFORE UPDATE ON products
+    FOR EACH ROW
+    SET NEW.{NORMALIZED_NAME_COLUMN} = IF(
+        NEW.name <=> OLD.name OR NOT (NEW.{NORMALIZED_NAME_COLUMN} <=> OLD.{NORMALIZED_NAME_COLUMN}),
+        NEW.{NORMALIZED_NAME_COLUMN}, NULL
+    )
+"""
+
+# (bảng, tên chỉ mục, các cột)
+INDEXES: List[Tuple[str, str, str]] = [
+    ("products", "idx_products_name_normalized", NORMALIZED_NAME_COLUMN),
+    ("products", "idx_products_brand_price", "brand_id, price"),
+    ("products", "idx_products_price", "price"),
+]
+
+
+def _explain_checks() -> Dict[str, Tuple[str, tuple, str]]:
+    """
+    Dựng các truy vấn cần kiểm tra bằng đúng các hàm mà Database dùng (trang 10 sản phẩm, gộp hai điều kiện)
+    """
+    below, below_params = price_condition(None, 500000)
+    between, between_params = price_condition(500000, 1000000)
+    brand_pair = [BRAND_CONDITION, BRAND_CONDITION]
+    price_pair = [below, between]
+    return {
+        "exact_name": (EXACT_NAME_QUERY, ("giay nike", "giay nike", "giày nike"), "idx_products_name_normalized"),
+        "brand_count": (count_query(PRODUCT_SOURCE, BRAND_CONDITION), (1,), "idx_products_brand_price"),
+        "brand_page": (page_query(PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE, BRAND_CONDITION, PAGE_ORDER),
+                       (1, 10, 0), "idx_products_brand_price"),
+        "brand_batch_count": (batch_count_query(PRODUCT_SOURCE, brand_pair), (1, 2) * 2, "idx_products_brand_price"),
+        "brand_batch": (batch_page_query(PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE, list(enumerate(brand_pair)),
+                                         PAGE_ORDER), (1, 10, 2, 10), "idx_products_brand_price"),
+        "price_count": (count_query(PRODUCT_SOURCE, below), tuple(below_params), "idx_products_price"),
+        "price_page": (page_query(PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE, below, PAGE_ORDER),
+                       tuple(below_params) + (10, 0), "idx_products_price"),
+        "price_range_page": (page_query(PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE, between, PAGE_ORDER),
+                             tuple(between_params) + (10, 0), "idx_products_price"),
+        "price_batch_count": (batch_count_query(PRODUCT_SOURCE, price_pair),
+                              tuple(below_params + between_params) * 2, "idx_products_price"),
+        "price_batch": (batch_page_query(PRODUCT_DETAIL_COLUMNS, PRODUCT_SOURCE, list(enumerate(price_pair)),
+                                         PAGE_ORDER), tuple(below_params + [10] + between_params + [10]),
+                        "idx_products_price"),
+    }
+
+
+# Truy vấn tra cứu -> chỉ mục mà EXPLAIN phải chọn cho mọi lần đọc bảng products, không sắp xếp thêm (filesort)
+EXPLAIN_CHECKS: Dict[str, Tuple[str, tuple, str]] = _explain_checks()
+
+
+def column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(
+        "SELECT COUNT(*) AS total FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return cursor.fetchone()['total'] > 0
+
+
+def index_exists(cursor, table: str, index: str) -> bool:
+    cursor.execute(
+        "SELECT COUNT(*) AS total FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index)
+    )
+    return cursor.fetchone()['total'] > 0
+
+
+def trigger_exists(cursor, trigger: str) -> bool:
+    cursor.execute(
+        "SELECT COUNT(*) AS total FROM information_schema.triggers "
+        "WHERE trigger_schema = DATABASE() AND trigger_name = %s",
+        (trigger,)
+    )
+    return cursor.fetchone()['total'] > 0
+
+
+def backfill_normalized_names(db: Database, batch_size: int = 1000) -> int:
+    """
+    Điền lại name_normalized cho các sản phẩm chưa có hoặc có giá trị không còn khớp với tên
+    (sản phẩm mới thêm hoặc đổi tên sau lần migrate trước). Duyệt toàn bảng theo id.
+    Trả về số sản phẩm đã cập nhật
+    """
+    updated = 0
+    last_id = None
+    while True:
+        with db._cursor() as cursor:
+            if last_id is None:
+                cursor.execute(
+                    f"SELECT id, name, {NORMALIZED_NAME_COLUMN} FROM products ORDER BY id LIMIT %s", (batch_size,)
+                )
+            else:
+                cursor.execute(
+                    f"SELECT id, name, {NORMALIZED_NAME_COLUMN} FROM products WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch_size)
+                )
+            rows = cursor.fetchall()
+            if not rows:
+                return updated
+            last_id = rows[-1]['id']
+            changes = []
+            for row in rows:
+                normalized = fold_diacritics(row['name'] or "").strip()
+                if row[NORMALIZED_NAME_COLUMN] != normalized:
+                    changes.append((normalized, row['id']))
+            if changes:
+                cursor.executemany(f"UPDATE products SET {NORMALIZED_NAME_COLUMN} = %s WHERE id = %s", changes)
+                cursor.execute("COMMIT")
+        if changes:
+            updated += len(changes)
+            logger.info(f"Đã điền name_normalized cho {updated} sản phẩm")
+
+
+def migrate(db: Database) -> bool:
+    """
+    Thêm cột name_normalized cùng trigger xóa giá trị cũ khi đổi tên, điền giá trị và tạo các chỉ mục
+    còn thiếu. Chạy lại nhiều lần vẫn an toàn
+    """
+    try:
+        with db._cursor() as cursor:
+            if not column_exists(cursor, "products", NORMALIZED_NAME_COLUMN):
+                logger.info("Thêm cột products.name_normalized")
+                cursor.execute(f"ALTER TABLE products ADD COLUMN {NORMALIZED_NAME_COLUMN} VARCHAR(255) NULL")
+        create_normalized_name_trigger(db)
+        backfill_normalized_names(db)
+        with db._cursor() as cursor:
+            for table, index, columns in INDEXES:
+                if not index_exists(cursor, table, index):
+                    logger.info(f"Tạo chỉ mục {index} trên {table} ({columns})")
+                    cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+        return True
+    except Exception as e:
+        logger.error(f"Lỗi khi migrate database: {str(e)}")
+        return False
+
+
+def create_normalized_name_trigger(db: Database) -> bool:
+    """
+    Tạo trigger đặt lại name_normalized khi tên sản phẩm đổi. Tài khoản database không có quyền
+    TRIGGER thì chỉ cảnh báo: giá trị cũ vẫn được sửa ở lần migrate tiếp theo
+    """
+    try:
+        with db._cursor() as cursor:
+            if trigger_exists(cursor, NORMALIZED_NAME_TRIGGER):
+                return True
+            logger.info(f"Tạo trigger {NORMALIZED_NAME_TRIGGER} trên products")
+            cursor.execute(NORMALIZED_NAME_TRIGGER_SQL)
+        return True
+    except Exception as e:
+        logger.warning(f"Không tạo được trigger {NORMALIZED_NAME_TRIGGER}, sản phẩm đổi tên chỉ được "
+                       f"cập nhật name_normalized khi chạy lại migrate: {str(e)}")
+        return False
+
+
+def bootstrap(db: Database, apply: bool = False) -> None:
+    """
+    Chuẩn bị Database cho các truy vấn tra cứu: chạy migrate nếu apply, bật tra tên qua
+    name_normalized khi cột đã có và nạp bảng tên gọi thương hiệu
+    """
+    if apply:
+        migrate(db)
+    try:
+        with db._cursor() as cursor:
+            db.normalized_names = column_exists(cursor, "products", NORMALIZED_NAME_COLUMN)
+        if not db.normalized_names:
+            logger.warning("Bảng products chưa có cột name_normalized, tra tên chính xác dùng LOWER(name)")
+    except Exception as e:
+        logger.error(f"Lỗi khi kiểm tra lược đồ database: {str(e)}")
+    try:
+        db.load_brand_aliases()
+    except Exception as e:
+        logger.error(f"Lỗi khi nạp bảng tên thương hiệu: {str(e)}")
+
+
+def explain_lookups(db: Database) -> Dict[str, Dict[str, Any]]:
+    """
+    Chạy EXPLAIN cho các truy vấn tra cứu, trả về cho mỗi truy vấn các chỉ mục MySQL chọn
+    ở từng lần đọc bảng products ('keys') và có phải sắp xếp thêm hay không ('filesort')
+    """
+    plans: Dict[str, Dict[str, Any]] = {}
+    with db._cursor() as cursor:
+        for name, (query, params, _) in EXPLAIN_CHECKS.items():
+            cursor.execute(f"EXPLAIN {query}", params)
+            rows = [row for row in cursor.fetchall() if row.get('table') in ("products", "p")]
+            plans[name] = {
+                'keys': [row.get('key') for row in rows],
+                'filesort': any("filesort" in (row.get('Extra') or "") for row in rows),
+            }
+    return plans
+
+
+def check_indexes(db: Database) -> bool:
+    """
+    Xác nhận bằng EXPLAIN rằng mỗi truy vấn tra cứu dùng đúng chỉ mục mong đợi và không phải filesort
+    """
+    ok = True
+    for name, plan in explain_lookups(db).items():
+        expected = EXPLAIN_CHECKS[name][2]
+        keys = plan['keys']
+        if keys and all(key == expected for key in keys) and not plan['filesort']:
+            logger.info(f"EXPLAIN {name}: dùng chỉ mục {expected}")
+        else:
+            ok = False
+            used = ", ".join(key or "quét toàn bảng" for key in keys) or "không đọc bảng products"
+            logger.warning(f"EXPLAIN {name}: dùng {used}{' kèm filesort' if plan['filesort'] else ''}, "
+                           f"mong đợi {expected}")
+    return ok
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    load_dotenv()
+    database = Database(
+        os.getenv("DB_HOST", "localhost"), os.getenv("DB_USER", "admin"),
+        os.getenv("DB_PASSWORD", "123456"), os.getenv("DB_NAME", "web_tmdt")
+    )
+    try:
+        if not migrate(database):
+            raise SystemExit(1)
+        bootstrap(database)
+        for lookup, plan in explain_lookups(database).items():
+            used = ", ".join(key or "không dùng chỉ mục" for key in plan['keys'])
+            print(f"{lookup:<18} {used}{' + filesort' if plan['filesort'] else ''} "
+                  f"(mong đợi {EXPLAIN_CHECKS[lookup][2]})")
+        raise SystemExit(0 if check_indexes(database) else 1)
+    finally:
+        database.close()
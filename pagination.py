@@ -0,0 +1,38 @@
+import json
+import base64
+from typing import Any, Tuple
+
+# Các loại danh sách sản phẩm có thể phân trang
+PAGE_KINDS = ("price", "price_range", "brand", "search", "similar")
+
+
+class InvalidPageTokenError(ValueError):
+    """
+    Mã trang do client gửi lên không hợp lệ
+    """
+
+
+def encode_page_token(kind: str, value: Any, offset: int) -> str:
+    """
+    Mã hóa vị trí trang tiếp theo thành chuỗi gửi cho client
+    """
+    payload = json.dumps({"k": kind, "v": value, "o": offset}, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: str) -> Tuple[str, Any, int]:
+    """
+    Giải mã page token thành (loại danh sách, giá trị tra cứu, offset)
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        kind, value, offset = payload["k"], payload["v"], int(payload["o"])
+    except Exception as e:
+        raise InvalidPageTokenError(f"Page token không hợp lệ: {token}") from e
+    if kind not in PAGE_KINDS or offset < 0 or value in (None, ""):
+        raise InvalidPageTokenError(f"Page token không hợp lệ: {token}")
+    if isinstance(value, list):
+        # Giá trị nhiều thành phần (khoảng giá) cần hashable để làm khóa cache
+        value = tuple(value)
+    return kind, value, offset
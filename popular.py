@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from query_cache import normalize_query
+
+logger = logging.getLogger('chatbot')
+
+# Dòng log của API khi nhận câu hỏi (xem chatbot_api.chat), cả định dạng văn bản lẫn JSON
+_QUERY_LOG_PATTERN = re.compile(r"Nhận được tin nhắn(?: \(streaming\))?: (.+)$")
+
+
+def _read_tail_lines(path: str, max_bytes: int) -> Iterator[str]:
+    """
+    Đọc các dòng trong max_bytes cuối của file log (bỏ dòng đầu có thể bị cắt giữa chừng)
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - max_bytes))
+        if size > max_bytes:
+            f.readline()
+        for raw in f:
+            yield raw.decode("utf-8", errors="replace").rstrip("\n")
+
+
+def mine_popular_queries(paths: List[str], top_n: int, min_count: int = 2, fold: bool = False,
+                         max_bytes: int = 50 << 20) -> List[Tuple[str, int]]:
+    """
+    Đếm các câu hỏi (đã chuẩn hóa) trong log của API, trả về top_n câu hỏi xuất hiện
+    ít nhất min_count lần cùng số lần xuất hiện, nhiều nhất trước
+    """
+    counts: Counter = Counter()
+    originals: Dict[str, str] = {}
+    for path in paths:
+        try:
+            for line in _read_tail_lines(path, max_bytes):
+                if line.startswith("{"):
+                    try:
+                        line = json.loads(line).get('message', '')
+                    except ValueError:
+                        continue
+                match = _QUERY_LOG_PATTERN.search(line)
+                if not match or not match.group(1).strip():
+                    continue
+                key = normalize_query(match.group(1), fold=fold)
+                counts[key] += 1
+                originals.setdefault(key, match.group(1).strip())
+        except FileNotFoundError:
+            logger.warning(f"Không tìm thấy file log {path} để thống kê câu hỏi phổ biến")
+    return [(originals[key], count) for key, count in counts.most_common(top_n) if count >= min_count]
+
+
+class PopularAnswers:
+    """
+    Bảng tra câu trả lời dựng sẵn cho các câu hỏi phổ biến, gắn với phiên bản danh mục lúc dựng
+    """
+
+    def __init__(self):
+        self._answers: Dict[Hashable, Dict[str, Any]] = {}
+        self.version: Any = None
+        self.refreshed_at: Optional[float] = None
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def is_current(self, version: Any) -> bool:
+        """
+        Bảng được dựng từ đúng phiên bản danh mục này
+        """
+        return bool(self._answers) and version is not None and version == self.version
+
+    def lookup(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        answer = self._answers.get(key)
+        if answer is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return answer
+
+    def replace(self, answers: Dict[Hashable, Dict[str, Any]], version: Any) -> None:
+        # Thay cả bảng một lần để các request đang chạy không thấy bảng dựng dở
+        self._answers = answers
+        self.version = version
+        self.refreshed_at = time.time()
+        self.refreshes += 1
+
+    def clear(self) -> None:
+        self._answers = {}
+        self.version = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._answers),
+            'version': str(self.version) if self.version is not None else None,
+            'refreshes': self.refreshes,
+            'refreshed_at': self.refreshed_at,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class PopularAnswersJob:
+    """
+    Việc chạy nền: định kỳ thống kê câu hỏi phổ biến từ log và dựng lại bảng câu trả lời
+    khi danh mục thay đổi (hoặc khi đến hạn thống kê lại log)
+    """
+
+    def __init__(self, chatbot, log_files: List[str], top_n: int = 50, min_count: int = 3,
+                 interval: float = 30.0, mine_interval: float = 3600.0):
+        self.chatbot = chatbot
+        self.log_files = log_files
+        self.top_n = top_n
+        self.min_count = min_count
+        self.interval = interval
+        self.mine_interval = mine_interval
+        self._queries: List[str] = []
+        self._mined_at: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, chatbot) -> "PopularAnswersJob":
+        return cls(
+            chatbot,
+            log_files=[path for path in os.getenv("POPULAR_LOG_FILES", "chatbot_api.log").split(",") if path],
+            top_n=int(os.getenv("POPULAR_TOP_N", "50")),
+            min_count=int(os.getenv("POPULAR_MIN_COUNT", "3")),
+            interval=float(os.getenv("POPULAR_REFRESH_INTERVAL", "30")),
+            mine_interval=float(os.getenv("POPULAR_MINE_INTERVAL", "3600")),
+        )
+
+    async def refresh_once(self) -> bool:
+        """
+        Dựng lại bảng nếu danh mục đã đổi phiên bản hoặc đến hạn thống kê lại log. Trả về True nếu đã dựng lại.
+        Không dựng lại khi Gemini không khả dụng để bảng không bị thay bằng câu trả lời của chế độ cục bộ
+        """
+        if self.chatbot.degraded():
+            return False
+        version = await self.chatbot.catalog_version()
+        table = self.chatbot.popular
+        stale_log = self._mined_at is None or time.monotonic() - self._mined_at >= self.mine_interval
+        if not stale_log and table.refreshes and version == table.version:
+            return False
+        if stale_log:
+            mined = await asyncio.to_thread(
+                mine_popular_queries, self.log_files, self.top_n, self.min_count, self.chatbot.cache_fold_diacritics
+            )
+            self._queries = [query for query, _ in mined]
+            self._mined_at = time.monotonic()
+            logger.info(f"Thống kê log: {len(self._queries)} câu hỏi phổ biến")
+        started = time.perf_counter()
+        answers = await self.chatbot.precompute_answers(self._queries)
+        if answers is None:
+            # Cầu dao Gemini mở giữa chừng: giữ bảng cũ, dựng lại ở lần chạy sau
+            return False
+        table.replace(answers, version)
+        logger.info(f"Đã dựng {len(answers)} câu trả lời cho câu hỏi phổ biến (phiên bản danh mục: {version}) "
+                    f"trong {time.perf_counter() - started:.2f}s")
+        return True
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lỗi khi dựng câu trả lời cho câu hỏi phổ biến: {str(e)}")
+            await asyncio.sleep(self.interval)
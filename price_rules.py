@@ -0,0 +1,135 @@
+import re
+from typing import NamedTuple, Optional
+
+from text_utils import fold_diacritics
+
+
+class PriceRange(NamedTuple):
+    """
+    Khoảng giá (VND) trích xuất từ câu hỏi; None nghĩa là không giới hạn ở phía đó
+    """
+    min_price: Optional[int]
+    max_price: Optional[int]
+    max_inclusive: bool = False
+
+
+# Các mẫu được so khớp trên câu hỏi đã bỏ dấu (fold_diacritics)
+_UNITS = {
+    "k": 1_000, "nghin": 1_000, "ngan": 1_000,
+    "tr": 1_000_000, "trieu": 1_000_000, "cu": 1_000_000,
+}
+_AMOUNT = (
+    r"(?P<{p}num>\d+(?:[.,]\d+)*)\s*"
+    r"(?P<{p}unit>k|nghin|ngan|trieu|tr|cu)?"
+    # Phần lẻ sau đơn vị ("1tr5", "1 triệu 25"), chỉ khi có đơn vị
+    r"(?({p}unit)(?:\s*(?P<{p}tail>\d{{1,3}})(?!\d))?)"
+    # Ký hiệu tiền có thể viết liền ("1.200.000đ", "500kđ")
+    r"\s*(?P<{p}currency>d|dong|vnd)?"
+    r"(?![a-z0-9])(?!\s*(?:{non_price})\b)"
+)
+# Đơn vị không phải tiền đứng sau số: "dưới 40 size", "5 đôi"
+_NON_PRICE_UNITS = "size|sz|cm|mm|kg|tuoi|doi|chiec|cai|mau|km"
+
+
+def _amount(prefix: str) -> str:
+    return _AMOUNT.format(p=prefix, non_price=_NON_PRICE_UNITS)
+
+
+_RANGE_PATTERN = re.compile(
+    r"(?:\b(?P<op>tu|khoang|tam|gia)\s*)?" + _amount("a") + r"\s*(?:den|toi|-|~)\s*" + _amount("b")
+)
+_MAX_PATTERN = re.compile(
+    r"(?<![a-z])(?P<op>duoi|re hon|it hon|thap hon|nho hon|be hon|khong qua|toi da|<=|<)\s*" + _amount("a")
+)
+_MIN_PATTERN = re.compile(
+    r"(?<![a-z])(?P<op>tren|cao hon|lon hon|nhieu hon|hon|tu|it nhat|toi thieu|>=|>)\s*" + _amount("a")
+)
+_AROUND_PATTERN = re.compile(
+    r"\b(?:khoang|tam|gia|muc gia)\s*" + _amount("a")
+)
+_UNIT_ONLY_PATTERN = re.compile(r"(?<![\w.,])" + _amount("a"))
+
+# Biên độ cho các câu hỏi "khoảng X"
+AROUND_TOLERANCE = 0.2
+# Số tiền có đơn vị nhưng không kèm từ chỉ giá chỉ được hiểu là giá khi đủ lớn ("giày chạy bộ 5k" là cự ly)
+MIN_UNIT_ONLY_PRICE = 10_000
+
+
+def parse_amount(number: str, unit: Optional[str] = None, tail: Optional[str] = None) -> int:
+    """
+    Đổi số tiền viết tắt sang VND: "500k", "1 triệu", "1tr5", "1.5 triệu", "500.000"
+    """
+    multiplier = _UNITS.get(unit, 1) if unit else 1
+    if unit and re.fullmatch(r"\d+[.,]\d{1,2}", number):
+        # "1.5 triệu", "2,5tr": phần thập phân
+        value = float(number.replace(",", "."))
+    else:
+        value = float(re.sub(r"[.,]", "", number))
+    amount = value * multiplier
+    if unit and tail and multiplier > 1:
+        # "1tr5" = 1.500.000, "1 triệu 25" = 1.250.000
+        amount += int(tail) * multiplier / (10 ** len(tail))
+    return int(round(amount))
+
+
+def _match_amount(match: "re.Match", prefix: str, default_unit: Optional[str] = None) -> int:
+    unit = match.group(f"{prefix}unit") or default_unit
+    amount = parse_amount(match.group(f"{prefix}num"), unit, match.group(f"{prefix}tail"))
+    # Không có đơn vị và số nhỏ ("dưới 500"): hiểu là nghìn đồng; số có dấu phân cách ("1.200") đã là đồng
+    if not unit and amount < 1000 and not re.search(r"[.,]", match.group(f"{prefix}num")):
+        amount *= 1000
+    return amount
+
+
+def parse_price_query(query: str) -> Optional[PriceRange]:
+    """
+    Nhận diện câu hỏi về giá bằng luật và trả về khoảng giá; None nếu không có luật nào khớp
+    """
+    text = fold_diacritics(query)
+
+    match = _RANGE_PATTERN.search(text)
+    if match and (match.group("op") or match.group("aunit") or match.group("bunit") or match.group("bcurrency")):
+        high = _match_amount(match, "b")
+        # "1 đến 2 triệu": số đầu dùng chung đơn vị với số sau
+        low = _match_amount(match, "a", default_unit=match.group("bunit"))
+        if low > high:
+            low, high = high, low
+        return PriceRange(low, high, max_inclusive=True)
+
+    match = _MAX_PATTERN.search(text)
+    if match:
+        inclusive = match.group("op") in ("khong qua", "toi da", "<=")
+        return PriceRange(None, _match_amount(match, "a"), max_inclusive=inclusive)
+
+    match = _MIN_PATTERN.search(text)
+    if match and (match.group("aunit") or _has_price_context(text)):
+        return PriceRange(_match_amount(match, "a"), None)
+
+    match = _AROUND_PATTERN.search(text)
+    if not (match and (match.group("aunit") or match.group("acurrency") or _has_price_context(text))):
+        # Không có từ chỉ giá: chỉ nhận số tiền có đơn vị rõ ràng ("giày 1tr5", "500k")
+        match = next((m for m in _UNIT_ONLY_PATTERN.finditer(text)
+                      if (m.group("aunit") or m.group("acurrency")) and _match_amount(m, "a") >= MIN_UNIT_ONLY_PRICE),
+                     None)
+    if match:
+        amount = _match_amount(match, "a")
+        return PriceRange(int(amount * (1 - AROUND_TOLERANCE)), int(amount * (1 + AROUND_TOLERANCE)),
+                          max_inclusive=True)
+
+    return None
+
+
+def _has_price_context(text: str) -> bool:
+    return bool(re.search(r"\b(gia|tien|dong|vnd|re|dat)\b", text))
+
+
+def describe_price_range(price_range: PriceRange) -> str:
+    """
+    Mô tả khoảng giá bằng tiếng Việt để hiển thị trong câu trả lời
+    """
+    low, high = price_range.min_price, price_range.max_price
+    if low is not None and high is not None:
+        return f"từ {format(low, ',d')} đến {format(high, ',d')} VND"
+    if high is not None:
+        return f"{'không quá' if price_range.max_inclusive else 'dưới'} {format(high, ',d')} VND"
+    return f"từ {format(low, ',d')} VND trở lên"
@@ -0,0 +1,174 @@
+import re
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from text_utils import fold_diacritics
+
+logger = logging.getLogger('chatbot')
+
+_WHITESPACE = re.compile(r"\s+")
+_MISSING = object()
+
+
+def normalize_query(query: str, fold: bool = False) -> str:
+    """
+    Chuẩn hóa câu hỏi làm khóa cache: chữ thường, gộp khoảng trắng, tùy chọn bỏ dấu
+    """
+    query = _WHITESPACE.sub(" ", query.lower()).strip()
+    return fold_diacritics(query) if fold else query
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Ước lượng số byte bộ nhớ của một giá trị (đệ quy qua dict/list/tuple)
+    """
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    Cache LRU có TTL, giới hạn theo dung lượng byte và gộp các lần tính trùng đang chạy (single-flight).
+    Nếu có shared (xem shared_cache.py), giá trị được ghi thêm vào kho dùng chung giữa các worker
+    và lần trượt cục bộ sẽ tìm trong kho đó trước khi tính lại
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl: float, shared: Optional[Any] = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.shared_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, size, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                return value
+            self._remove(key)
+        if self.shared is not None:
+            value = self.shared.get(self.name, key, _MISSING)
+            if value is not _MISSING:
+                self.shared_hits += 1
+                self._store(key, value)
+                return value
+        return default
+
+    def lookup(self, key: Hashable) -> Any:
+        """
+        Giống get() nhưng được tính vào thống kê trúng/trượt
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._store(key, value)
+        if self.shared is not None:
+            self.shared.set(self.name, key, value, self.ttl)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.info(f"Bỏ qua cache {self.name}: giá trị {size} byte vượt giới hạn")
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def clear(self, include_shared: bool = True) -> None:
+        """
+        Xóa cache; include_shared=False chỉ xóa phần trong tiến trình, giữ nguyên kho dùng chung
+        """
+        self._entries.clear()
+        self.current_bytes = 0
+        if include_shared and self.shared is not None:
+            self.shared.clear(self.name)
+
+    async def get_or_compute(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                             should_cache: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Lấy giá trị từ cache hoặc tính mới; các yêu cầu trùng khóa đang chạy sẽ chờ chung một kết quả
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # Yêu cầu dẫn đầu bị hủy, tự tính lại
+                return await self.get_or_compute(key, factory, should_cache)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await factory()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Tránh cảnh báo "exception was never retrieved" khi không có ai chờ
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if should_cache is None or should_cache(value):
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'shared_hits': self.shared_hits,
+            'hit_rate': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
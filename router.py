@@ -0,0 +1,158 @@
+import os
+import json
+import math
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from text_utils import fold_diacritics
+
+logger = logging.getLogger('chatbot')
+
+# Các câu ví dụ mặc định cho từng kịch bản, bổ sung cho câu mẫu trong ChatBot.scenarios
+DEFAULT_EXAMPLES: Dict[str, List[str]] = {
+    "price_filter": [
+        "giày dưới 500000",
+        "sản phẩm giá dưới 1000000 đồng",
+        "có giày nào rẻ hơn 800k không",
+        "tìm giày giá khoảng 1 triệu",
+        "giày bao nhiêu tiền dưới 2 triệu",
+    ],
+    "brand_filter": [
+        "giày nike",
+        "sản phẩm của adidas",
+        "cho tôi xem giày thương hiệu puma",
+        "shop có bán converse không",
+        "các mẫu giày vans",
+    ],
+    "search_products": [
+        "tìm giày chạy bộ",
+        "giày thể thao màu trắng",
+        "tìm sản phẩm giày da",
+        "có giày đá bóng không",
+        "giày sneaker nữ",
+    ],
+    "product_info": [
+        "thông tin chi tiết về nike air force 1",
+        "cho tôi xem thông tin sản phẩm adidas ultraboost",
+        "mô tả giày converse chuck taylor",
+        "thông số kỹ thuật của vans old skool",
+        "chi tiết sản phẩm puma suede",
+    ],
+}
+
+
+class RouteDecision(NamedTuple):
+    """
+    Kết quả định tuyến một câu hỏi: kịch bản điểm cao nhất, điểm và chênh lệch với kịch bản thứ hai.
+    confident khi đủ điểm và đủ chênh lệch; candidates là các kịch bản sát điểm cần phân xử
+    (rỗng nếu đã chắc chắn hoặc điểm cao nhất dưới ngưỡng)
+    """
+    scenario: str
+    score: float
+    margin: float
+    confident: bool
+    candidates: List[str]
+
+
+def _char_ngrams(text: str, n_min: int, n_max: int) -> List[str]:
+    """
+    Sinh các n-gram ký tự trong phạm vi từng từ (có đánh dấu biên từ)
+    """
+    grams = []
+    for word in fold_diacritics(text).split():
+        padded = f" {word} "
+        for n in range(n_min, n_max + 1):
+            for i in range(len(padded) - n + 1):
+                grams.append(padded[i:i + n])
+    return grams
+
+
+class ScenarioRouter:
+    """
+    Bộ định tuyến kịch bản cục bộ: vector TF-IDF n-gram ký tự + cosine similarity, chạy trên CPU
+    """
+
+    def __init__(self, scenarios: Dict[str, str], examples: Optional[Dict[str, List[str]]] = None,
+                 ngram_range: Tuple[int, int] = (2, 4)):
+        self.ngram_range = ngram_range
+        examples = DEFAULT_EXAMPLES if examples is None else examples
+
+        texts: List[str] = []
+        labels: List[str] = []
+        for name, template in scenarios.items():
+            for text in [template] + list(examples.get(name, [])):
+                if text.strip():
+                    texts.append(text)
+                    labels.append(name)
+
+        self.scenario_names = list(scenarios.keys())
+        self._label_index = np.array([self.scenario_names.index(label) for label in labels])
+
+        documents = [_char_ngrams(text, *ngram_range) for text in texts]
+        vocabulary: Dict[str, int] = {}
+        for grams in documents:
+            for gram in grams:
+                vocabulary.setdefault(gram, len(vocabulary))
+        self.vocabulary = vocabulary
+
+        doc_freq = np.zeros(len(vocabulary))
+        for grams in documents:
+            for index in {vocabulary[gram] for gram in grams}:
+                doc_freq[index] += 1
+        self.idf = np.log((1 + len(documents)) / (1 + doc_freq)) + 1.0
+
+        self.matrix = np.vstack([self._vectorize(grams) for grams in documents])
+        logger.info(f"Đã xây dựng chỉ mục kịch bản cục bộ: {self.matrix.shape[0]} câu, {len(vocabulary)} n-gram")
+
+    @classmethod
+    def from_env(cls, scenarios: Dict[str, str]) -> "ScenarioRouter":
+        """
+        Khởi tạo router, đọc câu ví dụ từ file JSON nếu có cấu hình ROUTER_EXAMPLES_FILE
+        """
+        examples = None
+        path = os.getenv("ROUTER_EXAMPLES_FILE")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                examples = json.load(f)
+            logger.info(f"Đã đọc câu ví dụ cho router từ: {path}")
+        return cls(scenarios, examples)
+
+    def _vectorize(self, grams: List[str]) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary))
+        for gram in grams:
+            index = self.vocabulary.get(gram)
+            if index is not None:
+                vector[index] += 1
+        vector = np.where(vector > 0, 1 + np.log(np.maximum(vector, 1)), 0) * self.idf
+        norm = math.sqrt(float(vector @ vector))
+        return vector / norm if norm else vector
+
+    def score(self, query: str) -> Dict[str, float]:
+        """
+        Điểm cosine cao nhất của câu hỏi với từng kịch bản (một phép nhân ma trận)
+        """
+        similarities = self.matrix @ self._vectorize(_char_ngrams(query, *self.ngram_range))
+        best = np.zeros(len(self.scenario_names))
+        np.maximum.at(best, self._label_index, similarities)
+        return {name: float(best[i]) for i, name in enumerate(self.scenario_names)}
+
+    def rank(self, query: str) -> List[Tuple[str, float]]:
+        """
+        Danh sách (kịch bản, điểm) sắp xếp giảm dần theo điểm
+        """
+        return sorted(self.score(query).items(), key=lambda item: item[1], reverse=True)
+
+    def decide(self, query: str, min_score: float, min_margin: float) -> RouteDecision:
+        """
+        Xếp hạng câu hỏi và áp ngưỡng điểm min_score, ngưỡng chênh lệch min_margin
+        """
+        ranked = self.rank(query)
+        top_name, top_score = ranked[0]
+        margin = top_score - (ranked[1][1] if len(ranked) > 1 else 0.0)
+        confident = top_score >= min_score and margin >= min_margin
+        candidates = []
+        if top_score >= min_score and not confident:
+            candidates = [name for name, score in ranked if top_score - score < min_margin]
+        return RouteDecision(top_name, top_score, margin, confident, candidates)
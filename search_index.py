@@ -0,0 +1,188 @@
+import math
+import logging
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Set, Tuple, Hashable
+
+from text_utils import tokenize
+
+logger = logging.getLogger('chatbot')
+
+# Trọng số của từng trường khi tính tần suất từ (BM25F đơn giản)
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "description": 1.0,
+    "specification": 0.5,
+}
+
+# Các trường dùng để chọn kết quả, giống Database.search_products: mọi từ khóa nằm trong tên,
+# nếu không có thì ít nhất một từ khóa nằm trong tên hoặc mô tả
+MATCH_FIELDS = ("name", "description")
+
+
+class SearchIndex:
+    """
+    Chỉ mục đảo ngược trên tên, mô tả và thông số sản phẩm, xếp hạng bằng BM25.
+    Từ khóa khớp cả một phần của từ như name LIKE '%từ khóa%' của truy vấn SQL
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Any, float]] = {}
+        self._field_postings: Dict[str, Dict[str, Set[Any]]] = {field: {} for field in MATCH_FIELDS}
+        self._doc_field_terms: Dict[Any, Dict[str, Set[str]]] = {}
+        self._doc_terms: Dict[Any, Dict[str, float]] = {}
+        self._doc_len: Dict[Any, float] = {}
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._signatures: Dict[Any, Hashable] = {}
+        self._total_len = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @staticmethod
+    def _signature(product: Dict[str, Any]) -> Hashable:
+        if product.get('updated_at') is not None:
+            return product['updated_at']
+        return repr(sorted(product.items(), key=lambda item: item[0]))
+
+    def add(self, product: Dict[str, Any]) -> None:
+        """
+        Thêm hoặc cập nhật một sản phẩm trong chỉ mục
+        """
+        with self._lock:
+            doc_id = product['id']
+            if doc_id in self._docs:
+                self.remove(doc_id)
+
+            terms: Dict[str, float] = {}
+            for field, weight in FIELD_WEIGHTS.items():
+                for term, count in Counter(tokenize(product.get(field))).items():
+                    terms[term] = terms.get(term, 0.0) + weight * count
+
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            field_terms = {field: set(tokenize(product.get(field))) for field in MATCH_FIELDS}
+            for field, field_set in field_terms.items():
+                for term in field_set:
+                    self._field_postings[field].setdefault(term, set()).add(doc_id)
+            self._doc_field_terms[doc_id] = field_terms
+            length = sum(terms.values())
+            self._doc_terms[doc_id] = terms
+            self._doc_len[doc_id] = length
+            self._total_len += length
+            self._docs[doc_id] = product
+            self._signatures[doc_id] = self._signature(product)
+
+    def remove(self, doc_id: Any) -> None:
+        """
+        Xóa một sản phẩm khỏi chỉ mục
+        """
+        with self._lock:
+            terms = self._doc_terms.pop(doc_id, None)
+            if terms is None:
+                return
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self._postings[term]
+            for field, field_set in self._doc_field_terms.pop(doc_id).items():
+                postings = self._field_postings[field]
+                for term in field_set:
+                    docs = postings.get(term)
+                    if docs is not None:
+                        docs.discard(doc_id)
+                        if not docs:
+                            del postings[term]
+            self._total_len -= self._doc_len.pop(doc_id)
+            del self._docs[doc_id]
+            del self._signatures[doc_id]
+
+    def sync(self, products: List[Dict[str, Any]]) -> Tuple[int, int, int]:
+        """
+        Đồng bộ chỉ mục với danh mục mới, chỉ đánh chỉ mục lại các sản phẩm thay đổi.
+        Trả về số sản phẩm (thêm, cập nhật, xóa)
+        """
+        with self._lock:
+            added = updated = 0
+            seen = set()
+            for product in products:
+                doc_id = product['id']
+                seen.add(doc_id)
+                if doc_id not in self._docs:
+                    self.add(product)
+                    added += 1
+                elif self._signatures[doc_id] != self._signature(product):
+                    self.add(product)
+                    updated += 1
+                else:
+                    # Giữ bản ghi mới nhất để kết quả trả về đúng dữ liệu hiện tại
+                    self._docs[doc_id] = product
+
+            removed_ids = [doc_id for doc_id in self._docs if doc_id not in seen]
+            for doc_id in removed_ids:
+                self.remove(doc_id)
+
+        logger.info(f"Đồng bộ chỉ mục tìm kiếm: thêm {added}, cập nhật {updated}, xóa {len(removed_ids)}")
+        return added, updated, len(removed_ids)
+
+    def _score(self, terms: List[str], doc_ids) -> List[Tuple[float, Any]]:
+        n_docs = len(self._docs)
+        avg_len = self._total_len / n_docs if n_docs else 0.0
+        idf = {}
+        for term in terms:
+            df = len(self._postings.get(term, ()))
+            idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+        scored = []
+        for doc_id in doc_ids:
+            norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len) if avg_len else self.k1
+            score = 0.0
+            for term in terms:
+                tf = self._postings.get(term, {}).get(doc_id)
+                if tf:
+                    score += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scored.append((score, doc_id))
+        return scored
+
+    def _matching_terms(self, field: str, keyword: str) -> List[str]:
+        """
+        Các từ của trường field có chứa keyword
+        """
+        return [term for term in self._field_postings[field] if keyword in term]
+
+    def _matching_docs(self, field: str, terms: List[str]) -> Set[Any]:
+        postings = self._field_postings[field]
+        docs: Set[Any] = set()
+        for term in terms:
+            docs.update(postings.get(term, ()))
+        return docs
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Tìm sản phẩm có tên chứa tất cả từ khóa; nếu không có, nới lỏng thành tên hoặc mô tả chứa
+        ít nhất một từ khóa (cùng tập kết quả với Database.search_products).
+        Kết quả sắp xếp theo điểm BM25 giảm dần
+        """
+        keywords = list(dict.fromkeys(tokenize(query)))
+        if not keywords:
+            return []
+
+        with self._lock:
+            matched = {field: [self._matching_terms(field, keyword) for keyword in keywords]
+                       for field in MATCH_FIELDS}
+            name_docs = [self._matching_docs("name", terms) for terms in matched["name"]]
+            candidates = set.intersection(*name_docs)
+            if not candidates:
+                candidates = set().union(*name_docs, *(self._matching_docs("description", terms)
+                                                       for terms in matched["description"]))
+
+            terms = list(dict.fromkeys(term for field in MATCH_FIELDS for field_terms in matched[field]
+                                       for term in field_terms))
+            scored = self._score(terms, candidates)
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            return [self._docs[doc_id] for _, doc_id in scored]
@@ -0,0 +1,110 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('chatbot')
+
+
+class ChatSessionEntry:
+    """
+    Một phiên chat Gemini của client cùng khóa để các tin nhắn trong phiên chạy tuần tự
+    """
+
+    def __init__(self, chat: Any):
+        self.chat = chat
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.turns = 0
+
+
+class SessionStore:
+    """
+    Kho phiên chat có giới hạn số lượng, tự loại bỏ phiên lâu không dùng (LRU + idle timeout)
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 1800.0, max_turns: int = 10):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # Số lượt hỏi-đáp tối đa giữ lại trong lịch sử để số token gửi đi không tăng mãi
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, ChatSessionEntry]" = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_or_create(self, session_id: str, factory: Callable[[], Any]) -> ChatSessionEntry:
+        self.evict_idle()
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = ChatSessionEntry(factory())
+            self._sessions[session_id] = entry
+            self.created += 1
+            while len(self._sessions) > self.max_sessions:
+                oldest_id, _ = self._sessions.popitem(last=False)
+                self.evicted += 1
+                logger.info(f"Loại bỏ phiên chat cũ nhất: {oldest_id}")
+        else:
+            self._sessions.move_to_end(session_id)
+        entry.last_used = time.monotonic()
+        return entry
+
+    def trim_history(self, entry: ChatSessionEntry) -> None:
+        """
+        Chỉ giữ lại max_turns lượt gần nhất (mỗi lượt gồm tin nhắn người dùng và câu trả lời)
+        """
+        history = entry.chat.history
+        if len(history) > 2 * self.max_turns:
+            entry.chat.history = history[-2 * self.max_turns:]
+
+    def evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if entry.last_used > deadline:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    def remove(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'active': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'idle_ttl': self.idle_ttl,
+            'max_turns': self.max_turns,
+            'created': self.created,
+            'evicted': self.evicted,
+        }
+
+
+class AIUsageStats:
+    """
+    Thống kê số token prompt và độ trễ của các lượt gọi AI, tách theo có/không dùng phiên chat
+    """
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, float]] = {}
+
+    def record(self, kind: str, latency: float, prompt_tokens: Optional[int]) -> None:
+        data = self._data.setdefault(kind, {'turns': 0, 'latency': 0.0, 'prompt_tokens': 0, 'measured': 0})
+        data['turns'] += 1
+        data['latency'] += latency
+        if prompt_tokens is not None:
+            data['prompt_tokens'] += prompt_tokens
+            data['measured'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            kind: {
+                'turns': int(data['turns']),
+                'avg_latency_ms': round(1000 * data['latency'] / data['turns'], 1),
+                'avg_prompt_tokens': round(data['prompt_tokens'] / data['measured'], 1) if data['measured'] else None,
+            }
+            for kind, data in self._data.items()
+        }
@@ -0,0 +1,152 @@
+import os
+import time
+import pickle
+import stat
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger('chatbot')
+
+
+def _digest(namespace: str, key: Hashable) -> str:
+    return hashlib.sha1(f"{namespace}:{key!r}".encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    Kho dùng chung trong một tiến trình: thay thế cục bộ cho FileCacheBackend (chạy một worker, benchmark)
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Tuple[bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get((namespace, _digest(namespace, key)))
+        if entry is None or entry[1] <= time.time():
+            return default
+        return pickle.loads(entry[0])
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[(namespace, _digest(namespace, key))] = (data, time.time() + ttl)
+
+    def clear(self, namespace: str) -> None:
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[entry_key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'memory', 'entries': len(self._entries)}
+
+
+class FileCacheBackend:
+    """
+    Kho dùng chung giữa các worker trên cùng máy: mỗi giá trị là một file (pickle) trong thư mục,
+    đặt trên /dev/shm thì thực chất là bộ nhớ chia sẻ. Ghi qua file tạm rồi os.replace nên
+    worker khác không bao giờ đọc phải file ghi dở.
+    Giá trị được đọc bằng pickle nên thư mục phải thuộc về người dùng đang chạy và chỉ người đó được
+    truy cập (0700, không phải symlink); ngược lại ném PermissionError
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+
+    def _check_directory(self) -> None:
+        """
+        Từ chối thư mục do người khác tạo sẵn hoặc người khác ghi được: họ có thể đặt file pickle
+        tùy ý vào đó và chạy code trong tiến trình này khi cache được đọc
+        """
+        info = os.lstat(self.directory)
+        if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+            raise PermissionError(f"Thư mục cache dùng chung {self.directory} là symlink hoặc không phải thư mục")
+        if hasattr(os, "getuid") and info.st_uid != os.getuid():
+            raise PermissionError(f"Thư mục cache dùng chung {self.directory} thuộc về người dùng khác "
+                                  f"(uid {info.st_uid})")
+        if stat.S_IMODE(info.st_mode) != 0o700:
+            raise PermissionError(f"Thư mục cache dùng chung {self.directory} có quyền "
+                                  f"{stat.S_IMODE(info.st_mode):o}, cần 700")
+
+    def _path(self, namespace: str, key: Hashable) -> str:
+        return os.path.join(self.directory, namespace, _digest(namespace, key))
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        try:
+            with open(self._path(namespace, key), "rb") as f:
+                expires_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc cache dùng chung {namespace}: {str(e)}")
+            return default
+        if expires_at <= time.time():
+            return default
+        return value
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+        path = self._path(namespace, key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((time.time() + ttl, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logger.error(f"Lỗi khi ghi cache dùng chung {namespace}: {str(e)}")
+
+    def clear(self, namespace: str) -> None:
+        directory = os.path.join(self.directory, namespace)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(".tmp-"):
+                continue
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        entries = 0
+        for _, _, files in os.walk(self.directory):
+            entries += sum(1 for name in files if not name.startswith(".tmp-"))
+        return {'backend': 'file', 'directory': self.directory, 'entries': entries}
+
+
+def backend_from_env() -> Optional[Any]:
+    """
+    Tạo kho dùng chung theo SHARED_CACHE: "file" (thư mục SHARED_CACHE_DIR, mặc định là thư mục riêng
+    của người dùng đang chạy trên /dev/shm), "memory", hoặc rỗng để tắt.
+    Thư mục không an toàn (xem FileCacheBackend) thì tắt cache dùng chung
+    """
+    kind = os.getenv("SHARED_CACHE", "").strip().lower()
+    if not kind:
+        return None
+    if kind == "memory":
+        return MemoryCacheBackend()
+    if kind == "file":
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+        directory = os.getenv("SHARED_CACHE_DIR") or os.path.join(base, f"chatbot-cache-{user}")
+        try:
+            backend = FileCacheBackend(directory)
+        except PermissionError as e:
+            logger.error(f"Không dùng cache dùng chung: {str(e)}")
+            return None
+        logger.info(f"Dùng cache dùng chung trong thư mục {directory}")
+        return backend
+    raise ValueError(f"SHARED_CACHE không hợp lệ: {kind}")
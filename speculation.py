@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import registry
+
+logger = logging.getLogger('chatbot')
+
+registry.describe("chatbot_speculative_tasks_total",
+                  "Số việc chạy trước trong lúc xác định kịch bản, theo kết quả (used, unused, cancelled, failed)")
+
+
+class Speculation:
+    """
+    Các việc rẻ, nhiều khả năng sẽ cần (tra từ điển thương hiệu, khớp tên sản phẩm, lấy trước trang đầu
+    của danh sách) được chạy song song với bước xác định kịch bản bằng Gemini. Khi đã biết kịch bản,
+    việc cần dùng được lấy kết quả bằng take(), các việc còn lại bị hủy bằng cancel_rest().
+    Việc đang chạy trên thread pool của database không dừng được giữa chừng, chỉ bị bỏ kết quả
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def start(self, name: str, coro: Awaitable[Any]) -> None:
+        self._tasks[name] = asyncio.ensure_future(coro)
+
+    async def take(self, name: str, factory: Optional[Callable[[], Awaitable[Any]]] = None) -> Any:
+        """
+        Kết quả của việc name (chờ nếu chưa xong). Không có việc đó hoặc việc bị lỗi thì
+        chạy factory() nếu có, ngược lại trả về None
+        """
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            try:
+                result = await task
+                registry.inc("chatbot_speculative_tasks_total", task=name, outcome="used")
+                return result
+            except Exception as e:
+                registry.inc("chatbot_speculative_tasks_total", task=name, outcome="failed")
+                logger.error(f"Lỗi khi chạy trước việc {name}: {str(e)}")
+        return await factory() if factory is not None else None
+
+    def cancel_rest(self) -> None:
+        """
+        Hủy các việc chưa được dùng đến
+        """
+        for name, task in self._tasks.items():
+            if task.done():
+                # Lấy lỗi (nếu có) để asyncio không cảnh báo "exception was never retrieved"
+                if not task.cancelled():
+                    task.exception()
+                outcome = "unused"
+            else:
+                task.cancel()
+                outcome = "cancelled"
+            registry.inc("chatbot_speculative_tasks_total", task=name, outcome=outcome)
+        self._tasks.clear()
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeGenerativeModel, SQLiteDatabase
+from benchmarks.synthetic import generate_catalog
+from chatbot import AIResponseError, ChatBot
+from llm_client import LLMRateLimitedError
+
+QUERIES = ["giày nike", "xin chào", "giày dưới 1 triệu"]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def bot():
+    db = SQLiteDatabase(generate_catalog(200))
+    chatbot = ChatBot(db, use_query_cache=False)
+    chatbot._model = chatbot._chat_model = FakeGenerativeModel(latency=0, jitter=0)
+    yield chatbot
+    db.close()
+
+
+def fail_for(bot, method, query, error):
+    original = getattr(bot, method)
+
+    async def patched(user_query, *args, **kwargs):
+        if query in user_query.lower():
+            raise error
+        return await original(user_query, *args, **kwargs)
+
+    setattr(bot, method, patched)
+
+
+def test_process_queries_keeps_input_order(bot):
+    results = run(bot.process_queries(QUERIES + ["Giày  NIKE"]))
+    assert len(results) == 4
+    assert results[0] == results[3]
+    assert results[1]['scenario'] is None
+
+
+@pytest.mark.parametrize("method", ["_plan_query", "_answer_plan"])
+def test_process_queries_raises_overload(bot, method):
+    fail_for(bot, method, "xin chào", LLMRateLimitedError("quá tải", retry_after=3))
+    with pytest.raises(LLMRateLimitedError):
+        run(bot.process_queries(QUERIES))
+
+
+def test_process_queries_reports_expected_errors_per_item(bot):
+    fail_for(bot, "_answer_plan", "xin chào", AIResponseError("lỗi"))
+    results = run(bot.process_queries(QUERIES))
+    assert results[1]['response'] == bot._error_message(AIResponseError("lỗi"))
+    assert results[0]['products']
+
+
+def test_process_queries_does_not_hide_bugs(bot):
+    fail_for(bot, "_answer_plan", "xin chào", KeyError("bug"))
+    with pytest.raises(KeyError):
+        run(bot.process_queries(QUERIES))
+
+
+@pytest.mark.parametrize("query", ["giày nike", "xin chào"])
+def test_router_ranks_each_query_once(bot, query):
+    bot.speculative = True
+    calls = []
+    rank = bot.router.rank
+
+    def counting_rank(user_query):
+        calls.append(user_query)
+        return rank(user_query)
+
+    bot.router.rank = counting_rank
+    run(bot.handle_query(query))
+    assert len(calls) == 1
+
+
+def test_route_decision_thresholds(bot):
+    confident = bot.router.decide("giày nike", bot.router_min_score, bot.router_min_margin)
+    assert (confident.scenario, confident.confident, confident.candidates) == ("brand_filter", True, [])
+    # Điểm đủ nhưng chênh lệch chưa đủ: các kịch bản sát điểm được đưa đi phân xử
+    close = bot.router.decide("giày nike", bot.router_min_score, min_margin=2.0)
+    assert not close.confident
+    assert close.candidates[0] == "brand_filter" and len(close.candidates) == len(bot.scenarios)
+    low = bot.router.decide("xin chào", min_score=0.99, min_margin=0.0)
+    assert (low.confident, low.candidates) == (False, [])
+
+
+def test_unparsable_single_call_reply_falls_back_and_is_not_cached():
+    db = SQLiteDatabase(generate_catalog(50))
+    bot = ChatBot(db, classifier_mode="single_call", use_local_router=False, use_query_cache=True)
+    prompts = []
+
+    async def generate(prompt):
+        prompts.append(prompt)
+        if "Chỉ trả về một đối tượng JSON" in prompt:
+            return "Xin lỗi, tôi không hiểu câu hỏi"
+        return "0.9" if 'Câu 2: "sản phẩm  X"' in prompt else "0.1"
+
+    bot._generate_text_async = generate
+    try:
+        scenario, score, slots = run(bot.detect_scenario("giày đẹp"))
+        assert (scenario, score, slots) == ("search_products", 0.9, {})
+        # Một lần gọi phân loại rồi chấm điểm từng kịch bản
+        assert len(prompts) == 1 + len(bot.scenarios)
+
+        run(bot._plan_query("giày đẹp", "giày đẹp"))
+        assert len(bot.scenario_cache) == 0
+    finally:
+        db.close()
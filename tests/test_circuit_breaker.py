@@ -0,0 +1,107 @@
+import pytest
+
+from circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=3, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.opens == 1
+    assert not breaker.available()
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=3, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_retry_after_counts_down(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30)
+    assert breaker.retry_after() == 0.0
+    open_breaker(breaker)
+    clock.now += 10
+    assert breaker.retry_after() == pytest.approx(20)
+    clock.now += 25
+    assert breaker.retry_after() == 0.0
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == STATE_HALF_OPEN
+    # Lượt gọi thử đang chạy: các lượt khác bị từ chối
+    assert not breaker.available()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.opened_at is None
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=5, recovery_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    # Lượt gọi thử thất bại: mở lại và tính lại thời gian chờ từ đầu
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert breaker.opens == 2
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_abandoned_probe_is_retried_after_timeout(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30)
+    open_breaker(breaker)
+    clock.now += 30
+    assert breaker.allow()
+    # Lượt gọi thử bị hủy, không báo kết quả
+    clock.now += 30
+    assert breaker.available()
+    assert breaker.allow()
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("CIRCUIT_FAILURE_THRESHOLD", "7")
+    monkeypatch.setenv("CIRCUIT_RECOVERY_TIMEOUT", "12.5")
+    breaker = CircuitBreaker.from_env("gemini")
+    assert (breaker.failure_threshold, breaker.recovery_timeout) == (7, 12.5)
+
+
+def test_stats(clock):
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=30)
+    open_breaker(breaker)
+    clock.now += 5
+    breaker.allow()
+    stats = breaker.stats()
+    assert stats['state'] == STATE_OPEN
+    assert stats['open_for'] == 5
+    assert (stats['failures'], stats['rejected'], stats['opens']) == (1, 1, 1)
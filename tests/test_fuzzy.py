@@ -0,0 +1,80 @@
+import pytest
+
+from fuzzy import ProductNameMatcher, levenshtein
+from text_utils import strip_product_query
+
+PRODUCTS = [
+    {'id': 1, 'name': "Nike Air Force 1"},
+    {'id': 2, 'name': "Nike Air Max 90"},
+    {'id': 3, 'name': "Adidas Ultraboost 22"},
+    {'id': 4, 'name': "Converse Chuck Taylor All Star"},
+    {'id': 5, 'name': "Giày Thượng Đình"},
+    {'id': 6, 'name': ""},
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return ProductNameMatcher(PRODUCTS)
+
+
+def best(matcher, query):
+    matches = matcher.match(query, limit=1)
+    return matches[0][1]['id'] if matches else None
+
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("", "", 0),
+    ("nike", "nike", 0),
+    ("nike", "nkie", 2),
+    ("adidas", "addidas", 1),
+    ("", "abc", 3),
+])
+def test_levenshtein(a, b, distance):
+    assert levenshtein(a, b) == distance
+    assert levenshtein(b, a) == distance
+
+
+@pytest.mark.parametrize("query, keep_diacritics, expected", [
+    ("Cho tôi xem thông tin giày Nike Air Force 1", False, "nike air force 1"),
+    ("chi tiết về sản phẩm Giày Thượng Đình", False, "thuong dinh"),
+    ("chi tiết về sản phẩm Giày Thượng Đình", True, "thượng đình"),
+    ("cho toi xem giay nike", False, "nike"),
+])
+def test_strip_product_query(query, keep_diacritics, expected):
+    assert strip_product_query(query, keep_diacritics=keep_diacritics) == expected
+
+
+def test_products_without_name_are_skipped(matcher):
+    assert len(matcher) == 5
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("nike air force 1", 1),
+    ("thông tin giày nike air force 1", 1),
+    ("nike air max 90", 2),
+    ("addidas ultrabost", 3),
+    ("converse chuck tayler", 4),
+    ("thuong dinh", 5),
+])
+def test_match_tolerates_typos_and_missing_diacritics(matcher, query, expected):
+    assert best(matcher, query) == expected
+
+
+def test_match_scores_are_sorted_and_bounded(matcher):
+    matches = matcher.match("nike air", limit=5)
+    scores = [score for score, _ in matches]
+    assert scores == sorted(scores, reverse=True)
+    assert all(0 <= score <= 1 for score in scores)
+    assert {p['id'] for _, p in matches[:2]} == {1, 2}
+
+
+def test_exact_name_scores_one(matcher):
+    score, product = matcher.match("Nike Air Max 90", limit=1)[0]
+    assert product['id'] == 2
+    assert score == 1.0
+
+
+def test_match_without_product_words_returns_nothing(matcher):
+    assert matcher.match("cho tôi xem giày") == []
+    assert matcher.match("") == []
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from llm_client import GeminiClient, LLMOverloadedError, LLMTimeoutError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_client(**kwargs):
+    kwargs.setdefault("rate", 0)
+    kwargs.setdefault("retry_base_delay", 0)
+    return GeminiClient(**kwargs)
+
+
+def test_identical_keys_are_coalesced():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        client = make_client()
+        results = await asyncio.gather(*(client.call(factory, key="p") for _ in range(3)))
+        return client, results
+
+    client, results = run(main())
+    assert results == ["value"] * 3
+    assert len(calls) == 1
+    assert client.coalesced == 2
+    assert not client._inflight
+
+
+def test_cancelled_owner_does_not_cancel_waiters():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        client = make_client()
+        owner = asyncio.ensure_future(client.call(factory, key="p"))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(client.call(factory, key="p"))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return client, await waiter
+
+    client, result = run(main())
+    # Lượt chờ tự gọi lại thay vì nhận CancelledError của lượt dẫn đầu
+    assert result == "value"
+    assert len(calls) == 2
+    assert not client._inflight
+
+
+def test_owner_errors_are_shared_with_waiters():
+    async def factory():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        client = make_client()
+        return await asyncio.gather(client.call(factory, key="p"), client.call(factory, key="p"),
+                                    return_exceptions=True)
+
+    results = run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_full_queue_is_rejected_as_overload():
+    async def factory():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        client = make_client(max_concurrency=1, max_queue=0)
+        return await asyncio.gather(client.call(factory), client.call(factory), return_exceptions=True)
+
+    first, second = run(main())
+    assert first == "value"
+    assert isinstance(second, LLMOverloadedError)
+
+
+@pytest.mark.parametrize("timeout, deadline", [(0.01, 1.0), (1.0, 0.01)])
+def test_timeouts_raise_llm_timeout_error(timeout, deadline):
+    async def factory():
+        await asyncio.sleep(0.2)
+
+    async def main():
+        client = make_client(timeout=timeout, max_retries=1)
+        with pytest.raises(LLMTimeoutError):
+            await client.call(factory, deadline=deadline)
+        return client
+
+    client = run(main())
+    assert client.failures == 1
@@ -0,0 +1,49 @@
+import base64
+import json
+
+import pytest
+
+from pagination import InvalidPageTokenError, decode_page_token, encode_page_token
+
+
+def raw_token(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("kind, value, offset", [
+    ("price", 1_000_000, 10),
+    ("brand", "nike", 0),
+    ("search", "giày chạy bộ", 20),
+    ("similar", "air force 1", 5),
+    ("price_range", (500_000, 1_000_000, False), 10),
+])
+def test_round_trip(kind, value, offset):
+    token = encode_page_token(kind, value, offset)
+    assert "=" not in token
+    assert decode_page_token(token) == (kind, value, offset)
+
+
+def test_list_values_become_hashable():
+    kind, value, offset = decode_page_token(encode_page_token("price_range", [None, 500_000, True], 0))
+    assert value == (None, 500_000, True)
+    hash(value)
+
+
+@pytest.mark.parametrize("token", [
+    "",
+    "khong-phai-base64!",
+    raw_token(["price", 1, 0]),
+    raw_token({"k": "price", "v": 1}),
+    raw_token({"k": "unknown", "v": 1, "o": 0}),
+    raw_token({"k": "brand", "v": "nike", "o": -1}),
+    raw_token({"k": "brand", "v": "", "o": 0}),
+    raw_token({"k": "brand", "v": None, "o": 0}),
+    raw_token({"k": "brand", "v": "nike", "o": "abc"}),
+])
+def test_invalid_tokens_are_rejected(token):
+    with pytest.raises(InvalidPageTokenError):
+        decode_page_token(token)
+
+
+def test_invalid_token_error_is_value_error():
+    assert issubclass(InvalidPageTokenError, ValueError)
@@ -0,0 +1,72 @@
+import pytest
+
+from price_rules import PriceRange, parse_amount, parse_price_query, describe_price_range
+
+
+@pytest.mark.parametrize("number, unit, tail, expected", [
+    ("500", "k", None, 500_000),
+    ("1", "trieu", None, 1_000_000),
+    ("1", "tr", "5", 1_500_000),
+    ("1", "trieu", "25", 1_250_000),
+    ("1.5", "trieu", None, 1_500_000),
+    ("2,5", "tr", None, 2_500_000),
+    ("2", "cu", None, 2_000_000),
+    ("500.000", None, None, 500_000),
+    ("1.200.000", None, None, 1_200_000),
+])
+def test_parse_amount(number, unit, tail, expected):
+    assert parse_amount(number, unit, tail) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    # Giá tối đa với các cách viết số tiền
+    ("giày dưới 500k", PriceRange(None, 500_000)),
+    ("giày dưới 1 triệu", PriceRange(None, 1_000_000)),
+    ("có giày nào rẻ hơn 800 nghìn không", PriceRange(None, 800_000)),
+    ("giày dưới 500", PriceRange(None, 500_000)),
+    ("giày dưới 1.5 triệu", PriceRange(None, 1_500_000)),
+    ("giày dưới 2 triệu vnd", PriceRange(None, 2_000_000)),
+    ("giày không quá 700k", PriceRange(None, 700_000, True)),
+    # Ký hiệu tiền viết liền sau số
+    ("giày dưới 500.000đ", PriceRange(None, 500_000)),
+    ("giày dưới 1.200.000đ", PriceRange(None, 1_200_000)),
+    ("giày dưới 500000đ", PriceRange(None, 500_000)),
+    ("giày dưới 500000 đồng", PriceRange(None, 500_000)),
+    # Giá tối thiểu
+    ("giày trên 2 củ", PriceRange(2_000_000, None)),
+    ("giày giá trên 1000000", PriceRange(1_000_000, None)),
+    # Khoảng giá
+    ("giày từ 1 đến 2 triệu", PriceRange(1_000_000, 2_000_000, True)),
+    ("giày từ 500k đến 1tr5", PriceRange(500_000, 1_500_000, True)),
+    ("giày từ 1.000.000đ đến 2.000.000đ", PriceRange(1_000_000, 2_000_000, True)),
+    # Khoảng quanh một mức giá
+    ("giày tầm 1 triệu", PriceRange(800_000, 1_200_000, True)),
+    ("giày tầm 1.500.000đ", PriceRange(1_200_000, 1_800_000, True)),
+    ("giá 1.200.000đ", PriceRange(960_000, 1_440_000, True)),
+    ("giày 1tr5", PriceRange(1_200_000, 1_800_000, True)),
+])
+def test_parse_price_query(query, expected):
+    assert parse_price_query(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "giày dưới 40 size",
+    "giày chạy bộ 5k",
+    "nike air force 1",
+    "tìm giày chạy bộ",
+    "giày size 42",
+    "thông tin sản phẩm puma suede 2",
+])
+def test_non_price_numbers_are_ignored(query):
+    assert parse_price_query(query) is None
+
+
+def test_size_does_not_hide_price():
+    assert parse_price_query("giày size 42 dưới 800k") == PriceRange(None, 800_000)
+
+
+def test_describe_price_range():
+    assert describe_price_range(PriceRange(None, 500_000)) == "dưới 500,000 VND"
+    assert describe_price_range(PriceRange(None, 500_000, True)) == "không quá 500,000 VND"
+    assert describe_price_range(PriceRange(1_000_000, None)) == "từ 1,000,000 VND trở lên"
+    assert describe_price_range(PriceRange(1, 2, True)) == "từ 1 đến 2 VND"
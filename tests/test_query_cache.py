@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+import query_cache
+from query_cache import QueryCache, normalize_query
+from shared_cache import MemoryCacheBackend
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_normalize_query():
+    assert normalize_query("  Giày   NIKE\tdưới 1 triệu ") == "giày nike dưới 1 triệu"
+    assert normalize_query("Giày Đỏ", fold=True) == "giay do"
+
+
+def test_get_set_and_lookup_stats():
+    cache = QueryCache("test", 1 << 20, ttl=60)
+    assert cache.lookup("a") is None
+    cache.set("a", {"response": "x"})
+    assert cache.lookup("a") == {"response": "x"}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = QueryCache("test", 1 << 20, ttl=10)
+    cache.set("a", "value")
+    clock.now += 9
+    assert cache.get("a") == "value"
+    clock.now += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.current_bytes == 0
+
+
+def test_evicts_least_recently_used_when_over_budget():
+    value_size = query_cache.estimate_size("x" * 100)
+    cache = QueryCache("test", value_size * 2, ttl=60)
+    cache.set("a", "x" * 100)
+    cache.set("b", "y" * 100)
+    cache.get("a")
+    cache.set("c", "z" * 100)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+    assert cache.current_bytes <= cache.max_bytes
+
+
+def test_values_larger_than_budget_are_not_stored():
+    cache = QueryCache("test", 10, ttl=60)
+    cache.set("a", "x" * 100)
+    assert len(cache) == 0
+
+
+def test_get_or_compute_coalesces_concurrent_calls():
+    cache = QueryCache("test", 1 << 20, ttl=60)
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("k", factory) for _ in range(5)))
+
+    assert run(main()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.coalesced == 4
+    assert cache.get("k") == "value"
+
+
+def test_get_or_compute_respects_should_cache():
+    cache = QueryCache("test", 1 << 20, ttl=60)
+
+    async def factory():
+        return ""
+
+    assert run(cache.get_or_compute("k", factory, should_cache=bool)) == ""
+    assert len(cache) == 0
+
+
+def test_get_or_compute_does_not_cache_errors():
+    cache = QueryCache("test", 1 << 20, ttl=60)
+
+    async def failing():
+        raise RuntimeError("boom")
+
+    async def main():
+        results = await asyncio.gather(cache.get_or_compute("k", failing), cache.get_or_compute("k", failing),
+                                       return_exceptions=True)
+        return results
+
+    results = run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(cache) == 0
+    assert not cache._inflight
+
+
+def test_shared_backend_fills_local_misses():
+    shared = MemoryCacheBackend()
+    writer = QueryCache("response", 1 << 20, ttl=60, shared=shared)
+    reader = QueryCache("response", 1 << 20, ttl=60, shared=shared)
+    writer.set(("giày nike", 10, True), {"response": "x"})
+    assert reader.get(("giày nike", 10, True)) == {"response": "x"}
+    assert reader.shared_hits == 1
+    assert len(reader) == 1
+
+
+def test_clear_can_keep_shared_backend():
+    shared = MemoryCacheBackend()
+    cache = QueryCache("response", 1 << 20, ttl=60, shared=shared)
+    cache.set("a", 1)
+    cache.clear(include_shared=False)
+    assert len(cache) == 0
+    assert cache.get("a") == 1
+    cache.clear()
+    assert cache.get("a") is None
@@ -0,0 +1,111 @@
+import pytest
+
+from benchmarks.fakes import SQLiteDatabase
+from benchmarks.synthetic import generate_catalog
+from search_index import SearchIndex
+
+
+def product(product_id, name, description="", specification="", **extra):
+    return dict(id=product_id, name=name, description=description, specification=specification, **extra)
+
+
+CATALOG = [
+    product(1, "Nike Air Zoom Pegasus", "Giày chạy bộ êm chân"),
+    product(2, "Adidas Ultraboost", "Giày chạy bộ đệm boost", "đế cao su"),
+    product(3, "Converse Chuck Taylor", "Giày vải cổ cao"),
+    product(4, "Vans Old Skool", "Giày trượt ván", "chạy tốt trên ván"),
+]
+
+
+def make_index(products=CATALOG):
+    index = SearchIndex()
+    index.sync(products)
+    return index
+
+
+def ids(results):
+    return [p['id'] for p in results]
+
+
+def test_search_requires_all_terms_in_name():
+    assert ids(make_index().search("nike pegasus")) == [1]
+
+
+def test_search_matches_part_of_a_word():
+    # Giống name LIKE '%từ khóa%'
+    assert ids(make_index().search("ultra")) == [2]
+    assert ids(make_index([product(1, "Vans Sk8-Hi")]).search("sk8")) == [1]
+
+
+def test_search_falls_back_to_name_or_description():
+    # Không tên nào có "giày": nới lỏng thành tên hoặc mô tả chứa ít nhất một từ khóa
+    results = ids(make_index().search("giày chạy bộ"))
+    assert sorted(results) == [1, 2, 3, 4]
+    assert sorted(results[:2]) == [1, 2]
+
+
+def test_search_ignores_diacritics_and_case():
+    index = make_index()
+    assert ids(index.search("GIAY CHAY BO")) == ids(index.search("giày chạy bộ"))
+
+
+def test_name_matches_rank_above_description_matches():
+    index = make_index([
+        product(1, "Giày đa năng", "phù hợp chạy bộ"),
+        product(2, "Giày chạy bộ", "đa năng"),
+    ])
+    assert ids(index.search("tìm chạy bộ")) == [2, 1]
+
+
+def test_search_falls_back_to_any_term():
+    # Không sản phẩm nào có cả hai từ: trả về các sản phẩm có ít nhất một từ
+    assert sorted(ids(make_index().search("converse ultraboost"))) == [2, 3]
+
+
+@pytest.mark.parametrize("query", ["tìm giày chạy bộ", "giày nike", "air force", "nike air max", "ultra", "xyz"])
+def test_search_returns_same_products_as_sql(query):
+    products = generate_catalog(300)
+    db = SQLiteDatabase(products)
+    try:
+        index = make_index(products)
+        assert set(ids(index.search(query))) == set(ids(db.search_products(query)))
+    finally:
+        db.close()
+
+
+def test_search_without_terms_returns_nothing():
+    index = make_index()
+    assert index.search("") == []
+    assert index.search("!!!") == []
+    assert index.search("khongtontai") == []
+
+
+def test_sync_reports_added_updated_removed():
+    index = SearchIndex()
+    assert index.sync(CATALOG) == (4, 0, 0)
+    assert index.sync(CATALOG) == (0, 0, 0)
+
+    renamed = [product(1, "Nike Vaporfly", "Giày đua")] + CATALOG[1:3]
+    assert index.sync(renamed) == (0, 1, 1)
+    assert len(index) == 3
+    assert ids(index.search("vaporfly")) == [1]
+    assert index.search("pegasus") == []
+    assert index.search("skool") == []
+
+
+def test_sync_uses_updated_at_as_signature():
+    index = SearchIndex()
+    index.sync([product(1, "Nike Pegasus", updated_at="2024-01-01")])
+    # Cùng updated_at thì không đánh chỉ mục lại, nhưng vẫn trả về bản ghi mới nhất
+    assert index.sync([product(1, "Nike Pegasus", price=100, updated_at="2024-01-01")]) == (0, 0, 0)
+    assert index.search("pegasus")[0]['price'] == 100
+    assert index.sync([product(1, "Nike Pegasus", updated_at="2024-02-01")]) == (0, 1, 0)
+
+
+def test_remove_cleans_postings():
+    index = make_index()
+    index.remove(3)
+    index.remove(3)
+    assert len(index) == 3
+    assert index.search("converse") == []
+    assert "converse" not in index._postings
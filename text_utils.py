@@ -0,0 +1,52 @@
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Các từ không thuộc tên sản phẩm, bỏ khỏi câu hỏi trước khi tra tên sản phẩm (chatbot, fuzzy, local_classifier)
+PRODUCT_QUERY_STOPWORDS = [
+    "thông tin", "chi tiết", "sản phẩm", "thể thao", "cho tôi", "cho mình", "cho em",
+    "về", "có", "tên", "là", "cho", "tôi", "mình", "xem", "giày", "dép", "của", "mẫu", "nào", "gì",
+]
+
+
+def fold_diacritics(text: str) -> str:
+    """
+    Chuyển về chữ thường và bỏ dấu tiếng Việt (kể cả đ -> d)
+    """
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+# So khớp trên câu hỏi đã bỏ dấu, cụm dài trước để "cho tôi" không bị tách thành "cho" và "tôi"
+_STOPWORD_PATTERN = re.compile(
+    r"\b(?:" + "|".join(sorted({re.escape(fold_diacritics(word)) for word in PRODUCT_QUERY_STOPWORDS},
+                               key=len, reverse=True)) + r")\b"
+)
+
+
+def strip_product_query(query: str, keep_diacritics: bool = False) -> str:
+    """
+    Loại các từ trong PRODUCT_QUERY_STOPWORDS khỏi câu hỏi (không phân biệt dấu), trả về chữ thường đã gộp
+    khoảng trắng. Mặc định kết quả cũng được bỏ dấu; keep_diacritics giữ nguyên dấu của các từ còn lại
+    """
+    text = unicodedata.normalize("NFC", query.lower())
+    # Bỏ dấu từng ký tự để vị trí trong hai chuỗi trùng nhau
+    folded = "".join(fold_diacritics(ch)[:1] or ch for ch in text)
+    source = text if keep_diacritics else folded
+    parts = []
+    last = 0
+    for match in _STOPWORD_PATTERN.finditer(folded):
+        parts.append(source[last:match.start()])
+        last = match.end()
+    parts.append(source[last:])
+    return " ".join(" ".join(parts).split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tách văn bản đã bỏ dấu thành các từ gồm chữ cái và chữ số
+    """
+    return _TOKEN_PATTERN.findall(fold_diacritics(text or ""))